@@ -0,0 +1,156 @@
+#! python3
+"""
+Benchmark StfClient against local fake STF server.
+
+Example: python benchmarks/benchmark.py --devices 5000 --clients 16 --latency 0.005
+"""
+import argparse
+import json
+import logging
+import statistics
+import threading
+import time
+
+from stf_appium_client.StfClient import StfClient
+from stf_appium_client.FakeStfServer import FakeStfServer
+from stf_appium_client.WaitStrategy import Backoff, DeviceNotifier
+
+
+def percentile(values: list, pct: float) -> float:
+    """ Nearest rank percentile """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_clients(server: FakeStfServer, clients: int, work, notifier: DeviceNotifier = None) -> dict:
+    """
+    Run work(client, latencies) concurrently, each thread with own StfClient and token
+    :return: result dictionary
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stf_clients = []
+    for index in range(clients):
+        client = StfClient(server.url, notifier=notifier)
+        client.connect(token=f'bench{index}')
+        stf_clients.append(client)
+
+    def worker(client):
+        own = []
+        try:
+            work(client, own)
+        except Exception as error:  # pylint: disable=broad-except
+            with lock:
+                errors.append(str(error))
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in stf_clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return dict(operations=len(latencies),
+                errors=len(errors),
+                elapsed=elapsed,
+                ops_per_second=len(latencies) / elapsed if elapsed else 0.0,
+                p50_ms=percentile(latencies, 50) * 1000,
+                p95_ms=percentile(latencies, 95) * 1000,
+                mean_ms=(statistics.mean(latencies) if latencies else 0.0) * 1000)
+
+
+def measure(latencies: list, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    latencies.append(time.perf_counter() - start)
+    return result
+
+
+def bench_list(server, args) -> dict:
+    requirements = json.loads(args.requirements)
+
+    def work(client, latencies):
+        for _ in range(args.iterations):
+            measure(latencies, client.list_devices, requirements)
+    return run_clients(server, args.clients, work)
+
+
+def bench_allocate(server, args) -> dict:
+    requirements = json.loads(args.requirements)
+
+    def work(client, latencies):
+        for _ in range(args.iterations):
+            device = measure(latencies, client.find_and_allocate, requirements, concurrency=args.concurrency)
+            client.release(device)
+    return run_clients(server, args.clients, work)
+
+
+def bench_wait(server, args) -> dict:
+    """ More clients than free devices, every client holds device for `hold` seconds """
+    requirements = json.loads(args.requirements)
+    free = max(1, args.clients // 2)
+    for index, device in enumerate(server.devices.values()):
+        device['ready'] = index < free
+    notifier = DeviceNotifier() if args.notify else None
+    backoff = Backoff(initial=0.05, maximum=0.5)
+
+    def work(client, latencies):
+        for _ in range(args.iterations):
+            device = measure(latencies, client.find_wait_and_allocate, requirements,
+                             wait_timeout=args.wait_timeout, backoff=backoff)
+            time.sleep(args.hold)
+            client.release(device)
+    try:
+        return run_clients(server, args.clients, work, notifier=notifier)
+    finally:
+        for device in server.devices.values():
+            device['ready'] = True
+
+
+BENCHMARKS = dict(list=bench_list, allocate=bench_allocate, wait=bench_wait)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='StfClient benchmark against local fake STF server')
+    parser.add_argument('--devices', type=int, default=2000, help='number of simulated devices')
+    parser.add_argument('--clients', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--iterations', type=int, default=20, help='operations per client')
+    parser.add_argument('--latency', type=float, default=0, help='server side delay per request in seconds')
+    parser.add_argument('--contention', type=float, default=0,
+                        help='probability (0..1) that allocation is refused')
+    parser.add_argument('--requirements', type=str, default='{}', help='requirements as json string')
+    parser.add_argument('--concurrency', type=int, default=1, help='parallel allocation attempts per client')
+    parser.add_argument('--hold', type=float, default=0.01, help='device hold time in wait benchmark')
+    parser.add_argument('--wait_timeout', type=float, default=60, help='wait timeout in wait benchmark')
+    parser.add_argument('--notify', action='store_true',
+                        help='share device notifier between clients in wait benchmark')
+    parser.add_argument('--only', choices=sorted(BENCHMARKS), action='append',
+                        help='run only given benchmark(s)')
+    parser.add_argument('--json', metavar='file', type=str, default='', help='write results as json to file')
+    args = parser.parse_args()
+
+    # configure library logger before first client so that per operation logs don't skew results
+    logger = logging.getLogger('StfAppiumClient')
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.ERROR)
+    results = dict()
+    with FakeStfServer(devices=args.devices, latency=args.latency, contention=args.contention) as server:
+        for name in args.only or BENCHMARKS:
+            results[name] = BENCHMARKS[name](server, args)
+            result = results[name]
+            print(f"{name:10s} ops: {result['operations']:6d} errors: {result['errors']:4d} "
+                  f"ops/s: {result['ops_per_second']:9.1f} p50: {result['p50_ms']:8.2f}ms "
+                  f"p95: {result['p95_ms']:8.2f}ms")
+        results['requests'] = server.requests
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(dict(config=vars(args), results=results), file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import threading
+import time
+
+from stf_appium_client.Logger import Logger
+
+
+class AdbMonitor(Logger):
+    """
+    Background thread which periodically probes adb connections and
+    reconnects devices whose remote adb tunnel has dropped.
+    Probe latencies are collected per device.
+    """
+
+    def __init__(self, interval: float = 5, probe_timeout: float = 5, ready_timeout: float = 30,
+                 max_reconnects: int = 3, on_reconnect=None, on_lost=None):
+        """
+        AdbMonitor constructor
+        :param interval: probe interval in seconds
+        :param probe_timeout: timeout of single state probe in seconds
+        :param ready_timeout: max wait time for device state after reconnect in seconds
+        :param max_reconnects: consecutive failed reconnects after which device is given up
+        :param on_reconnect: callable(adb) called after successful reconnect
+        :param on_lost: callable(adb) called when device is given up
+        """
+        super().__init__()
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.ready_timeout = ready_timeout
+        self.max_reconnects = max_reconnects
+        self._on_reconnect = on_reconnect
+        self._on_lost = on_lost
+        self._servers = dict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._servers)
+
+    def add(self, adb) -> None:
+        """
+        Start monitoring connected AdbServer. Background thread is started on demand
+        :param adb: AdbServer
+        :return: None
+        """
+        with self._lock:
+            self._servers[adb.adb_server] = (adb, dict(state=None, probes=0, failures=0, reconnects=0,
+                                                       failed_reconnects=0, latency_last=None,
+                                                       latency_avg=None, latency_max=None))
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='adb-monitor', daemon=True)
+                self._thread.start()
+
+    def remove(self, adb) -> None:
+        """
+        Stop monitoring AdbServer
+        :param adb: AdbServer
+        :return: None
+        """
+        with self._lock:
+            self._servers.pop(adb.adb_server, None)
+
+    def stop(self) -> None:
+        """ Stop background thread """
+        self._stop.set()
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join()
+
+    def stats(self) -> dict:
+        """
+        Get monitoring statistics
+        :return: dictionary adb_server -> dict(state, probes, failures, reconnects, failed_reconnects,
+                 latency_last, latency_avg, latency_max), latencies in seconds
+        """
+        with self._lock:
+            return {key: dict(stats) for key, (_, stats) in self._servers.items()}
+
+    def probe(self) -> None:
+        """ Probe all devices once and reconnect dropped ones """
+        with self._lock:
+            entries = list(self._servers.values())
+        for adb, stats in entries:
+            if not adb.connected:
+                continue
+            started = time.monotonic()
+            try:
+                state = adb.probe(timeout=self.probe_timeout)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.warning(f'adb({adb.adb_server}): probe fails: {error}')
+                state = None
+            latency = time.monotonic() - started
+            with self._lock:
+                stats['state'] = state
+                stats['probes'] += 1
+                if state == 'device':
+                    stats['latency_last'] = latency
+                    stats['latency_max'] = max(latency, stats['latency_max'] or 0.0)
+                    previous = stats['latency_avg']
+                    stats['latency_avg'] = latency if previous is None else previous * 0.8 + latency * 0.2
+                else:
+                    stats['failures'] += 1
+            if state != 'device':
+                self._reconnect(adb, stats, state)
+
+    def _reconnect(self, adb, stats: dict, state: str):
+        self.logger.warning(f'adb({adb.adb_server}): state {state}, reconnecting')
+        try:
+            adb.reconnect(ready_timeout=self.ready_timeout)
+        except Exception as error:  # pylint: disable=broad-except
+            with self._lock:
+                stats['failed_reconnects'] += 1
+                lost = stats['failed_reconnects'] >= self.max_reconnects
+            self.logger.error(f'adb({adb.adb_server}): reconnect fails: {error}')
+            if lost:
+                self.logger.error(f'adb({adb.adb_server}): device lost')
+                self.remove(adb)
+                if self._on_lost:
+                    self._on_lost(adb)
+            return
+        with self._lock:
+            stats['state'] = 'device'
+            stats['reconnects'] += 1
+            stats['failed_reconnects'] = 0
+        if self._on_reconnect:
+            self._on_reconnect(adb)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.probe()
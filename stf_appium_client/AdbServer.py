@@ -1,24 +1,89 @@
 import os
+import posixpath
+import re
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from easyprocess import EasyProcess
 import atexit
 from stf_appium_client.Logger import Logger
-from stf_appium_client.tools import find_free_port, assert_tool_exists
+from stf_appium_client.tools import find_free_port, assert_tool_exists, is_port_open, file_sha256
+from stf_appium_client.Timings import TIMINGS, timed
+from stf_appium_client.AdbTransport import AdbTransport, AdbResult
+
+
+def _strip_lf(text: str) -> str:
+    if text.endswith('\r\n'):
+        return text[:-2]
+    return text[:-1] if text.endswith('\n') else text
+
+
+def _iter_lines(chunks, max_line: int):
+    """ Split bytes chunks to decoded lines, keeping at most max_line bytes buffered """
+    buffer = b''
+    try:
+        for chunk in chunks:
+            buffer += chunk
+            *complete, buffer = buffer.split(b'\n')
+            for line in complete:
+                line = line.rstrip(b'\r')
+                for offset in range(0, max(len(line), 1), max_line):
+                    yield line[offset:offset + max_line].decode('utf-8', errors='replace')
+            while len(buffer) >= max_line:
+                yield buffer[:max_line].decode('utf-8', errors='replace')
+                buffer = buffer[max_line:]
+        if buffer:
+            yield buffer.rstrip(b'\r').decode('utf-8', errors='replace')
+    finally:
+        chunks.close()
+
+
+# adb commands which are served by local adb server itself and do not take -s serial
+HOST_COMMANDS = ('connect', 'disconnect', 'devices', 'version', 'start-server', 'kill-server', 'reconnect')
+# max length of file arguments per shell command, old devices limit adb shell command length to 4k
+MAX_SHELL_ARGS = 3000
 
 
 class AdbServer(Logger):
-    def __init__(self, adb_server: str = None, port: int = None):
+    timings = TIMINGS
+    # shared local adb servers, port -> dict(users=int, owned=bool)
+    _shared = dict()
+    _shared_lock = threading.Lock()
+    _shared_port = None
+
+    def __init__(self, adb_server: str = None, port: int = None, health=None, serial: str = None,
+                 native: bool = False, shared: bool = False, ready_timeout: float = None):
         """
         Connect to adb server and open proxy for given port
         :param adb_server: adb server to be connected
         :param port: adb listen port in  localhost. None=default, 0=first free one
+        :param health: optional HealthStore where connect outcomes and latencies are recorded
+        :param serial: device serial used in health records, default: adb_server
+        :param native: execute supported commands over adb protocol socket instead of adb process.
+        adb process is still used to start local adb server (connect) and for unsupported commands.
+        :param shared: share one local adb server between all shared AdbServer instances of process.
+        Device is connected and disconnected individually and commands are addressed with `-s adb_server`.
+        Last user kills local adb server unless it was already running before first user.
+        With port=0 one free port is picked for all shared instances.
+        :param ready_timeout: after adb connect wait until device reports `device` state, None = do not wait
         """
         super().__init__()
         assert adb_server, 'adb_server is not given'
         self.adb_server = adb_server
+        self.health = health
+        self.serial = serial or adb_server
+        self.shared = shared
+        self.ready_timeout = ready_timeout
         if port is None:
             port = 5037  # default adb port
+        if not port and shared:
+            port = AdbServer._shared_free_port()
         self._port = find_free_port() if not port else port
         self.connected = False
+        self.transport = AdbTransport(port=self._port, serial=adb_server) if native else None
 
         @atexit.register
         def _exit():
@@ -27,6 +92,19 @@ class AdbServer(Logger):
                 self.logger.info("exit:Killing adb")
                 self.kill()
 
+    @classmethod
+    def _shared_free_port(cls) -> int:
+        with cls._shared_lock:
+            if cls._shared_port is None:
+                cls._shared_port = find_free_port()
+            return cls._shared_port
+
+    @classmethod
+    def shared_users(cls, port: int) -> int:
+        """ Number of connected shared AdbServer instances using local adb server in given port """
+        with cls._shared_lock:
+            return cls._shared.get(port, dict(users=0))['users']
+
     @staticmethod
     def ok():
         assert_tool_exists('adb')
@@ -58,22 +136,22 @@ class AdbServer(Logger):
         """ Get local adb server port """
         return self._port
 
+    @timed('adb.execute')
     def execute(self, command: str, timeout: int = 10, verify: bool = True) -> EasyProcess:
         """
         Internal execute function
         :param command: adb command to be executed
         :param timeout: command timeout [s]
         :param verify: verify return code is 0 of executed adb command, Also timeout causes assert raise.
-        :return: EasyProcess instance which contains stdout, stderr, return_code, timeout_happened
+        :return: EasyProcess (or AdbResult in native mode) instance
+        which contains stdout, stderr, return_code, timeout_happened
         :raise AssertionError: if non 0 is returned or timeout happens and verify=True.
         """
-        port = f" -P {self.port}" if self.port else ""
-        cmd = f"adb{port} {command}"
-        self.logger.debug(f"adb: {cmd}")
-        my_env = os.environ.copy()
-        if "ADB_VENDOR_KEYS" not in my_env:
-            my_env["ADB_VENDOR_KEYS"] = "~/.android"
-        response = EasyProcess(cmd, env=my_env).call(timeout=timeout)
+        response = self._execute_native(command, timeout) if self.connected and self.transport else None
+        if response is not None:
+            cmd = f"adb(native) {command}"
+        else:
+            cmd, response = self._execute_process(command, timeout)
         self.logger.debug(f'adb retcode: {response.return_code}, '
                           f'stdout: {response.stdout}, '
                           f'stderr: {response.stderr}')
@@ -82,6 +160,354 @@ class AdbServer(Logger):
             assert response.return_code == 0, f'adb command "{cmd}" fails with code: {response.return_code}'
         return response
 
+    @timed('adb.shell_batch')
+    def shell_batch(self, commands: list, timeout: int = 60, verify: bool = True,
+                    stop_on_error: bool = False) -> list:
+        """
+        Execute sequence of shell commands in one adb shell session.
+        Each command runs in own subshell, outputs are separated by markers.
+        :param commands: list of shell commands, e.g. ['settings put global x 1', 'pm grant app perm']
+        :param timeout: timeout for whole batch [s]
+        :param verify: raise AssertionError if batch times out or any command returns non 0
+        :param stop_on_error: do not execute remaining commands after first failing one
+        :return: list of AdbResult (stdout, stderr, return_code) per executed command
+        :raise AssertionError: if verify=True and batch timeouts or some command fails
+        """
+        if not commands:
+            return []
+        marker = f'__STF_BATCH_{uuid.uuid4().hex}__'
+        script = self._batch_script(commands, marker, stop_on_error)
+        response = self.execute(f'shell {shlex.quote(script)}', timeout=timeout, verify=False)
+        results = self._parse_batch(commands, marker, response.stdout, response.stderr)
+        self.logger.debug(f'adb batch: {len(results)}/{len(commands)} commands executed')
+        if verify:
+            assert response.timeout_happened is False, f'adb shell batch timeout ({timeout}s)'
+            for result in results:
+                assert result.return_code == 0, \
+                    f'adb shell "{result.cmd}" fails with code: {result.return_code}, stderr: {result.stderr}'
+            assert len(results) == len(commands), \
+                f'adb shell batch: {len(results)}/{len(commands)} commands executed'
+        return results
+
+    @staticmethod
+    def _batch_script(commands: list, marker: str, stop_on_error: bool) -> str:
+        lines = []
+        for index, command in enumerate(commands):
+            # leading new line separates marker from output which does not end to line feed
+            lines.append(f'({command}); rc=$?; '
+                         f"printf '\\n{marker} {index} %d\\n' $rc; printf '\\n{marker}-ERR {index}\\n' >&2")
+            if stop_on_error:
+                lines.append('[ $rc -eq 0 ] || exit $rc')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _parse_batch(commands: list, marker: str, stdout: str, stderr: str) -> list:
+        def sections(text: str, pattern: str) -> tuple:
+            # text is without last line feed (like EasyProcess), tail after last marker is dropped
+            parts = re.split(pattern, text + '\n')
+            return [_strip_lf(part) for part in parts[:-1:2]], parts[1::2]
+
+        # legacy shell (without shell v2) mixes stderr to stdout and may use CRLF line endings
+        stdout = re.sub(f'\r?\n{marker}-ERR \\d+\r?\n', '', (stdout or '') + '\n')
+        outputs, codes = sections(stdout, f'\r?\n{marker} \\d+ (-?\\d+)\r?\n')
+        errors, _ = sections(stderr or '', f'\r?\n{marker}-ERR (\\d+)\r?\n')
+        results = []
+        for index, (output, code) in enumerate(zip(outputs, codes)):
+            results.append(AdbResult(commands[index], stdout=output,
+                                     stderr=errors[index] if index < len(errors) else '',
+                                     return_code=int(code)))
+        return results
+
+    def installed_sha256(self, package: str) -> str:
+        """
+        Get sha256 of installed package base apk
+        :param package: package name
+        :return: hex digest or None when package is not installed
+        """
+        script = f"p=$(pm path {shlex.quote(package)} | head -n 1); [ -n \"$p\" ] && sha256sum \"${{p#package:}}\""
+        response = self.execute(f'shell {shlex.quote(script)}', verify=False)
+        digest = response.stdout.split(' ', 1)[0].strip() if response.return_code == 0 else ''
+        return digest if re.match(r'^[0-9a-f]{64}$', digest) else None
+
+    @timed('adb.install')
+    def install(self, apk: str, package: str = None, args: list = None, timeout: int = 600,
+                force: bool = False) -> bool:
+        """
+        Install apk unless identical apk is already installed
+        :param apk: local apk path
+        :param package: package name of apk, needed to check installed apk. None = install always
+        :param args: extra `adb install` arguments, default: ['-r']
+        :param timeout: install timeout [s]
+        :param force: install without checking installed apk
+        :return: True if apk was installed, False if identical apk was already installed
+        :raise AssertionError: if install fails
+        """
+        if package and not force:
+            local = file_sha256(apk)
+            if self.installed_sha256(package) == local:
+                self.logger.info(f'adb({self._adb_server}): {package} is up to date ({local[:12]})')
+                return False
+        install_args = ' '.join(shlex.quote(arg) for arg in (['-r'] if args is None else args))
+        response = self.execute(f'install {install_args} {shlex.quote(apk)}', timeout=timeout)
+        assert 'Failure' not in response.stdout, f'adb install {apk} fails: {response.stdout}'
+        self.logger.info(f'adb({self._adb_server}): {os.path.basename(apk)} installed')
+        return True
+
+    @staticmethod
+    def install_many(servers: list, apk: str, package: str = None, concurrency: int = 4, **kwargs) -> dict:
+        """
+        Install apk to several devices in parallel
+        :param servers: connected AdbServer instances
+        :param apk: local apk path
+        :param package: package name of apk, see install
+        :param concurrency: max parallel installs
+        :param kwargs: other install arguments
+        :return: dictionary adb_server -> True (installed), False (already up to date) or raised exception
+        """
+        if package:
+            file_sha256(apk)  # hash once before workers
+        results = dict()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='adb-install') as executor:
+            futures = {server: executor.submit(server.install, apk, package=package, **kwargs)
+                       for server in servers}
+            for server, future in futures.items():
+                try:
+                    results[server.adb_server] = future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    server.logger.error(f'adb({server.adb_server}): install fails: {error}')
+                    results[server.adb_server] = error
+        return results
+
+    def remote_files(self, remote: str, compare: str = 'mtime') -> dict:
+        """
+        List files under remote path (file or directory) with one shell round trip
+        :param remote: remote path
+        :param compare: 'size' or 'mtime' lists (size, mtime), 'hash' lists sha256
+        :return: dictionary remote file path -> (size, mtime) tuple or sha256 hex digest
+        """
+        assert compare in ('size', 'mtime', 'hash'), f'invalid compare: {compare}'
+        listing = 'sha256sum {} +' if compare == 'hash' else "stat -c '%s %Y %n' {} +"
+        script = f'find {shlex.quote(remote)} -type f -exec {listing} 2>/dev/null'
+        response = self.execute(f'shell {shlex.quote(script)}', verify=False)
+        return self._parse_listing(response.stdout, compare)
+
+    def _remote_stats(self, paths: list, compare: str) -> dict:
+        """
+        Stat or hash given remote files only, missing files are left out.
+        Paths are batched to keep shell commands short.
+        :return: dictionary remote file path -> (size, mtime) tuple or sha256 hex digest
+        """
+        listing = 'sha256sum' if compare == 'hash' else "stat -c '%s %Y %n'"
+        batches = [[]]
+        for path in paths:
+            if batches[-1] and sum(len(quoted) + 1 for quoted in batches[-1]) > MAX_SHELL_ARGS:
+                batches.append([])
+            batches[-1].append(shlex.quote(path))
+        files = dict()
+        for batch in filter(None, batches):
+            script = f"{listing} {' '.join(batch)} 2>/dev/null"
+            response = self.execute(f'shell {shlex.quote(script)}', verify=False)
+            files.update(self._parse_listing(response.stdout, compare))
+        return files
+
+    @staticmethod
+    def _parse_listing(stdout: str, compare: str) -> dict:
+        files = dict()
+        for line in stdout.splitlines():
+            if compare == 'hash':
+                digest, _, path = line.partition('  ')
+                if path:
+                    files[path] = digest
+                continue
+            parts = line.split(' ', 2)
+            if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+                files[parts[2]] = (int(parts[0]), int(parts[1]))
+        return files
+
+    @staticmethod
+    def _unchanged(local: str, remote_info, compare: str) -> bool:
+        if remote_info is None:
+            return False
+        if compare == 'hash':
+            return remote_info == file_sha256(local)
+        stat = os.stat(local)
+        if compare == 'size':
+            return remote_info[0] == stat.st_size
+        return remote_info == (stat.st_size, int(stat.st_mtime))
+
+    @timed('adb.push')
+    def push(self, local: str, remote: str, compare: str = 'mtime', timeout: int = 600) -> list:
+        """
+        Push file or directory to device, files which are unchanged on device are skipped.
+        Files are streamed from disk in chunks (sync session in native mode, adb push otherwise).
+        :param local: local file or directory
+        :param remote: remote file or directory, file is pushed into directory when remote ends with /
+        :param compare: how unchanged files are detected: 'size', 'mtime' (size and mtime) or 'hash' (sha256).
+        With 'hash' pushed files are verified after transfer.
+        :param timeout: timeout per adb push [s]
+        :return: list of pushed remote paths
+        :raise AssertionError: if push or verification fails
+        """
+        if os.path.isdir(local):
+            pairs = [(os.path.join(root, name),
+                      posixpath.join(remote, os.path.relpath(os.path.join(root, name), local).replace(os.sep, '/')))
+                     for root, _, names in os.walk(local) for name in sorted(names)]
+        else:
+            pairs = [(local, posixpath.join(remote, os.path.basename(local)) if remote.endswith('/') else remote)]
+        assert compare in ('size', 'mtime', 'hash'), f'invalid compare: {compare}'
+        # only pushed paths are checked, destination may hold lots of other files
+        existing = self._remote_stats([target for _, target in pairs], compare)
+        changed = [(source, target) for source, target in pairs
+                   if not self._unchanged(source, existing.get(target), compare)]
+        self.logger.info(f'adb({self._adb_server}): push {len(changed)}/{len(pairs)} changed files to {remote}')
+        for source, target in changed:
+            if self.connected and self.transport:
+                self.transport.push(source, target, mode=os.stat(source).st_mode & 0o777)
+            else:
+                self.execute(f'push {shlex.quote(source)} {shlex.quote(target)}', timeout=timeout)
+        if compare == 'hash' and changed:
+            pushed = self._remote_stats([target for _, target in changed], compare)
+            for source, target in changed:
+                assert pushed.get(target) == file_sha256(source), f'adb push {target}: checksum mismatch'
+        return [target for _, target in changed]
+
+    @timed('adb.pull')
+    def pull(self, remote: str, local: str, compare: str = 'mtime', timeout: int = 600) -> list:
+        """
+        Pull file or directory from device, files which are unchanged locally are skipped.
+        Files are streamed to disk in chunks and remote mtime is preserved.
+        :param remote: remote file or directory
+        :param local: local file or directory
+        :param compare: how unchanged files are detected: 'size', 'mtime' (size and mtime) or 'hash' (sha256)
+        :param timeout: timeout per adb pull [s]
+        :return: list of pulled local paths
+        :raise AssertionError: if pull fails
+        """
+        files = self.remote_files(remote, compare)
+        stats = files if compare != 'hash' else self.remote_files(remote, 'mtime')
+        pulled = []
+        for source, info in sorted(files.items()):
+            if source == remote:
+                target = os.path.join(local, posixpath.basename(remote)) if os.path.isdir(local) else local
+            else:
+                target = os.path.join(local, *posixpath.relpath(source, remote).split('/'))
+            if os.path.isfile(target) and self._unchanged(target, info, compare):
+                continue
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            if self.connected and self.transport:
+                self.transport.pull(source, target)
+                if source in stats:
+                    os.utime(target, (stats[source][1], stats[source][1]))
+            else:
+                self.execute(f'pull -a {shlex.quote(source)} {shlex.quote(target)}', timeout=timeout)
+            pulled.append(target)
+        self.logger.info(f'adb({self._adb_server}): pull {len(pulled)}/{len(files)} changed files from {remote}')
+        return pulled
+
+    def _execute_native(self, command: str, timeout: int):
+        """ Execute command over adb protocol, None when command is not supported natively """
+        try:
+            return self.transport.execute(command, timeout=timeout)
+        except NotImplementedError:
+            return None
+        except OSError as error:
+            self.logger.warning(f'adb native transport failed ({error}), using adb process')
+            return None
+
+    def _adb_command(self, command: str) -> str:
+        port = f" -P {self.port}" if self.port else ""
+        if self.shared and command.split(' ', 1)[0] not in HOST_COMMANDS:
+            port += f" -s {self._adb_server}"
+        return f"adb{port} {command}"
+
+    @staticmethod
+    def _adb_env() -> dict:
+        my_env = os.environ.copy()
+        if "ADB_VENDOR_KEYS" not in my_env:
+            my_env["ADB_VENDOR_KEYS"] = "~/.android"
+        return my_env
+
+    def _execute_process(self, command: str, timeout: int) -> tuple:
+        cmd = self._adb_command(command)
+        self.logger.debug(f"adb: {cmd}")
+        return cmd, EasyProcess(cmd, env=self._adb_env()).call(timeout=timeout)
+
+    def stream(self, command: str, timeout: float = None, lines: bool = True, chunk_size: int = 65536):
+        """
+        Stream output of long running adb command, e.g. `logcat` or `shell top`, incrementally.
+        stderr is merged to stdout. At most one chunk is buffered: when consumer is slow
+        adb blocks on full pipe (or socket in native mode).
+        Closing generator (or leaving for loop) terminates command.
+        :param command: adb command, e.g. `logcat -v threadtime`
+        :param timeout: max streaming duration [s], None = until command exits
+        :param lines: yield decoded lines without line ending, otherwise raw bytes chunks.
+        Lines longer than chunk_size are yielded in parts.
+        :param chunk_size: max chunk (and line) size in bytes
+        :return: generator of str lines or bytes chunks
+        """
+        chunks = self._stream_native(command, timeout, chunk_size) if self.connected and self.transport else None
+        if chunks is None:
+            chunks = self._stream_process(command, timeout, chunk_size)
+        return _iter_lines(chunks, chunk_size) if lines else chunks
+
+    def stream_to(self, command: str, target, timeout: float = None, lines: bool = False) -> int:
+        """
+        Stream output of adb command to file or callback until command exits or timeout.
+        :param command: adb command, e.g. `logcat -v threadtime`
+        :param target: file path, writable file object or callable(item)
+        :param timeout: max streaming duration [s], None = until command exits
+        :param lines: pass decoded lines instead of bytes chunks to file object or callable
+        :return: number of bytes streamed
+        """
+        total = 0
+        if isinstance(target, (str, os.PathLike)):
+            with open(target, 'wb') as file:
+                for chunk in self.stream(command, timeout=timeout, lines=False):
+                    file.write(chunk)
+                    total += len(chunk)
+            return total
+        handle = target.write if hasattr(target, 'write') else target
+        for item in self.stream(command, timeout=timeout, lines=lines):
+            handle(item + '\n' if lines and hasattr(target, 'write') else item)
+            total += len(item.encode('utf-8')) + 1 if lines else len(item)
+        return total
+
+    def _stream_native(self, command: str, timeout: float, chunk_size: int):
+        words = command.split(' ', 1)
+        if words[0] == 'logcat':
+            shell = f"exec {command}"
+        elif words[0] in ('shell', 'exec-out') and len(words) == 2:
+            shell = ' '.join(shlex.split(words[1]))
+        else:
+            return None
+        self.logger.debug(f"adb(native) stream: {command}")
+        return self.transport.stream(shell, timeout=timeout, chunk_size=chunk_size)
+
+    def _stream_process(self, command: str, timeout: float, chunk_size: int):
+        cmd = self._adb_command(command)
+        self.logger.debug(f"adb stream: {cmd}")
+        process = subprocess.Popen(shlex.split(cmd), env=self._adb_env(), stdin=subprocess.DEVNULL,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+        timer = threading.Timer(timeout, process.kill) if timeout else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            if timer:
+                timer.cancel()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+            self.logger.debug(f"adb stream: {cmd} finished with code {process.returncode}")
+
+    @timed('adb.connect')
     def connect(self) -> None:
         """
         Create ADB server using given ADB host
@@ -90,27 +516,142 @@ class AdbServer(Logger):
         """
         assert not self.connected, 'adb is already running'
         self.logger.debug(f'adb({self._adb_server}): connecting')
+        started = time.monotonic()
+        if self.shared:
+            self._acquire_shared()
         try:
             cmd = f"connect {self._adb_server}"
             response = self.execute(cmd, 10)
             stdout = response.stdout
             self.logger.debug(stdout)
             assert response.return_code == 0, f"{response.stderr}"
+            if self.ready_timeout:
+                self.wait_ready(self.ready_timeout)
         except AssertionError as error:
             self.logger.error(error)
+            if self.shared:
+                self._release_shared()
+            else:
+                # adb connect has started local server already, don't leak it
+                self.execute('kill-server', verify=False)
+            if self.health:
+                self.health.record(self.serial, 'adb_connect', False, time.monotonic() - started)
             raise
+        if self.health:
+            self.health.record(self.serial, 'adb_connect', True, time.monotonic() - started)
 
         self.logger.info(f'adb({self.port}): connected to {self._adb_server}')
         self.connected = True
 
+    @timed('adb.probe')
+    def probe(self, timeout: float = 5) -> str:
+        """
+        Query device state from local adb server
+        :param timeout: probe timeout [s]
+        :return: state, e.g. `device`, `offline`, `unauthorized`, or None when device is not found
+        """
+        response = self.execute('get-state', timeout=timeout, verify=False)
+        if response.timeout_happened or response.return_code != 0:
+            return None
+        return response.stdout.strip() or None
+
+    @timed('adb.wait_ready')
+    def wait_ready(self, timeout: float = 30, interval: float = 0.25) -> float:
+        """
+        Poll device state until it is `device`
+        :param timeout: max wait time [s]
+        :param interval: poll interval [s]
+        :return: wait duration [s]
+        :raise AssertionError: if device is not ready within timeout
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        state = None
+        while True:
+            state = self.probe(timeout=max(0.5, min(5.0, deadline - time.monotonic())))
+            if state == 'device':
+                elapsed = time.monotonic() - started
+                self.logger.debug(f'adb({self._adb_server}): ready in {elapsed:.2f}s')
+                return elapsed
+            remaining = deadline - time.monotonic()
+            assert remaining > 0, f'adb({self._adb_server}): device not ready in {timeout}s (state: {state})'
+            time.sleep(min(interval, remaining))
+
+    @timed('adb.reconnect')
+    def reconnect(self, ready_timeout: float = 30) -> None:
+        """
+        Reconnect dropped device: adb disconnect, adb connect and wait until device is ready
+        :param ready_timeout: max wait time for device state after connect [s]
+        :return: None
+        :raise AssertionError: if reconnect fails
+        """
+        assert self.connected, 'adb is not started'
+        started = time.monotonic()
+        if self.transport:
+            self.transport.close()
+        try:
+            self.execute(f'disconnect {self._adb_server}', verify=False)
+            response = self.execute(f'connect {self._adb_server}', 10)
+            assert not response.stdout.startswith(('failed', 'unable')), \
+                f'adb connect {self._adb_server} fails: {response.stdout}'
+            self.wait_ready(ready_timeout)
+        except AssertionError:
+            if self.health:
+                self.health.record(self.serial, 'adb_reconnect', False, time.monotonic() - started)
+            raise
+        if self.health:
+            self.health.record(self.serial, 'adb_reconnect', True, time.monotonic() - started)
+        self.logger.info(f'adb({self.port}): reconnected to {self._adb_server}')
+
+    def _acquire_shared(self):
+        with AdbServer._shared_lock:
+            entry = AdbServer._shared.get(self.port)
+            if entry is None:
+                # do not kill adb server which someone else started
+                entry = dict(users=0, owned=not is_port_open(self.port))
+                AdbServer._shared[self.port] = entry
+            entry['users'] += 1
+
+    def _release_shared(self) -> bool:
+        """ Drop shared server user, returns True when local adb server should be killed """
+        with AdbServer._shared_lock:
+            entry = AdbServer._shared[self.port]
+            entry['users'] -= 1
+            if entry['users'] > 0:
+                return False
+            del AdbServer._shared[self.port]
+            return entry['owned']
+
+    @timed('adb.kill')
     def kill(self) -> None:
-        """ Kill local adb server """
+        """ Kill local adb server, in shared mode disconnect device and kill server when last user leaves """
         assert self.connected, 'adb is not started'
+        if self.shared:
+            self._disconnect_shared()
+            return
         try:
             self.logger.debug(f'adb({self.port}): killing service')
+            if self.transport:
+                self.transport.close()
             self.execute('kill-server')
             self.connected = False
         except AssertionError as error:
             self.logger.error(f'adb kill failed: {error}')
             raise
         self.logger.info(f'adb({self.port}): service killed successfully')
+
+    def _disconnect_shared(self) -> None:
+        if self.transport:
+            self.transport.close()
+        try:
+            self.logger.debug(f'adb({self.port}): disconnecting {self._adb_server}')
+            response = self.execute(f'disconnect {self._adb_server}', verify=False)
+            if response.return_code != 0:
+                self.logger.warning(f'adb disconnect {self._adb_server} failed: {response.stderr}')
+        finally:
+            self.connected = False
+            last = self._release_shared()
+        if last:
+            self.logger.debug(f'adb({self.port}): last user left, killing service')
+            self.execute('kill-server', verify=False)
+        self.logger.info(f'adb({self.port}): disconnected from {self._adb_server}')
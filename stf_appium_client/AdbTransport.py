@@ -0,0 +1,420 @@
+import os
+import shlex
+import socket
+import struct
+import threading
+import time
+from contextlib import closing
+
+from stf_appium_client.Logger import Logger
+from stf_appium_client.exceptions import AdbProtocolError
+
+# shell,v2 packet ids
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+# max sync DATA payload
+SYNC_CHUNK = 64 * 1024
+
+
+class AdbResult:
+    """
+    Result of command executed over adb protocol. Mimics EasyProcess attributes
+    """
+
+    def __init__(self, cmd: str, stdout: str = '', stderr: str = '', return_code: int = 0,
+                 timeout_happened: bool = False):
+        self.cmd = cmd
+        self.stdout = stdout
+        self.stderr = stderr
+        self.return_code = return_code
+        self.timeout_happened = timeout_happened
+
+    def __repr__(self):
+        return f'<AdbResult cmd={self.cmd} return_code={self.return_code} ' \
+               f'stdout="{self.stdout}" stderr="{self.stderr}" timeout_happened={self.timeout_happened}>'
+
+
+def _decode(data: bytes) -> str:
+    text = data.decode('utf-8', errors='replace')
+    # same as EasyProcess: drop single line feed at end
+    if text.endswith('\n'):
+        text = text[:-1]
+    return text
+
+
+class AdbTransport(Logger):
+    """
+    In-process client for adb host protocol. Talks to local adb server over socket
+    instead of spawning `adb` process for each command.
+    Supports host services (`host:`), shell (`shell,v2:` with fallback to `shell:`)
+    and file sync (`sync:`). adb closes connection after each host or shell service,
+    sync session is kept open and reused.
+    """
+
+    def __init__(self, port: int = 5037, serial: str = None, host: str = '127.0.0.1', timeout: float = 10):
+        """
+        AdbTransport constructor
+        :param port: local adb server port
+        :param serial: device serial, None = the only device
+        :param host: adb server host
+        :param timeout: default socket timeout in seconds
+        """
+        super().__init__()
+        self.address = host
+        self.port = port
+        self.serial = serial
+        self.timeout = timeout
+        self._shell_v2 = None
+        self._sync = None
+        self._sync_lock = threading.Lock()
+
+    # -- protocol primitives --
+
+    def _connect(self, timeout: float = None) -> socket.socket:
+        sock = socket.create_connection((self.address, self.port), timeout=timeout or self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    @staticmethod
+    def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbProtocolError(f'connection closed, {len(data)}/{size} bytes received')
+            data.extend(chunk)
+        return bytes(data)
+
+    @staticmethod
+    def _recv_all(sock: socket.socket) -> bytes:
+        data = bytearray()
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return bytes(data)
+            data.extend(chunk)
+
+    def _read_hex_string(self, sock: socket.socket) -> str:
+        length = int(self._recv_exactly(sock, 4), 16)
+        return self._recv_exactly(sock, length).decode('utf-8', errors='replace')
+
+    def _request(self, sock: socket.socket, service: str) -> None:
+        """ Send service request and verify status """
+        payload = service.encode('utf-8')
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = self._recv_exactly(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbProtocolError(f'{service}: {self._read_hex_string(sock)}')
+        raise AdbProtocolError(f'{service}: unexpected status {status!r}')
+
+    def _transport(self, sock: socket.socket) -> None:
+        self._request(sock, f'host:transport:{self.serial}' if self.serial else 'host:transport-any')
+
+    # -- host services --
+
+    def host(self, service: str, timeout: float = None) -> str:
+        """
+        Execute host service, e.g. `version`, `devices`, `connect:<address>`
+        :param service: service without `host:` prefix
+        :param timeout: socket timeout in seconds
+        :return: service response
+        """
+        with closing(self._connect(timeout)) as sock:
+            self._request(sock, f'host:{service}')
+            if service == 'kill':
+                return ''
+            return self._read_hex_string(sock)
+
+    def host_serial(self, service: str, timeout: float = None) -> str:
+        """
+        Execute device specific host service, e.g. `get-state`
+        :param service: service name
+        :param timeout: socket timeout in seconds
+        :return: service response
+        """
+        prefix = f'host-serial:{self.serial}' if self.serial else 'host'
+        with closing(self._connect(timeout)) as sock:
+            self._request(sock, f'{prefix}:{service}')
+            return self._read_hex_string(sock)
+
+    def features(self) -> list:
+        """ Get features supported by both device and adb server """
+        return [item for item in self.host_serial('features').split(',') if item]
+
+    # -- shell --
+
+    def _supports_shell_v2(self) -> bool:
+        if self._shell_v2 is None:
+            try:
+                self._shell_v2 = 'shell_v2' in self.features()
+            except AdbProtocolError:
+                self._shell_v2 = False
+        return self._shell_v2
+
+    def shell(self, command: str, timeout: float = None) -> AdbResult:
+        """
+        Execute shell command on device
+        :param command: shell command
+        :param timeout: command timeout in seconds
+        :return: AdbResult, return code is available when device supports shell v2
+        """
+        shell_v2 = self._supports_shell_v2()
+        cmd = f'shell {command}'
+        try:
+            with closing(self._connect(timeout)) as sock:
+                self._transport(sock)
+                if not shell_v2:
+                    self._request(sock, f'shell:{command}')
+                    return AdbResult(cmd, stdout=_decode(self._recv_all(sock)))
+                self._request(sock, f'shell,v2,raw:{command}')
+                return self._read_shell_v2(sock, cmd)
+        except socket.timeout:
+            return AdbResult(cmd, return_code=-1, timeout_happened=True)
+
+    def _shell_packets(self, sock: socket.socket):
+        """ Generator of shell v2 (packet_id, data) tuples """
+        while True:
+            header = sock.recv(5)
+            if not header:
+                return
+            if len(header) < 5:
+                header += self._recv_exactly(sock, 5 - len(header))
+            packet_id, length = struct.unpack('<BI', header)
+            yield packet_id, self._recv_exactly(sock, length)
+
+    def _read_shell_v2(self, sock: socket.socket, cmd: str) -> AdbResult:
+        stdout, stderr = bytearray(), bytearray()
+        return_code = None
+        for packet_id, data in self._shell_packets(sock):
+            if packet_id == SHELL_STDOUT:
+                stdout.extend(data)
+            elif packet_id == SHELL_STDERR:
+                stderr.extend(data)
+            elif packet_id == SHELL_EXIT:
+                return_code = data[0]
+                break
+        if return_code is None:
+            raise AdbProtocolError(f'{cmd}: exit code missing')
+        return AdbResult(cmd, stdout=_decode(stdout), stderr=_decode(stderr), return_code=return_code)
+
+    def stream(self, command: str, timeout: float = None, chunk_size: int = SYNC_CHUNK):
+        """
+        Stream shell command output (stdout and stderr) as it is produced.
+        Nothing is buffered beyond one chunk, slow consumer throttles device side via socket.
+        Closing generator closes connection which terminates command on device.
+        :param command: shell command, e.g. `logcat -v threadtime`
+        :param timeout: max streaming duration in seconds, None = until command exits
+        :param chunk_size: max chunk size in bytes
+        :return: generator of bytes chunks
+        """
+        shell_v2 = self._supports_shell_v2()
+        deadline = time.monotonic() + timeout if timeout else None
+        with closing(self._connect()) as sock:
+            self._transport(sock)
+            self._request(sock, f'shell,v2,raw:{command}' if shell_v2 else f'shell:{command}')
+            sock.settimeout(None)
+            while True:
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    sock.settimeout(remaining)
+                try:
+                    if not shell_v2:
+                        chunk = sock.recv(chunk_size)
+                        if not chunk:
+                            return
+                        yield chunk
+                        continue
+                    packet_id, data = next(self._shell_packets(sock), (SHELL_EXIT, b''))
+                except socket.timeout:
+                    return
+                if packet_id == SHELL_EXIT:
+                    return
+                if packet_id in (SHELL_STDOUT, SHELL_STDERR):
+                    for offset in range(0, len(data), chunk_size):
+                        yield data[offset:offset + chunk_size]
+
+    # -- sync --
+
+    def _sync_session(self) -> socket.socket:
+        if self._sync is None:
+            sock = self._connect()
+            try:
+                self._transport(sock)
+                self._request(sock, 'sync:')
+            except BaseException:
+                sock.close()
+                raise
+            self._sync = sock
+        return self._sync
+
+    def _sync_call(self, func):
+        """ Run func(sock) in persistent sync session, session is dropped on failure """
+        with self._sync_lock:
+            sock = self._sync_session()
+            try:
+                return func(sock)
+            except (OSError, AdbProtocolError):
+                self._close_sync()
+                raise
+
+    @staticmethod
+    def _sync_send(sock: socket.socket, command: bytes, data: bytes) -> None:
+        sock.sendall(command + struct.pack('<I', len(data)) + data)
+
+    def _sync_fail(self, sock: socket.socket, length: int, path: str):
+        message = self._recv_exactly(sock, length).decode('utf-8', errors='replace')
+        raise AdbProtocolError(f'{path}: {message}')
+
+    def stat(self, path: str) -> tuple:
+        """
+        Stat remote file
+        :param path: remote path
+        :return: tuple (mode, size, mtime), all zero when file does not exist
+        """
+        def stat(sock):
+            self._sync_send(sock, b'STAT', path.encode('utf-8'))
+            reply = self._recv_exactly(sock, 16)
+            if reply[:4] != b'STAT':
+                raise AdbProtocolError(f'{path}: unexpected stat reply {reply[:4]!r}')
+            return struct.unpack('<III', reply[4:])
+        return self._sync_call(stat)
+
+    def pull(self, remote: str, local: str, callback=None) -> int:
+        """
+        Download file from device
+        :param remote: remote path
+        :param local: local path
+        :param callback: optional callable(chunk: bytes) called for each received chunk
+        :return: number of bytes received
+        """
+        def pull(sock):
+            total = 0
+            self._sync_send(sock, b'RECV', remote.encode('utf-8'))
+            with open(local, 'wb') as file:
+                while True:
+                    command, length = struct.unpack('<4sI', self._recv_exactly(sock, 8))
+                    if command == b'DONE':
+                        return total
+                    if command == b'FAIL':
+                        self._sync_fail(sock, length, remote)
+                    if command != b'DATA':
+                        raise AdbProtocolError(f'{remote}: unexpected sync reply {command!r}')
+                    chunk = self._recv_exactly(sock, length)
+                    file.write(chunk)
+                    total += length
+                    if callback:
+                        callback(chunk)
+        return self._sync_call(pull)
+
+    def push(self, local: str, remote: str, mode: int = 0o644, callback=None) -> int:
+        """
+        Upload file to device
+        :param local: local path
+        :param remote: remote path
+        :param mode: remote file permissions
+        :param callback: optional callable(chunk: bytes) called for each sent chunk
+        :return: number of bytes sent
+        """
+        def push(sock):
+            total = 0
+            self._sync_send(sock, b'SEND', f'{remote},{0o100000 | mode}'.encode('utf-8'))
+            with open(local, 'rb') as file:
+                while True:
+                    chunk = file.read(SYNC_CHUNK)
+                    if not chunk:
+                        break
+                    self._sync_send(sock, b'DATA', chunk)
+                    total += len(chunk)
+                    if callback:
+                        callback(chunk)
+            sock.sendall(b'DONE' + struct.pack('<I', int(os.path.getmtime(local))))
+            command, length = struct.unpack('<4sI', self._recv_exactly(sock, 8))
+            if command == b'FAIL':
+                self._sync_fail(sock, length, remote)
+            if command != b'OKAY':
+                raise AdbProtocolError(f'{remote}: unexpected sync reply {command!r}')
+            return total
+        return self._sync_call(push)
+
+    def listdir(self, path: str) -> list:
+        """
+        List remote directory
+        :param path: remote directory
+        :return: list of (name, mode, size, mtime) tuples
+        """
+        def listdir(sock):
+            entries = []
+            self._sync_send(sock, b'LIST', path.encode('utf-8'))
+            while True:
+                command, mode, size, mtime, length = struct.unpack('<4sIIII', self._recv_exactly(sock, 20))
+                if command == b'DONE':
+                    return entries
+                if command != b'DENT':
+                    raise AdbProtocolError(f'{path}: unexpected sync reply {command!r}')
+                name = self._recv_exactly(sock, length).decode('utf-8', errors='replace')
+                if name not in ('.', '..'):
+                    entries.append((name, mode, size, mtime))
+        return self._sync_call(listdir)
+
+    def _close_sync(self):
+        if self._sync is not None:
+            try:
+                self._sync.close()
+            finally:
+                self._sync = None
+
+    def close(self) -> None:
+        """ Close persistent sync session """
+        with self._sync_lock:
+            if self._sync is not None:
+                try:
+                    self._sync_send(self._sync, b'QUIT', b'')
+                except OSError:
+                    pass
+            self._close_sync()
+
+    # -- adb command line compatibility --
+
+    def execute(self, command: str, timeout: float = None) -> AdbResult:
+        """
+        Execute adb command line, e.g. `shell getprop`, `devices`, `get-state`
+        :param command: adb command without `adb` and server options
+        :param timeout: timeout in seconds
+        :return: AdbResult
+        :raises NotImplementedError: command is not supported natively
+        """
+        words = shlex.split(command)
+        if not words:
+            raise NotImplementedError('empty command')
+        name, args = words[0], words[1:]
+        started = time.monotonic()
+        if name == 'shell' and args:
+            # adb joins shell arguments with space without escaping
+            return self.shell(' '.join(args), timeout=timeout)
+        handlers = {
+            'version': lambda: self.host('version', timeout),
+            'devices': lambda: self.host('devices-l' if args == ['-l'] else 'devices', timeout),
+            'connect': lambda: self.host(f'connect:{args[0]}', timeout),
+            'disconnect': lambda: self.host(f'disconnect:{args[0]}' if args else 'disconnect:', timeout),
+            'kill-server': lambda: self.host('kill', timeout),
+            'get-state': lambda: self.host_serial('get-state', timeout),
+            'get-serialno': lambda: self.host_serial('get-serialno', timeout),
+        }
+        if name not in handlers or (name == 'connect' and len(args) != 1):
+            raise NotImplementedError(f'not supported natively: {command}')
+        try:
+            stdout = handlers[name]()
+        except AdbProtocolError as error:
+            return AdbResult(command, stderr=str(error), return_code=1)
+        except socket.timeout:
+            return AdbResult(command, return_code=-1, timeout_happened=True)
+        finally:
+            self.logger.debug(f'adb native: {command} ({time.monotonic() - started:.3f}s)')
+        if name == 'version' and stdout:
+            stdout = f'Android Debug Bridge version 1.0.{int(stdout, 16)}'
+        return AdbResult(command, stdout=stdout.rstrip('\n'))
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import threading
+
+from stf_appium_client.Logger import Logger
+
+
+class AffinityStore(Logger):
+    """
+    Remembers which device serials were recently allocated for given key (e.g. job or app name)
+    so that allocation can prefer devices which already have APKs, test data and
+    appium helper apps installed.
+    """
+
+    def __init__(self, filename: str = None, max_serials: int = 5):
+        """
+        AffinityStore constructor
+        :param filename: json file where affinities are persisted between runs. None keeps them in memory
+        :param max_serials: how many most recent serials are remembered per key
+        """
+        super().__init__()
+        self.filename = filename
+        self.max_serials = max_serials
+        self._affinities = dict()
+        self._lock = threading.Lock()
+
+    def preferred(self, key: str) -> list:
+        """
+        Get recently used serials for key
+        :param key: affinity key
+        :return: list of serials, most recent first
+        """
+        with self._lock:
+            self._load()
+            return list(self._affinities.get(key, []))
+
+    def remember(self, key: str, serial: str) -> None:
+        """
+        Record that device was allocated for key
+        :param key: affinity key
+        :param serial: device serial
+        :return: None
+        """
+        with self._lock:
+            # merge with file content, other processes might have updated it meanwhile
+            self._load()
+            serials = [serial] + [item for item in self._affinities.get(key, []) if item != serial]
+            self._affinities[key] = serials[:self.max_serials]
+            self._save()
+
+    def forget(self, key: str, serial: str = None) -> None:
+        """
+        Drop affinity, e.g. when device state is known to be broken
+        :param key: affinity key
+        :param serial: device serial, None drops all serials of key
+        :return: None
+        """
+        with self._lock:
+            self._load()
+            if serial is None:
+                self._affinities.pop(key, None)
+            else:
+                self._affinities[key] = [item for item in self._affinities.get(key, []) if item != serial]
+            self._save()
+
+    def order(self, key: str, devices: list) -> list:
+        """
+        Order devices so that recently used ones for key come first, most recent first.
+        Order of other devices is kept.
+        :param key: affinity key
+        :param devices: list of device dictionaries
+        :return: ordered list of devices
+        """
+        rank = {serial: index for index, serial in enumerate(self.preferred(key))}
+        return sorted(devices, key=lambda device: rank.get(device.get('serial'), len(rank)))
+
+    def _load(self):
+        if not self.filename or not os.path.exists(self.filename):
+            return
+        try:
+            with open(self.filename) as file:
+                data = json.load(file)
+        except (OSError, ValueError) as error:
+            self.logger.warning(f'affinity file {self.filename} is not readable: {error}')
+            return
+        if isinstance(data, dict):
+            self._affinities = {key: list(value) for key, value in data.items() if isinstance(value, list)}
+
+    def _save(self):
+        if not self.filename:
+            return
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # atomic replace so that concurrent readers never see partial file
+            handle, tmp = tempfile.mkstemp(dir=directory, prefix='.affinity')
+            with os.fdopen(handle, 'w') as file:
+                json.dump(self._affinities, file, indent=2)
+            os.replace(tmp, self.filename)
+        except OSError as error:
+            self.logger.warning(f'affinity file {self.filename} is not writable: {error}')
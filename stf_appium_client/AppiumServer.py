@@ -4,9 +4,11 @@ from appium.webdriver.appium_service import AppiumService
 from appium.version import version
 from stf_appium_client.tools import find_free_port
 from stf_appium_client.Logger import Logger
+from stf_appium_client.Timings import TIMINGS, timed
 
 
 class AppiumServer(Logger):
+    timings = TIMINGS
 
     def __init__(self, appium_args: List[str] = None, **kwargs: Any):
         """ Initialize Appium wrapper """
@@ -31,6 +33,7 @@ class AppiumServer(Logger):
         else:
             return f'http://127.0.0.1:{self.port}'  # Appium >= 2.0
 
+    @timed('appium.start')
     def start(self):
         assert not self.service.is_running, 'Appium already running'
         # https://appium.io/docs/en/writing-running-appium/server-args/
@@ -43,6 +46,7 @@ class AppiumServer(Logger):
         self.logger.info(f'Appium started: {uri} (pid: {self.service._process.pid})')
         return uri
 
+    @timed('appium.stop')
     def stop(self):
         assert self.service.is_running, 'Appium is not running'
         self.logger.info(f"Close appium server (port: {self.port}, pid: {self.service._process.pid})")
@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from stf_appium_client.Logger import Logger
+from stf_appium_client.StfClient import StfClient
+from stf_appium_client.DeviceQuery import DeviceQuery
+from stf_appium_client.WaitStrategy import Backoff
+from stf_appium_client.exceptions import DeviceNotFound
+
+
+class AsyncStfClient(Logger):
+    """
+    asyncio counterpart of StfClient.
+    STF API client is blocking, so API calls are executed in a dedicated
+    thread pool while waiting and orchestration happens in event loop.
+    """
+    DEFAULT_ALLOCATION_TIMEOUT_SECONDS = StfClient.DEFAULT_ALLOCATION_TIMEOUT_SECONDS
+
+    def __init__(self, host: str, max_workers: int = 32, **kwargs):
+        """
+        AsyncStfClient constructor
+        :param host: Server address of OpenSTF
+        :param max_workers: max concurrent STF API calls
+        :param kwargs: extra StfClient arguments
+        """
+        super().__init__()
+        self.client = StfClient(host, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stf-async')
+
+    def connect(self, token: str) -> None:
+        """
+        Establish connection for OpenSTF server
+        :param token: stf access token
+        :return: None
+        """
+        self.client.connect(token=token)
+
+    def close(self) -> None:
+        """ Shutdown worker threads """
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # waiting for in-flight STF calls must not block event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def get_devices(self, fields: list = None, exact: bool = False) -> list:
+        """ See StfClient.get_devices """
+        return await self._run(self.client.get_devices, fields=list(fields or []), exact=exact)
+
+    async def list_devices(self, requirements, fields: str = "", available_filter: bool = True) -> list:
+        """ See StfClient.list_devices """
+        return await self._run(self.client.list_devices, requirements,
+                               fields=fields, available_filter=available_filter)
+
+    async def allocate(self, device: dict, timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS) -> dict:
+        """ See StfClient.allocate """
+        return await self._run(self.client.allocate, device, timeout_seconds=timeout_seconds)
+
+    async def remote_connect(self, device: dict) -> str:
+        """ See StfClient.remote_connect """
+        return await self._run(self.client.remote_connect, device)
+
+    async def remote_disconnect(self, device: dict) -> None:
+        """ See StfClient.remote_disconnect """
+        return await self._run(self.client.remote_disconnect, device)
+
+    async def release(self, device: dict) -> None:
+        """ See StfClient.release """
+        return await self._run(self.client.release, device)
+
+    async def find_and_allocate(self, requirements,
+                                timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
+                                shuffle: bool = True,
+                                concurrency: int = 1,
+                                affinity_key: str = None) -> dict:
+        """ See StfClient.find_and_allocate """
+        return await self._run(self.client.find_and_allocate, requirements,
+                               timeout_seconds=timeout_seconds, shuffle=shuffle, concurrency=concurrency,
+                               affinity_key=affinity_key)
+
+    async def find_wait_and_allocate(self, requirements,
+                                     wait_timeout=60,
+                                     timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
+                                     shuffle: bool = True,
+                                     concurrency: int = 1,
+                                     backoff: Backoff = None,
+                                     affinity_key: str = None) -> dict:
+        """
+        wait until suitable device is free and allocate it.
+        Waiting happens in event loop, no thread is blocked meanwhile unless client
+        has notifier: waiting for notification occupies one worker thread.
+        Polling rounds, outage handling and delays are shared with StfClient.find_wait_and_allocate
+        """
+        client = self.client
+        wait_until = time.time() + wait_timeout
+        query = DeviceQuery.create(requirements)
+        suitable_devices = await self.list_devices(query, available_filter=False)
+        if not suitable_devices:
+            raise DeviceNotFound(f'No suitable devices found ({StfClient.describe(requirements)})')
+
+        delays = (backoff or Backoff()).delays()
+        while True:
+            device = await self._run(client.allocation_round, query, timeout_seconds=timeout_seconds,
+                                     shuffle=shuffle, concurrency=concurrency, affinity_key=affinity_key)
+            if device:
+                return device
+            delay = client.next_delay(delays, wait_until)
+            if delay is None:
+                break
+            if client.notifier:
+                await self._run(client.wait_for_change, delay, query)
+            else:
+                await asyncio.sleep(delay)
+        raise DeviceNotFound(f'Suitable device not found within {wait_timeout}s timeout '
+                             f'({StfClient.describe(requirements)})')
+
+    @asynccontextmanager
+    async def allocation_context(self, requirements,
+                                 wait_timeout=60,
+                                 timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
+                                 shuffle: bool = True,
+                                 concurrency: int = 1,
+                                 affinity_key: str = None):
+        """
+        Allocate and remote connect device, release it on exit
+        :param requirements: requirements for DUT
+        :param wait_timeout: how long time we try to allocate suitable device
+        :param timeout_seconds: allocation timeout
+        :param shuffle: allocate suitable device randomly
+        :param concurrency: parallel allocation attempts
+        :param affinity_key: prefer devices recently allocated with same key
+        :return: device dictionary
+        """
+        self.logger.info(f"Trying to allocate device using requirements: {requirements}")
+        device = await self.find_wait_and_allocate(requirements,
+                                                   wait_timeout=wait_timeout,
+                                                   timeout_seconds=timeout_seconds,
+                                                   shuffle=shuffle,
+                                                   concurrency=concurrency,
+                                                   affinity_key=affinity_key)
+        self.logger.info(f'device allocated: {device}')
+        try:
+            device['remote_adb_url'] = await self.remote_connect(device)
+            yield device
+        finally:
+            await self.release(device)
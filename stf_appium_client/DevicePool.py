@@ -0,0 +1,269 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from stf_appium_client.Logger import Logger
+from stf_appium_client.StfClient import StfClient
+from stf_appium_client.AdbServer import AdbServer
+from stf_appium_client.AppiumServer import AppiumServer
+from stf_appium_client.exceptions import DeviceNotFound
+
+
+class PoolMember:
+    """
+    Allocated and remote connected device with adb (and appium) server up and running
+    """
+
+    def __init__(self, device: dict, adb: AdbServer, appium: AppiumServer = None):
+        self.device = device
+        self.adb = adb
+        self.appium = appium
+        self.appium_uri = appium.get_api_path() if appium else None
+        self.uses = 0
+        # set by heartbeat when STF has taken allocation back
+        self.lost = False
+
+    @property
+    def serial(self) -> str:
+        """ Device serial number """
+        return self.device.get('serial')
+
+    def __repr__(self):
+        return f'PoolMember({self.serial}, adb: {self.adb.port}, appium: {self.appium_uri})'
+
+
+class DevicePool(Logger):
+    """
+    Keeps `size` devices matching requirements allocated, remote connected and
+    adb + appium servers running, so that callers get ready device in milliseconds.
+    Pool is refilled in background when devices are retired.
+    """
+
+    def __init__(self, client: StfClient, requirements, size: int = 1,
+                 timeout_seconds: int = StfClient.DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
+                 wait_timeout: int = 60,
+                 start_appium: bool = True,
+                 appium_args: list = None,
+                 max_uses: int = None,
+                 recycle=None,
+                 concurrency: int = 4,
+                 refill_interval: float = 10,
+                 shared_adb: bool = False):
+        """
+        DevicePool constructor
+        :param client: connected StfClient
+        :param requirements: device requirements
+        :param size: number of devices kept ready
+        :param timeout_seconds: allocation timeout, allocations are kept alive by client heartbeat while pooled
+        :param wait_timeout: wait timeout for suitable free device per allocation round
+        :param start_appium: start appium server for each device
+        :param appium_args: extra appium arguments
+        :param max_uses: retire device after it has been leased this many times. None = unlimited
+        :param recycle: optional callable(member) which resets device after use, failure retires device
+        :param concurrency: max parallel device setups
+        :param refill_interval: max interval in seconds between refill rounds
+        :param shared_adb: connect all devices to one shared local adb server instead of server per device
+        """
+        super().__init__()
+        assert size > 0, 'size should be positive'
+        self.client = client
+        self.requirements = requirements
+        self.size = size
+        self.timeout_seconds = timeout_seconds
+        self.wait_timeout = wait_timeout
+        self.start_appium = start_appium
+        self.appium_args = appium_args or []
+        self.max_uses = max_uses
+        self.recycle = recycle
+        self.concurrency = concurrency
+        self.refill_interval = refill_interval
+        self.shared_adb = shared_adb
+        self._idle = queue.Queue()
+        self._members = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def available(self) -> int:
+        """ Number of idle devices """
+        return self._idle.qsize()
+
+    def start(self) -> None:
+        """ Start background refill """
+        assert self._thread is None, 'pool already started'
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='stf-pool', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop refilling and tear down idle devices. Leased devices are torn down when given back """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        while True:
+            try:
+                member = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._retire(member)
+
+    def acquire(self, timeout: float = None) -> PoolMember:
+        """
+        Get ready device from pool. Devices whose allocation is lost or
+        which are not reachable over adb are retired and skipped.
+        :param timeout: max wait time in seconds, None waits forever
+        :return: PoolMember
+        :raises DeviceNotFound: no device available within timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                member = self._idle.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise DeviceNotFound(f'No device available in pool within {timeout}s') from None
+            if self._usable(member):
+                break
+            self._retire(member)
+        member.uses += 1
+        self.logger.info(f'pool: leased {member}')
+        return member
+
+    def giveback(self, member: PoolMember, healthy: bool = True) -> None:
+        """
+        Return device to pool
+        :param member: PoolMember from acquire
+        :param healthy: False retires device and pool replaces it
+        :return: None
+        """
+        if healthy and self.recycle and not self._stopped.is_set():
+            try:
+                self.recycle(member)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.warning(f'pool: {member.serial} recycle fails: {error}')
+                healthy = False
+        if not healthy or self._stopped.is_set() or \
+                (self.max_uses is not None and member.uses >= self.max_uses):
+            self._retire(member)
+            return
+        self._idle.put(member)
+
+    @contextmanager
+    def lease(self, timeout: float = None):
+        """
+        Context manager for acquire and giveback. Device is retired if context raises
+        :param timeout: max wait time in seconds
+        :return: PoolMember
+        """
+        member = self.acquire(timeout=timeout)
+        healthy = False
+        try:
+            yield member
+            healthy = True
+        finally:
+            self.giveback(member, healthy=healthy)
+
+    def _usable(self, member: PoolMember) -> bool:
+        if member.lost:
+            self.logger.warning(f'pool: {member.serial} allocation lost')
+            return False
+        try:
+            state = member.adb.probe()
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.warning(f'pool: {member.serial} adb probe fails: {error}')
+            return False
+        if state != 'device':
+            self.logger.warning(f'pool: {member.serial} adb state {state}')
+            return False
+        return True
+
+    def _renew(self, member: PoolMember) -> bool:
+        # adb traffic counts as device usage and keeps allocation alive while pooled
+        alive = self.client.renew(member.device, activity=lambda item: member.adb.execute('shell true', verify=False))
+        if not alive:
+            member.lost = True
+        return alive
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='stf-pool-setup') as executor:
+            while not self._stopped.is_set():
+                with self._lock:
+                    missing = self.size - self._members
+                    self._members += max(0, missing)
+                if missing > 0:
+                    self.logger.debug(f'pool: setting up {missing} devices')
+                    list(executor.map(self._add_member, range(missing)))
+                self._wakeup.wait(self.refill_interval)
+                self._wakeup.clear()
+
+    def _add_member(self, _index):
+        try:
+            member = self._create()
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.warning(f'pool: device setup fails: {error}')
+            with self._lock:
+                self._members -= 1
+            return
+        if self._stopped.is_set():
+            self._retire(member)
+            return
+        self.logger.info(f'pool: ready {member}')
+        self._idle.put(member)
+
+    def _create(self) -> PoolMember:
+        client = self.client
+        device = client.find_wait_and_allocate(requirements=self.requirements,
+                                               wait_timeout=self.wait_timeout,
+                                               timeout_seconds=self.timeout_seconds)
+        adb = appium = None
+        try:
+            device['remote_adb_url'] = client.remote_connect(device)
+            adb = AdbServer(device['remote_adb_url'], port=0, health=client.health, serial=device.get('serial'),
+                            shared=self.shared_adb)
+            started = time.monotonic()
+            adb.connect()
+            if client.scorer:
+                client.scorer.record_latency(device.get('serial'), time.monotonic() - started)
+            if self.start_appium:
+                appium = AppiumServer(appium_args=self.appium_args)
+                appium.start()
+            member = PoolMember(device, adb, appium)
+            client.heartbeat.add(device, renew=lambda item: self._renew(member))
+            return member
+        except BaseException:
+            self._teardown(device, adb, appium)
+            raise
+
+    def _retire(self, member: PoolMember):
+        self.logger.info(f'pool: retire {member}')
+        self._teardown(member.device, member.adb, member.appium, release=not member.lost)
+        with self._lock:
+            self._members -= 1
+        self._wakeup.set()
+
+    def _teardown(self, device: dict, adb: AdbServer = None, appium: AppiumServer = None, release: bool = True):
+        try:
+            if appium and appium.service.is_running:
+                appium.stop()
+            if adb and adb.connected:
+                adb.kill()
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.warning(f"pool: {device.get('serial')} teardown fails: {error}")
+        if not release:
+            return
+        try:
+            self.client.release(device)
+        except Exception as error:  # pylint: disable=broad-except
+            self.logger.error(f"pool: {device.get('serial')} releasing fails: {error}")
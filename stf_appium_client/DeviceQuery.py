@@ -0,0 +1,324 @@
+import re
+import json
+import functools
+from typing import Union
+
+MISSING = object()
+
+# key, operator and value of single expression clause
+_CLAUSE_RE = re.compile(r'^\s*([^=!<>~\s]+)\s*(>=|<=|!=|==|~=|=|>|<|\s+in\s+)\s*(.*?)\s*$')
+_VERSION_RE = re.compile(r'^\d+(\.\d+)*$')
+
+
+def resolve(device: dict, path: tuple):
+    """
+    Resolve dotted path value from device dictionary
+    :param device: device dictionary
+    :param path: tuple of keys, e.g. ('group', 'name')
+    :return: value or MISSING
+    """
+    value = device
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return MISSING
+        value = value[key]
+    return value
+
+
+def _ordinal(value):
+    """
+    Convert value to comparable form. Numbers and version like
+    strings ("10", "7.1.2") are compared numerically.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return (value,)
+    if isinstance(value, str):
+        if _VERSION_RE.match(value):
+            return tuple(int(part) for part in value.split('.'))
+        return value
+    return None
+
+
+def _equal(actual, expected) -> bool:
+    """ Equality which follows pydash `matches` semantics for lists """
+    if isinstance(expected, list) and isinstance(actual, list):
+        return all(item in actual for item in expected)
+    return actual == expected
+
+
+def _loose_equal(actual, expected) -> bool:
+    """ Equality for values parsed from text where expected is always string """
+    if _equal(actual, expected):
+        return True
+    if not isinstance(expected, str):
+        return False
+    if actual is None:
+        return expected.lower() in ('null', 'none')
+    if isinstance(actual, bool):
+        return expected.lower() == str(actual).lower()
+    if isinstance(actual, (int, float)):
+        return str(actual) == expected
+    return False
+
+
+def _compare(actual, expected, op) -> bool:
+    left, right = _ordinal(actual), _ordinal(expected)
+    if left is None or right is None or type(left) is not type(right):
+        return False
+    if op == '>=':
+        return left >= right
+    if op == '<=':
+        return left <= right
+    if op == '>':
+        return left > right
+    return left < right
+
+
+class Clause:
+    """
+    Single compiled predicate against one (dotted) device field
+    """
+
+    def __init__(self, field: str, op: str, value, loose: bool = False):
+        """
+        Clause constructor
+        :param field: device field, dotted path for nested values e.g. `group.name`
+        :param op: one of ==, !=, >=, <=, >, <, in, ~=
+        :param value: expected value
+        :param loose: compare scalars by their string form (values parsed from text)
+        """
+        assert op in ('==', '!=', '>=', '<=', '>', '<', 'in', '~='), f'Invalid operator: {op}'
+        self.field = field
+        self.op = op
+        self.value = value
+        self.path = tuple(field.split('.'))
+        self._equal = _loose_equal if loose else _equal
+        try:
+            self._regex = re.compile(value) if op == '~=' else None
+        except re.error as error:
+            raise ValueError(f'invalid regex in {field + op + str(value)!r}: {error}') from None
+
+    @property
+    def indexable(self) -> bool:
+        """ True when clause can be answered from DeviceIndex """
+        if self.op != '==' or self._equal is _loose_equal:
+            return False
+        try:
+            hash(self.value)
+        except TypeError:
+            return False
+        return True
+
+    def __call__(self, device: dict) -> bool:
+        actual = resolve(device, self.path)
+        if actual is MISSING:
+            return self.op == '!='
+        if self.op == '==':
+            return self._equal(actual, self.value)
+        if self.op == '!=':
+            return not self._equal(actual, self.value)
+        if self.op == 'in':
+            return any(self._equal(actual, item) for item in self.value)
+        if self.op == '~=':
+            return isinstance(actual, str) and self._regex.search(actual) is not None
+        return _compare(actual, self.value, self.op)
+
+    def __repr__(self):
+        return f'{self.field}{self.op if self.op != "in" else " in "}{self.value}'
+
+
+class DeviceIndex:
+    """
+    Per attribute hash index over one device inventory snapshot.
+    Attribute indexes are built lazily on first lookup.
+    """
+
+    def __init__(self, devices: list):
+        self.devices = devices
+        self._indexes = dict()
+
+    def lookup(self, path: tuple, value):
+        """
+        Lookup device positions having given value
+        :param path: attribute path
+        :param value: hashable value
+        :return: set of positions or None if attribute is not indexable
+        """
+        index = self._indexes.get(path, MISSING)
+        if index is MISSING:
+            index = self._build(path)
+            self._indexes[path] = index
+        if index is None:
+            return None
+        return index.get(value, set())
+
+    def _build(self, path: tuple):
+        index = dict()
+        for position, device in enumerate(self.devices):
+            value = resolve(device, path)
+            if value is MISSING:
+                continue
+            try:
+                index.setdefault(value, set()).add(position)
+            except TypeError:
+                return None
+        return index
+
+
+class DeviceQuery:
+    """
+    Compiled device requirements.
+
+    Query can be constructed from requirements dictionary (equality, nested
+    dictionaries are matched by dotted paths) or from expression string, e.g.
+    `platform=Android&sdk>=29&version in [10, 11]&model~=^Pixel`
+    """
+
+    def __init__(self, clauses: list = None):
+        self.clauses = list(clauses or [])
+
+    @classmethod
+    def create(cls, requirements: Union['DeviceQuery', dict, str, None]) -> 'DeviceQuery':
+        """
+        Create query from any supported requirements representation
+        :param requirements: DeviceQuery, dictionary or expression string
+        :return: DeviceQuery
+        """
+        if isinstance(requirements, DeviceQuery):
+            return requirements
+        if requirements is None:
+            return cls()
+        if isinstance(requirements, str):
+            return cls.compile(requirements)
+        assert isinstance(requirements, dict), 'Invalid requirements type'
+        return cls.from_requirements(requirements)
+
+    @staticmethod
+    def compile(requirements: str) -> 'DeviceQuery':
+        """
+        Compile requirements string, either json dictionary or expression.
+        Compiled queries are cached by string, so repeated polling reuses same predicates.
+        Returned query is shared and must not be modified.
+        :param requirements: e.g. `{"platform": "Android"}` or `platform=Android&sdk>=29`
+        :return: DeviceQuery
+        :raises ValueError: invalid requirements
+        """
+        return _compile(requirements)
+
+    @classmethod
+    def from_requirements(cls, requirements: dict) -> 'DeviceQuery':
+        """
+        Create equality query from requirements dictionary
+        :param requirements: e.g. `dict(platform='Android', group=dict(name='ci'))`
+        :return: DeviceQuery
+        """
+        clauses = []
+
+        def flatten(prefix, value):
+            if isinstance(value, dict) and value:
+                for key, sub_value in value.items():
+                    flatten(f'{prefix}.{key}' if prefix else key, sub_value)
+            else:
+                clauses.append(Clause(prefix, '==', value))
+        for key, value in requirements.items():
+            flatten(key, value)
+        return cls(clauses)
+
+    @classmethod
+    def parse(cls, expression: str) -> 'DeviceQuery':
+        """
+        Parse expression string. Clauses are separated by `&`.
+        Supported operators: =, ==, !=, >=, <=, >, <, in [..], ~= (regex search)
+        :param expression: e.g. `sdk>=29&model~=^Pixel`
+        :return: DeviceQuery
+        :raises ValueError: invalid expression
+        """
+        clauses = []
+        for part in filter(None, (item.strip() for item in expression.split('&'))):
+            match = _CLAUSE_RE.match(part)
+            if not match:
+                raise ValueError(f'invalid clause: {part}')
+            key, op, value = match.group(1), match.group(2).strip(), match.group(3)
+            if not value:
+                raise ValueError('value or key missing')
+            if op == '=':
+                op = '=='
+            if op == 'in':
+                value = cls._parse_list(value)
+            clauses.append(Clause(key, op, value, loose=True))
+        return cls(clauses)
+
+    @staticmethod
+    def _parse_list(value: str) -> list:
+        if not (value.startswith('[') and value.endswith(']')):
+            raise ValueError(f'list expected: {value}')
+        try:
+            items = json.loads(value)
+        except json.decoder.JSONDecodeError:
+            items = [item.strip().strip('"\'') for item in value[1:-1].split(',')]
+        return [item if isinstance(item, str) else json.dumps(item) for item in items if item != '']
+
+    def merge(self, other: Union['DeviceQuery', dict, str]) -> 'DeviceQuery':
+        """
+        Combine two queries, both needs to match
+        :param other: query or requirements
+        :return: new DeviceQuery
+        """
+        return DeviceQuery(self.clauses + DeviceQuery.create(other).clauses)
+
+    @property
+    def fields(self) -> list:
+        """ Device fields that query needs """
+        return list(dict.fromkeys(clause.field for clause in self.clauses))
+
+    def matches(self, device: dict) -> bool:
+        """
+        Check if device fulfills all clauses
+        :param device: device dictionary
+        :return: bool
+        """
+        return all(clause(device) for clause in self.clauses)
+
+    def filter(self, devices: list, index: DeviceIndex = None) -> list:
+        """
+        Filter devices matching to query
+        :param devices: list of device dictionaries
+        :param index: optional index built for same devices list
+        :return: list of matching devices, in original order
+        """
+        if index is None or index.devices is not devices:
+            return [device for device in devices if self.matches(device)]
+
+        candidates = None
+        remaining = []
+        for clause in self.clauses:
+            positions = index.lookup(clause.path, clause.value) if clause.indexable else None
+            if positions is None:
+                remaining.append(clause)
+                continue
+            candidates = positions if candidates is None else candidates & positions
+            if not candidates:
+                return []
+        positions = range(len(devices)) if candidates is None else sorted(candidates)
+        return [devices[position] for position in positions
+                if all(clause(devices[position]) for clause in remaining)]
+
+    def __repr__(self):
+        return '&'.join(repr(clause) for clause in self.clauses)
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(requirements: str) -> DeviceQuery:
+    text = requirements.strip()
+    if text.startswith('{'):
+        try:
+            data = json.loads(text)
+        except json.decoder.JSONDecodeError as error:
+            raise ValueError(f'invalid requirements json: {error}') from None
+        return DeviceQuery.from_requirements(data)
+    query = DeviceQuery.parse(text)
+    if text and not query.clauses:
+        raise ValueError('no requirements given')
+    return query
@@ -0,0 +1,194 @@
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+
+from stf_appium_client.DeviceQuery import resolve
+
+
+class ScoringFactor(ABC):
+    """
+    Base class for device scoring factors.
+    Factor gives each candidate a goodness value between 0 (worst) and 1 (best).
+    """
+    # device fields needed by factor, requested from STF in addition to default fields
+    fields = []
+
+    @abstractmethod
+    def scores(self, devices: list) -> list:
+        """
+        Score candidates
+        :param devices: list of device dictionaries
+        :return: list of goodness values in same order
+        """
+
+    def record_allocation(self, serial: str, success: bool) -> None:
+        """ Allocation outcome of device """
+
+    def record_latency(self, serial: str, seconds: float) -> None:
+        """ Measured connect latency of device """
+
+
+class AllocationFailures(ScoringFactor):
+    """
+    Penalize devices which recently failed to be allocated. Failures decay with given half life.
+    StfClient does not report contention (device taken by someone else first) as failure.
+    """
+
+    def __init__(self, half_life: float = 600):
+        """
+        :param half_life: seconds after which failure counts half
+        """
+        self.half_life = half_life
+        self._failures = dict()
+        self._lock = threading.Lock()
+
+    def _decayed(self, serial: str, now: float) -> float:
+        count, updated = self._failures.get(serial, (0.0, now))
+        return count * math.pow(0.5, (now - updated) / self.half_life)
+
+    def record_allocation(self, serial: str, success: bool) -> None:
+        with self._lock:
+            if success:
+                self._failures.pop(serial, None)
+                return
+            now = time.monotonic()
+            self._failures[serial] = (self._decayed(serial, now) + 1, now)
+
+    def scores(self, devices: list) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [1 / (1 + self._decayed(device.get('serial'), now)) for device in devices]
+
+
+class ConnectLatency(ScoringFactor):
+    """
+    Prefer devices with low adb connect latency (exponential moving average).
+    Devices without measurements are not penalized.
+    """
+
+    def __init__(self, reference: float = 1.0, alpha: float = 0.3):
+        """
+        :param reference: latency in seconds which halves goodness
+        :param alpha: weight of newest sample
+        """
+        self.reference = reference
+        self.alpha = alpha
+        self._latency = dict()
+        self._lock = threading.Lock()
+
+    def record_latency(self, serial: str, seconds: float) -> None:
+        with self._lock:
+            previous = self._latency.get(serial)
+            self._latency[serial] = seconds if previous is None else \
+                self.alpha * seconds + (1 - self.alpha) * previous
+
+    def scores(self, devices: list) -> list:
+        with self._lock:
+            return [1 / (1 + self._latency.get(device.get('serial'), 0.0) / self.reference) for device in devices]
+
+
+class ProviderLoad(ScoringFactor):
+    """
+    Spread allocations between STF providers: prefer providers which have most free candidates.
+    """
+    fields = ['provider.name']
+
+    def scores(self, devices: list) -> list:
+        providers = [resolve(device, ('provider', 'name')) for device in devices]
+        free = Counter(providers)
+        most = max(free.values(), default=1)
+        return [free[provider] / most for provider in providers]
+
+
+class BatteryHealth(ScoringFactor):
+    """
+    Prefer charged and cool devices. Devices without battery information are not penalized.
+    """
+    fields = ['battery.level', 'battery.temp']
+
+    def __init__(self, max_temp: float = 40):
+        """
+        :param max_temp: temperature (celsius) above which device is penalized
+        """
+        self.max_temp = max_temp
+
+    def scores(self, devices: list) -> list:
+        result = []
+        for device in devices:
+            level = resolve(device, ('battery', 'level'))
+            temp = resolve(device, ('battery', 'temp'))
+            score = 1.0
+            if isinstance(level, (int, float)):
+                score *= max(0.0, min(level, 100)) / 100
+            if isinstance(temp, (int, float)) and temp > self.max_temp:
+                score *= max(0.0, 1 - (temp - self.max_temp) / 10)
+            result.append(score)
+        return result
+
+
+class DeviceScorer:
+    """
+    Ranks allocation candidates by weighted sum of scoring factors so that the device
+    most likely to be allocated successfully and to perform well is tried first.
+    """
+
+    def __init__(self, factors: list = None):
+        """
+        DeviceScorer constructor
+        :param factors: list of (ScoringFactor, weight) tuples.
+                        Default: allocation failures, connect latency, provider load and battery health
+        """
+        self.factors = factors if factors is not None else [
+            (AllocationFailures(), 1.0),
+            (ConnectLatency(), 1.0),
+            (ProviderLoad(), 0.5),
+            (BatteryHealth(), 0.5)]
+
+    @property
+    def fields(self) -> list:
+        """ Device fields needed by factors """
+        return sorted({field for factor, _ in self.factors for field in factor.fields})
+
+    def score(self, devices: list) -> list:
+        """
+        Score candidates
+        :param devices: list of device dictionaries
+        :return: list of scores in same order, higher is better
+        """
+        totals = [0.0] * len(devices)
+        for factor, weight in self.factors:
+            for index, value in enumerate(factor.scores(devices)):
+                totals[index] += weight * value
+        return totals
+
+    def rank(self, devices: list) -> list:
+        """
+        Order candidates by descending score. Order of equal devices is kept
+        :param devices: list of device dictionaries
+        :return: ordered list of devices
+        """
+        scores = self.score(devices)
+        order = sorted(range(len(devices)), key=lambda index: -scores[index])
+        return [devices[index] for index in order]
+
+    def record_allocation(self, serial: str, success: bool) -> None:
+        """
+        Feed allocation outcome to factors
+        :param serial: device serial
+        :param success: True when allocation succeeded
+        :return: None
+        """
+        for factor, _ in self.factors:
+            factor.record_allocation(serial, success)
+
+    def record_latency(self, serial: str, seconds: float) -> None:
+        """
+        Feed measured connect latency to factors
+        :param serial: device serial
+        :param seconds: latency
+        :return: None
+        """
+        for factor, _ in self.factors:
+            factor.record_latency(serial, seconds)
@@ -0,0 +1,231 @@
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from stf_appium_client.Logger import Logger
+
+API_PREFIX = '/api/v1'
+
+
+def generate_devices(count: int, seed: int = 0) -> list:
+    """
+    Generate simulated STF devices
+    :param count: number of devices
+    :param seed: random seed for reproducible fleet
+    :return: list of device dictionaries
+    """
+    rnd = random.Random(seed)
+    models = [('Google', 'Pixel 5', 'Pixel 5'), ('samsung', 'SM-G991B', 'Galaxy S21'),
+              ('OnePlus', 'IN2013', 'OnePlus 8'), ('Xiaomi', 'M2007J3SY', 'Mi 10T')]
+    versions = [('9', '28'), ('10', '29'), ('11', '30'), ('12', '31'), ('13', '33')]
+    devices = []
+    for index in range(count):
+        manufacturer, model, market_name = rnd.choice(models)
+        version, sdk = rnd.choice(versions)
+        devices.append(dict(
+            serial=f'FAKE{index:05d}', manufacturer=manufacturer, model=model, marketName=market_name,
+            platform='Android', version=version, sdk=sdk, present=True, ready=True, using=False,
+            owner=None, status=3, note='', group=dict(name=f'group{index % 4}'),
+            battery=dict(level=rnd.randint(10, 100), temp=rnd.randint(20, 45)),
+            provider=dict(name=f'provider{index % 8}')))
+    return devices
+
+
+def project(device: dict, fields: list) -> dict:
+    """ Pick requested (dotted) fields from device """
+    if not fields:
+        return dict(device)
+    result = dict()
+    for field in fields:
+        source, target = device, result
+        keys = field.split('.')
+        for key in keys[:-1]:
+            if not isinstance(source.get(key), dict):
+                source = None
+                break
+            source = source[key]
+            target = target.setdefault(key, dict())
+        if source is not None and keys[-1] in source:
+            target[keys[-1]] = source[keys[-1]]
+    return result
+
+
+class FakeStfServer(Logger):
+    """
+    Local stand-in for STF REST API, intended for tests and benchmarks.
+    Implements device listing, user device allocation, release and remote connect.
+    Allocations expire after their timeout unless device is used, see touch.
+    """
+
+    def __init__(self, devices=100, latency: float = 0, contention: float = 0, port: int = 0):
+        """
+        FakeStfServer constructor
+        :param devices: list of device dictionaries or number of generated devices
+        :param latency: delay in seconds added to every request
+        :param contention: probability (0..1) that allocation fails as if someone else took the device
+        :param port: listen port, 0 = first free one
+        """
+        super().__init__()
+        self.devices = {device['serial']: device for device in
+                        (generate_devices(devices) if isinstance(devices, int) else devices)}
+        self.latency = latency
+        self.contention = contention
+        self.requests = 0
+        # serial -> (timeout, expiry time) of allocations made with timeout
+        self._timeouts = dict()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """ Server address to be given for StfClient """
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> None:
+        """ Start serving in background thread """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-stf', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stop server """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def touch(self, serial: str) -> bool:
+        """
+        Simulate device usage, e.g. adb activity, which resets allocation timeout
+        :param serial: device serial
+        :return: True if device is still allocated
+        """
+        with self._lock:
+            self._expire()
+            if serial not in self._timeouts:
+                return bool(self.devices[serial]['owner'])
+            timeout, _ = self._timeouts[serial]
+            self._timeouts[serial] = (timeout, time.monotonic() + timeout)
+            return True
+
+    def _expire(self):
+        now = time.monotonic()
+        for serial, (_, expires) in list(self._timeouts.items()):
+            if expires <= now:
+                self.logger.debug(f'fake-stf: {serial} allocation timed out')
+                self.devices[serial].update(owner=None, using=False)
+                del self._timeouts[serial]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are written separately, avoid delayed ACK stalls on keep-alive connections
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                server.logger.debug(f'fake-stf: {format % args}')
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def do_DELETE(self):
+                self._dispatch('DELETE')
+
+            def _dispatch(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                url = urlparse(self.path)
+                token = self.headers.get('Authorization', '').replace('Bearer ', '')
+                status, body = server.handle(method, url.path, parse_qs(url.query), token)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def handle(self, method: str, path: str, query: dict, token: str):
+        """
+        Handle API request
+        :return: tuple of http status and json body
+        """
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self._expire()
+        if not token:
+            return 401, dict(success=False, description='Unauthorized')
+        owner = dict(email=f'{token}@fake', name=token)
+        fields = [field for field in query.get('fields', [''])[0].split(',') if field]
+        path = path[len(API_PREFIX):] if path.startswith(API_PREFIX) else path
+
+        if method == 'GET' and path == '/devices':
+            with self._lock:
+                devices = [project(device, fields) for device in self.devices.values()]
+            return 200, dict(success=True, description='Devices Information', devices=devices)
+        if method == 'GET' and path == '/user/devices':
+            with self._lock:
+                devices = [project(device, fields) for device in self.devices.values()
+                           if device['owner'] == owner]
+            return 200, dict(success=True, description='Controlled devices', devices=devices)
+
+        match = re.match(r'^(/user)?/devices/([^/]+)(/remoteConnect)?$', path)
+        if not match:
+            return 404, dict(success=False, description='Not Found')
+        user, serial, remote = match.groups()
+        with self._lock:
+            device = self.devices.get(serial)
+            if device is None:
+                return 404, dict(success=False, description='Device not found')
+            owned = device['owner'] == owner
+            if not user:
+                if method != 'GET':
+                    return 405, dict(success=False, description='Method not allowed')
+                return 200, dict(success=True, description='Device Information', device=project(device, fields))
+            if method == 'POST' and not remote:
+                available = device['present'] and device['ready'] and not device['using'] and not device['owner']
+                if not available or random.random() < self.contention:
+                    return 403, dict(success=False, description='Forbidden (device is not available)')
+                device.update(owner=owner, using=True)
+                if query.get('timeout'):
+                    timeout = int(query['timeout'][0]) / 1000
+                    self._timeouts[serial] = (timeout, time.monotonic() + timeout)
+                return 200, dict(success=True, description='Device successfully added')
+            if not owned:
+                return 404, dict(success=False, description='Device is not owned by you')
+            if method == 'GET' and not remote:
+                return 200, dict(success=True, description='Device Information', device=project(device, fields))
+            if method == 'DELETE' and not remote:
+                device.update(owner=None, using=False)
+                self._timeouts.pop(serial, None)
+                return 200, dict(success=True, description='Device successfully removed')
+            if method == 'POST':
+                port = 7400 + list(self.devices).index(serial) % 1000
+                return 200, dict(success=True, description='Device remote connected successfully',
+                                 remoteConnectUrl=f'127.0.0.1:{port}')
+            if method == 'DELETE':
+                return 200, dict(success=True, description='Device remote disconnected successfully')
+        return 405, dict(success=False, description='Method not allowed')
@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+
+from stf_appium_client.DeviceScorer import ScoringFactor
+from stf_appium_client.Logger import Logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    serial TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    latency REAL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_serial_time ON events (serial, time);
+CREATE TABLE IF NOT EXISTS quarantine (
+    serial TEXT PRIMARY KEY,
+    until REAL NOT NULL,
+    reason TEXT
+);
+"""
+
+
+class HealthStore(ScoringFactor, Logger):
+    """
+    Persistent per device health history (sqlite).
+    Outcomes and latencies of allocate, remote_connect and adb connect are recorded per serial.
+    Device is quarantined after `max_failures` consecutive failures within `window` seconds.
+    Quarantined devices are tried last by StfClient. Same file can be shared between processes.
+    Can be used as DeviceScorer factor as well.
+    """
+
+    def __init__(self, filename: str = ':memory:', max_failures: int = 3, window: float = 3600,
+                 quarantine_seconds: float = 1800, max_age: float = 7 * 24 * 3600):
+        """
+        HealthStore constructor
+        :param filename: sqlite database file, ':memory:' keeps history only in this process
+        :param max_failures: consecutive failures which quarantine device
+        :param window: seconds within failures are counted
+        :param quarantine_seconds: quarantine duration
+        :param max_age: events older than this are pruned when store is opened
+        """
+        super().__init__()
+        self.filename = filename
+        self.max_failures = max_failures
+        self.window = window
+        self.quarantine_seconds = quarantine_seconds
+        self._lock = threading.Lock()
+        self._memory = None
+        if filename == ':memory:':
+            # in memory database lives as long as its connection
+            self._memory = sqlite3.connect(filename, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+            connection.execute('DELETE FROM events WHERE time < ?', (time.time() - max_age,))
+
+    @contextmanager
+    def _connect(self):
+        with self._lock:
+            if self._memory:
+                with self._memory:
+                    yield self._memory
+                return
+            with closing(sqlite3.connect(self.filename, timeout=10)) as connection:
+                with connection:
+                    yield connection
+
+    def record(self, serial: str, operation: str, success: bool, latency: float = None) -> None:
+        """
+        Record operation outcome
+        :param serial: device serial
+        :param operation: e.g. `allocate`, `remote_connect`, `adb_connect`
+        :param success: True when operation succeeded
+        :param latency: operation duration in seconds
+        :return: None
+        """
+        now = time.time()
+        try:
+            with self._connect() as connection:
+                connection.execute('INSERT INTO events VALUES (?, ?, ?, ?, ?)',
+                                   (serial, operation, int(bool(success)), latency, now))
+                if success:
+                    return
+                failures = self._failure_streak(connection, serial, now)
+                if failures >= self.max_failures:
+                    self.logger.warning(f'{serial}: quarantined for {self.quarantine_seconds}s '
+                                        f'after {failures} failures ({operation})')
+                    connection.execute('INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?)',
+                                       (serial, now + self.quarantine_seconds,
+                                        f'{failures} consecutive failures, last: {operation}'))
+        except sqlite3.Error as error:
+            # health history is advisory, never break allocation because of it
+            self.logger.warning(f'{serial}: health record fails: {error}')
+
+    def _failure_streak(self, connection, serial: str, now: float) -> int:
+        last_success = connection.execute(
+            'SELECT MAX(time) FROM events WHERE serial = ? AND success = 1', (serial,)).fetchone()[0]
+        since = max(now - self.window, last_success or 0)
+        return connection.execute(
+            'SELECT COUNT(*) FROM events WHERE serial = ? AND success = 0 AND time >= ?',
+            (serial, since)).fetchone()[0]
+
+    def quarantined(self) -> dict:
+        """
+        Get devices in quarantine
+        :return: {serial: quarantine end time (epoch)}
+        """
+        try:
+            with self._connect() as connection:
+                rows = connection.execute('SELECT serial, until FROM quarantine WHERE until > ?',
+                                          (time.time(),)).fetchall()
+        except sqlite3.Error as error:
+            self.logger.warning(f'health query fails: {error}')
+            return dict()
+        return dict(rows)
+
+    def is_quarantined(self, serial: str) -> bool:
+        """ Check if device is in quarantine """
+        return serial in self.quarantined()
+
+    def release_quarantine(self, serial: str) -> None:
+        """
+        Release device from quarantine, e.g. after it has been fixed
+        :param serial: device serial
+        :return: None
+        """
+        with self._connect() as connection:
+            connection.execute('DELETE FROM quarantine WHERE serial = ?', (serial,))
+            # failures before this point are forgiven
+            connection.execute('DELETE FROM events WHERE serial = ? AND success = 0', (serial,))
+
+    def stats(self, serial: str) -> dict:
+        """
+        Get device statistics
+        :param serial: device serial
+        :return: {operation: dict(successes, failures, latency)} where latency is average of successes
+        """
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT operation, SUM(success), SUM(1 - success), AVG(CASE WHEN success THEN latency END) '
+                'FROM events WHERE serial = ? GROUP BY operation', (serial,)).fetchall()
+        return {operation: dict(successes=successes, failures=failures, latency=latency)
+                for operation, successes, failures, latency in rows}
+
+    def deprioritize(self, devices: list) -> list:
+        """
+        Move quarantined devices to the end, order is kept otherwise
+        :param devices: list of device dictionaries
+        :return: ordered list of devices
+        """
+        quarantined = self.quarantined()
+        if not quarantined:
+            return devices
+        return [device for device in devices if device.get('serial') not in quarantined] + \
+               [device for device in devices if device.get('serial') in quarantined]
+
+    def scores(self, devices: list) -> list:
+        """ ScoringFactor: quarantined devices get 0, others are penalized by recent failures """
+        now = time.time()
+        quarantined = self.quarantined()
+        try:
+            with self._connect() as connection:
+                failures = dict(connection.execute(
+                    'SELECT serial, COUNT(*) FROM events WHERE success = 0 AND time >= ? GROUP BY serial',
+                    (now - self.window,)).fetchall())
+        except sqlite3.Error as error:
+            self.logger.warning(f'health query fails: {error}')
+            failures = dict()
+        return [0.0 if device.get('serial') in quarantined else 1 / (1 + failures.get(device.get('serial'), 0))
+                for device in devices]
@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class InventoryCache:
+    """
+    Time based cache for device inventory snapshots.
+    Entries are keyed by requested field set and expire after `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = 0):
+        """
+        Inventory cache constructor
+        :param ttl: time to live in seconds. 0 disables caching
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """ True when caching is in use """
+        return self.ttl > 0
+
+    def get(self, key):
+        """
+        Get cached value
+        :param key: cache key
+        :return: cached value or None when missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() < entry[0]:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            self._entries.pop(key, None)
+            return None
+
+    def set(self, key, value) -> None:
+        """
+        Store value to cache
+        :param key: cache key
+        :param value: value to be cached
+        :return: None
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self) -> None:
+        """ Drop all cached entries """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Get cache statistics
+        :return: dictionary with hits, misses and size
+        """
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._entries))
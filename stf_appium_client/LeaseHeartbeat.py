@@ -0,0 +1,88 @@
+import threading
+
+from stf_appium_client.Logger import Logger
+
+
+class LeaseHeartbeat(Logger):
+    """
+    Background thread which periodically renews device allocations.
+    STF resets allocation timeout only when device is used, so renewals which use
+    the device (e.g. adb command over remote connection) allow short allocation
+    timeouts: healthy jobs keep devices while crashed jobs free them quickly.
+    """
+
+    def __init__(self, renew=None, interval: float = 60, on_lost=None):
+        """
+        LeaseHeartbeat constructor
+        :param renew: default callable(device) -> bool which renews allocation,
+                      e.g. StfClient.renew with adb activity (STF treats adb activity as device usage)
+        :param interval: renewal interval in seconds. Should be clearly shorter than allocation timeout
+        :param on_lost: callable(device) called when renewal fails
+        """
+        super().__init__()
+        self.interval = interval
+        self._renew = renew
+        self._on_lost = on_lost
+        self._devices = dict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._devices)
+
+    def add(self, device: dict, renew=None) -> None:
+        """
+        Start renewing device allocation. Background thread is started on demand
+        :param device: device dictionary
+        :param renew: callable(device) -> bool, overrides default renew
+        :return: None
+        """
+        renew = renew or self._renew
+        assert callable(renew), 'renew callable missing'
+        with self._lock:
+            self._devices[device.get('serial')] = (device, renew)
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='stf-heartbeat', daemon=True)
+                self._thread.start()
+
+    def remove(self, device: dict) -> None:
+        """
+        Stop renewing device allocation
+        :param device: device dictionary
+        :return: None
+        """
+        with self._lock:
+            self._devices.pop(device.get('serial'), None)
+
+    def stop(self) -> None:
+        """ Stop background thread """
+        self._stop.set()
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join()
+
+    def beat(self) -> None:
+        """ Renew all devices once """
+        with self._lock:
+            entries = list(self._devices.values())
+        for device, renew in entries:
+            serial = device.get('serial')
+            try:
+                renewed = renew(device)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.warning(f'{serial}: renewal fails: {error}')
+                # transient error, retry on next round
+                continue
+            if renewed:
+                self.logger.debug(f'{serial}: allocation renewed')
+                continue
+            self.logger.error(f'{serial}: allocation lost')
+            self.remove(device)
+            if self._on_lost:
+                self._on_lost(device)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.beat()
@@ -0,0 +1,138 @@
+import atexit
+import signal
+import threading
+import time
+
+from stf_appium_client.Logger import Logger
+
+# registries which hold leases, referenced until their leases are gone so that
+# devices of dropped clients are still released at exit
+_HOLDING = set()
+
+
+class LeaseRegistry(Logger):
+    """
+    Registry of active device allocations (leases).
+    Outstanding leases are released concurrently at interpreter exit
+    and optionally when SIGTERM is received.
+    Single dict operations are atomic, so no lock is taken and signal handler
+    cannot deadlock with interrupted add or remove.
+    """
+
+    def __init__(self, release, max_workers: int = 8, exit_timeout: float = 30):
+        """
+        LeaseRegistry constructor
+        :param release: callable(device) which releases device
+        :param max_workers: max parallel releases
+        :param exit_timeout: deadline in seconds for releasing leases at exit
+        """
+        super().__init__()
+        self._release = release
+        self._max_workers = max_workers
+        self.exit_timeout = exit_timeout
+        self._leases = dict()
+
+    def __len__(self):
+        return len(self._leases)
+
+    def __contains__(self, device: dict):
+        return device.get('serial') in self._leases
+
+    @property
+    def leases(self) -> list:
+        """ Get list of leased devices """
+        return list(self._leases.values())
+
+    def add(self, device: dict) -> None:
+        """
+        Register allocated device
+        :param device: device dictionary
+        :return: None
+        """
+        self._leases[device.get('serial')] = device
+        _HOLDING.add(self)
+
+    def remove(self, device: dict) -> None:
+        """
+        Unregister released device
+        :param device: device dictionary
+        :return: None
+        """
+        self._leases.pop(device.get('serial'), None)
+        self._forget_if_empty()
+
+    def release_all(self, timeout: float = None) -> list:
+        """
+        Release all outstanding leases concurrently
+        :param timeout: deadline in seconds, None waits until all releases are done
+        :return: list of devices which could not be released before deadline
+        """
+        leases = self.leases
+        if not leases:
+            return []
+
+        # plain threads are used because executors refuse new work during interpreter shutdown
+        semaphore = threading.BoundedSemaphore(self._max_workers)
+
+        def release(device):
+            with semaphore:
+                try:
+                    self.logger.info(f"Release device {device.get('serial')}")
+                    self._release(device)
+                except Exception as error:  # pylint: disable=broad-except
+                    self.logger.error(f"{device.get('serial')}: releasing fails: {error}")
+
+        threads = {threading.Thread(target=release, args=(device,), name='stf-release', daemon=True): device
+                   for device in leases}
+        for thread in threads:
+            thread.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        not_done = [device for thread, device in threads.items() if thread.is_alive()]
+        if not_done:
+            self.logger.error(f'{len(not_done)} devices not released within {timeout}s')
+        return not_done
+
+    def clear(self) -> None:
+        """ Forget all leases without releasing them """
+        self._leases.clear()
+        self._forget_if_empty()
+
+    def _forget_if_empty(self):
+        if not self._leases:
+            _HOLDING.discard(self)
+            # lease added concurrently after emptiness check
+            if self._leases:
+                _HOLDING.add(self)
+
+    def install_signal_handler(self, signals=(signal.SIGTERM,)) -> None:
+        """
+        Release all leases when given signals are received.
+        Previously installed handler is called afterwards, default handler is
+        replaced by SystemExit. Must be called from main thread.
+        :param signals: signals to handle
+        :return: None
+        """
+        for signum in signals:
+            previous = signal.getsignal(signum)
+
+            def handler(received, frame, previous=previous):
+                self.logger.info(f'Signal {received} received, releasing devices')
+                self.release_all(timeout=self.exit_timeout)
+                if callable(previous):
+                    previous(received, frame)
+                elif previous != signal.SIG_IGN:
+                    raise SystemExit(128 + received)
+            signal.signal(signum, handler)
+
+    def _exit(self):
+        if self._leases:
+            self.logger.info(f"exit:Release {len(self._leases)} devices")
+            self.release_all(timeout=self.exit_timeout)
+
+
+@atexit.register
+def _release_at_exit():
+    for registry in list(_HOLDING):
+        registry._exit()
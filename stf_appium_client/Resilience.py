@@ -0,0 +1,220 @@
+import socket
+import threading
+import time
+
+import urllib3
+from stf_client.exceptions import ApiException, ServiceException, ForbiddenException, NotFoundException, \
+    UnauthorizedException
+
+from stf_appium_client.Logger import Logger
+from stf_appium_client.WaitStrategy import Backoff
+from stf_appium_client.exceptions import CircuitOpenError
+
+# http statuses which are worth of retrying
+TRANSIENT_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Check if error is caused by server or network hiccup (and not e.g. by device being in use)
+    :param error: raised exception
+    :return: True when call may succeed if retried
+    """
+    if isinstance(error, ServiceException):
+        return True
+    if isinstance(error, (ForbiddenException, NotFoundException, UnauthorizedException)):
+        return False
+    if isinstance(error, ApiException):
+        return not error.status or error.status in TRANSIENT_STATUSES
+    return isinstance(error, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError, socket.timeout))
+
+
+def is_connect_error(error: BaseException) -> bool:
+    """
+    Check if call failed before request was sent, so that retrying cannot repeat its effect
+    :param error: raised exception
+    :return: True when server did not receive request
+    """
+    if isinstance(error, urllib3.exceptions.MaxRetryError):
+        error = error.reason
+    return isinstance(error, (urllib3.exceptions.ConnectTimeoutError, ConnectionRefusedError))
+
+
+class RetryPolicy(Logger):
+    """
+    Retry transient API call failures with exponential backoff
+    """
+
+    def __init__(self, attempts: int = 3, backoff: Backoff = None, retry_on=is_transient):
+        """
+        RetryPolicy constructor
+        :param attempts: max number of attempts per call, 1 disables retries
+        :param backoff: delays between attempts, default: Backoff(initial=0.5, maximum=4)
+        :param retry_on: callable(error) -> bool which tells if error is retried
+        """
+        super().__init__()
+        assert attempts >= 1, 'attempts should be positive'
+        self.attempts = attempts
+        self.backoff = backoff or Backoff(initial=0.5, maximum=4)
+        self.retry_on = retry_on
+        self.retries = 0
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def call(self, name: str, func, *args, **kwargs):
+        """
+        Call func and retry transient failures
+        :param name: call name for logging
+        :param func: callable
+        :return: func return value
+        :raises: last error when attempts are exhausted or error is not retried
+        """
+        return self._call(self.retry_on, name, func, *args, **kwargs)
+
+    def call_non_idempotent(self, name: str, func, *args, **kwargs):
+        """
+        Call func which must not be repeated once server has received it, e.g. allocation.
+        Only transient failures which happened before request was sent are retried
+        :param name: call name for logging
+        :param func: callable
+        :return: func return value
+        :raises: last error when attempts are exhausted or error is not retried
+        """
+        return self._call(lambda error: is_connect_error(error) and self.retry_on(error), name, func, *args, **kwargs)
+
+    def _call(self, retry_on, name: str, func, *args, **kwargs):
+        delays = self.backoff.delays()
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except Exception as error:
+                if not retry_on(error):
+                    raise
+                if attempt == self.attempts:
+                    with self._lock:
+                        self.exhausted += 1
+                    raise
+                delay = next(delays)
+                with self._lock:
+                    self.retries += 1
+                self.logger.warning(f'{name}: attempt {attempt}/{self.attempts} fails ({error}), '
+                                    f'retry in {delay:.1f}s')
+                time.sleep(delay)
+        return None  # not reached
+
+    def stats(self) -> dict:
+        """
+        Get retry statistics
+        :return: dictionary with retries and exhausted (calls which failed after all attempts)
+        """
+        with self._lock:
+            return dict(retries=self.retries, exhausted=self.exhausted)
+
+
+class CircuitBreaker(Logger):
+    """
+    Stops calling server after consecutive transient failures. After `reset_timeout`
+    one trial call is let through (half-open): success closes circuit, failure opens it again.
+    Can be shared between clients using same server.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30, failure_on=is_transient):
+        """
+        CircuitBreaker constructor
+        :param failure_threshold: consecutive failures which open circuit
+        :param reset_timeout: seconds circuit stays open before trial call
+        :param failure_on: callable(error) -> bool which tells if error counts as server failure
+        """
+        super().__init__()
+        assert failure_threshold >= 1, 'failure_threshold should be positive'
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failure_on = failure_on
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+        self._stats = dict(calls=0, failures=0, rejected=0, opened=0)
+
+    def retry_after(self) -> float:
+        """ Seconds until circuit lets trial call through, 0 when closed """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def call(self, name: str, func, *args, **kwargs):
+        """
+        Call func through circuit
+        :param name: call name for logging
+        :param func: callable
+        :return: func return value
+        :raises CircuitOpenError: circuit is open
+        """
+        trial = self._before(name)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            self._after(not self.failure_on(error), trial)
+            raise
+        except BaseException:
+            # interrupted, outcome is unknown
+            self._after(None, trial)
+            raise
+        self._after(True, trial)
+        return result
+
+    def _before(self, name: str) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    self._stats['rejected'] += 1
+                    raise CircuitOpenError(f'{name}: circuit open, retry after {remaining:.1f}s', remaining)
+                self.state = self.HALF_OPEN
+                self.logger.info(f'{name}: circuit half-open, trial call')
+            elif self.state == self.HALF_OPEN and self._trial:
+                self._stats['rejected'] += 1
+                raise CircuitOpenError(f'{name}: circuit half-open, trial call in progress', 0.0)
+            self._trial = self.state == self.HALF_OPEN
+            self._stats['calls'] += 1
+            return self._trial
+
+    def _after(self, success, trial: bool):
+        with self._lock:
+            if trial:
+                self._trial = False
+            if success is None:
+                if trial:
+                    self.state = self.OPEN
+                    self._opened_at = time.monotonic()
+                return
+            if success:
+                if self.state != self.CLOSED:
+                    self.logger.info('circuit closed')
+                self.state = self.CLOSED
+                self._failures = 0
+                return
+            self._stats['failures'] += 1
+            self._failures += 1
+            if trial or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self._stats['opened'] += 1
+                    self.logger.error(f'circuit opened after {self._failures} failures, '
+                                      f'retry after {self.reset_timeout}s')
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        """
+        Get circuit statistics
+        :return: dictionary with state, calls, failures, rejected and opened
+        """
+        with self._lock:
+            return dict(state=self.state, **self._stats)
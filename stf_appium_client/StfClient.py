@@ -1,69 +1,225 @@
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import time
 import random
 import json
-from pydash import filter_, map_, wrap, find, uniq
-import atexit
+import socket
+from typing import Union
+from pydash import map_, wrap, find, uniq
 
-from stf_client.exceptions import ForbiddenException
+from stf_client.exceptions import ForbiddenException, NotFoundException
 
 from stf_appium_client.Logger import Logger
-from stf_appium_client.exceptions import DeviceNotFound, NotConnectedError
+from stf_appium_client.InventoryCache import InventoryCache
+from stf_appium_client.DeviceQuery import DeviceQuery, DeviceIndex
+from stf_appium_client.WaitStrategy import Backoff, DeviceNotifier
+from stf_appium_client.LeaseRegistry import LeaseRegistry
+from stf_appium_client.LeaseHeartbeat import LeaseHeartbeat
+from stf_appium_client.Timings import TIMINGS, timed
+from stf_appium_client.AffinityStore import AffinityStore
+from stf_appium_client.DeviceScorer import DeviceScorer
+from stf_appium_client.HealthStore import HealthStore
+from stf_appium_client.Resilience import RetryPolicy, CircuitBreaker, is_transient, is_connect_error
+from stf_appium_client.exceptions import DeviceNotFound, NotConnectedError, CircuitOpenError
 from stf_client.api_client import ApiClient, Configuration
 from stf_client.api.user_api import UserApi
 from stf_client.api.devices_api import DevicesApi
+from urllib3.connection import HTTPConnection
 
 STATUS_ONLINE = 3
+# fields describing device, always requested
+DEVICE_FIELDS = ['serial', 'manufacturer', 'model', 'marketName', 'platform', 'sdk', 'version']
+# fields needed to evaluate device availability
+AVAILABILITY_FIELDS = ['present', 'ready', 'using', 'owner', 'status']
+AVAILABLE = DeviceQuery.from_requirements(
+    dict(present=True, ready=True, using=False, owner=None, status=STATUS_ONLINE))
 
 
 class StfClient(Logger):
     DEFAULT_ALLOCATION_TIMEOUT_SECONDS = 900
+    # phase durations are recorded here, can be replaced per instance
+    timings = TIMINGS
 
-    def __init__(self, host: str):
+    def __init__(self, host: str, cache_ttl: float = 0, notifier: DeviceNotifier = None,
+                 affinity: AffinityStore = None, scorer: DeviceScorer = None,
+                 health: HealthStore = None,
+                 retry: RetryPolicy = None, circuit: CircuitBreaker = None):
         """
         STF Client constructor
         :param host: Server address of OpenSTF
+        :param cache_ttl: device inventory cache time to live in seconds. 0 disables cache
+        :param notifier: optional device change notifier which wakes up waiting allocations
+        :param affinity: store of recently used devices per affinity key, default: in memory store
+        :param scorer: optional candidate ranking, applied after shuffle. Learns from allocation outcomes
+        :param health: optional device health history, quarantined devices are tried last
+        :param retry: retry policy for transient API failures, default: RetryPolicy()
+        :param circuit: circuit breaker for API calls, can be shared between clients. default: CircuitBreaker()
         """
         super().__init__()
         self._client = None
+        self._user_api = None
+        self._devices_api = None
         self._app = None
         self._host = host
+        self.cache = InventoryCache(ttl=cache_ttl)
+        self._index = None
+        self.notifier = notifier
+        self.affinity = affinity or AffinityStore()
+        self.scorer = scorer
+        self.health = health
+        self.retry = retry or RetryPolicy()
+        self.circuit = circuit or CircuitBreaker()
+        self.leases = LeaseRegistry(release=self.release)
+        self.heartbeat = LeaseHeartbeat(on_lost=self._lease_lost)
 
         self._configuration = Configuration(host=f'{host}/api/v1')
 
-    def connect(self, token: str) -> None:
+    def connect(self, token: str,
+                pool_maxsize: int = None,
+                retries: int = None,
+                keep_alive: bool = True) -> None:
         """
         Establish connection for OpenSTF server
         :param token: stf access token
+        :param pool_maxsize: max number of kept alive connections to server.
+                             Should be at least max number of parallel API calls.
+                             None uses stf-client default (cpu count * 5)
+        :param retries: urllib3 retries for connection errors (int or urllib3 Retry). None uses urllib3 default
+        :param keep_alive: enable TCP keep-alive for pooled connections
         :return: None
         """
         self.logger.debug(f"Fetch API spec from: {self._configuration}")
         self._configuration.api_key['accessTokenAuth'] = f"Bearer {token}"
+        if pool_maxsize is not None:
+            self._configuration.connection_pool_maxsize = pool_maxsize
+        if retries is not None:
+            self._configuration.retries = retries
+        if keep_alive:
+            self._configuration.socket_options = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
         self._client = ApiClient(self._configuration)
+        # API instances are stateless wrappers around shared client, reuse them
+        self._user_api = UserApi(self._client)
+        self._devices_api = DevicesApi(self._client)
         self.logger.info('StfClient library initiated')
 
-    def get_devices(self, fields: list = []) -> list:
+    def _call(self, name: str, func, *args, **kwargs):
+        """
+        Call STF API through retry policy and circuit breaker
+        :raises CircuitOpenError: STF is considered to be down
+        """
+        return self.retry.call(name, self.circuit.call, name, func, *args, **kwargs)
+
+    def _call_non_idempotent(self, name: str, func, *args, **kwargs):
+        """
+        Call STF API which must not be repeated once STF has received it (allocate, release)
+        :raises CircuitOpenError: STF is considered to be down
+        """
+        return self.retry.call_non_idempotent(name, self.circuit.call, name, func, *args, **kwargs)
+
+    @staticmethod
+    def _outcome_unknown(error: BaseException) -> bool:
+        """ Request may have been processed by STF although call failed, e.g. response timed out """
+        return not isinstance(error, CircuitOpenError) and is_transient(error) and not is_connect_error(error)
+
+    def _owns(self, serial: str) -> bool:
+        """
+        Check from STF if device is allocated by us
+        :param serial: device serial
+        :return: True if device is owned
+        """
+        try:
+            api_response = self._call('get_user_device', self._user_api.get_user_device_by_serial,
+                                      serial, fields='serial,owner')
+            return bool(api_response.success)
+        except (ForbiddenException, NotFoundException):
+            return False
+
+    def _settle(self, serial: str, error: Exception, owned: bool) -> None:
+        """
+        Resolve call whose outcome is unknown by checking device ownership
+        :param serial: device serial
+        :param error: raised exception
+        :param owned: ownership which means that call succeeded
+        :raises: error when call did not succeed or ownership cannot be checked
+        """
+        if not self._outcome_unknown(error):
+            raise error
+        try:
+            succeeded = self._owns(serial) == owned
+        except Exception:  # pylint: disable=broad-except
+            raise error from None
+        if not succeeded:
+            raise error
+        self.logger.warning(f'{serial}: call failed ({error}) but STF has processed it')
+
+    def api_stats(self) -> dict:
+        """
+        Get API call resilience metrics
+        :return: dictionary with retry and circuit statistics
+        """
+        return dict(retry=self.retry.stats(), circuit=self.circuit.stats())
+
+    def connection_stats(self) -> dict:
+        """
+        Get HTTP connection pool statistics
+        :return: dictionary with pools, connections (opened), requests and reused (requests over reused connection)
+        """
+        NotConnectedError.invariant(self._client, 'Not connected')
+        pools = self._client.rest_client.pool_manager.pools
+        connections = requests = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            requests += pool.num_requests
+        return dict(pools=len(pools), connections=connections, requests=requests,
+                    reused=max(0, requests - connections))
+
+    @timed('stf.get_devices')
+    def get_devices(self, fields: list = None, exact: bool = False) -> list:
         """
         Get list of devices dictionary
-        :param fields: fields to be request for each device
+        :param fields: extra fields to be request for each device in addition to
+                       DEVICE_FIELDS and AVAILABILITY_FIELDS
+        :param exact: request only given fields (and serial)
         :return: list of device dictionaries
         :rtype: [dict]
         """
         NotConnectedError.invariant(self._client, 'Not connected')
 
-        fields.extend([
-            'present', 'ready', 'using', 'owner', 'marketName',
-            'serial', 'manufacturer', 'model', 'platform', 'sdk', 'version',
-            'status'
-        ])
-
-        api_instance = DevicesApi(self._client)
-        api_response = api_instance.get_devices(fields=','.join(fields))
+        defaults = [] if exact else DEVICE_FIELDS + AVAILABILITY_FIELDS
+        # sorted projection keeps cache keys stable
+        fields = sorted(set(fields or []) | set(defaults) | {'serial'})
+
+        fields_str = ','.join(fields)
+        if self.cache.enabled:
+            devices = self.cache.get(fields_str)
+            if devices is not None:
+                self.logger.debug(f'Got {len(devices)} devices from cache')
+                return devices
+
+        api_instance = self._devices_api
+        # devices are plain dictionaries, skip costly per item type validation of generated model
+        api_response = self._call('get_devices', api_instance.get_devices,
+                                  fields=fields_str, _check_return_type=False)
         devices = api_response.devices
         assert isinstance(devices, list), 'invalid response'
-        self.logger.debug(f'Got devices: {devices}')
+        self.logger.debug(f'Got {len(devices)} devices')
+        if self.cache.enabled:
+            self.cache.set(fields_str, devices)
         return devices
 
+    def invalidate_cache(self) -> None:
+        """
+        Drop cached device inventory so that next query fetch fresh data from server
+        :return: None
+        """
+        self.cache.invalidate()
+
+    @timed('stf.allocate')
     def allocate(self, device: dict, timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS) -> dict:
         """
         Allocate device based on serial number
@@ -79,24 +235,77 @@ class StfClient(Logger):
         self.logger.debug(f"{serial}: trying to  allocate")
         timeout = timeout_seconds * 1000
 
-        api_instance = UserApi(self._client)
-        api_response = api_instance.add_user_device_v2(serial, timeout=timeout)
-        assert api_response.success, 'allocation fails'
+        api_instance = self._user_api
+        success = False
+        started = time.monotonic()
+        try:
+            try:
+                api_response = self._call_non_idempotent('allocate', api_instance.add_user_device_v2,
+                                                         serial, timeout=timeout)
+                allocated = bool(api_response.success)
+            except Exception as error:  # pylint: disable=broad-except
+                self._settle(serial, error, owned=True)
+                allocated = True
+            # refusal means someone else took the device first, tells nothing about device
+            success = True if allocated else None
+        except Exception as error:
+            if self._is_outage(error) or isinstance(error, ForbiddenException):
+                # server failure or contention tells nothing about device
+                success = None
+            raise
+        finally:
+            # device state changed or cached snapshot was stale
+            self.invalidate_cache()
+            if self.scorer and success is not None:
+                self.scorer.record_allocation(serial, success)
+            if self.health and success is not None:
+                self.health.record(serial, 'allocate', success, time.monotonic() - started)
+        assert allocated, 'allocation fails'
         self.logger.info(f'{serial}: Allocated (timeout: {timeout_seconds})')
         device['owner'] = "me"
+        self.leases.add(device)
+        return device
 
-        @atexit.register
-        def _exit():
-            nonlocal self, device
+    def renew(self, device: dict, activity=None) -> bool:
+        """
+        Keep allocation alive and verify that device is still owned.
+        STF has no API to extend allocation, allocation timeout is reset only by device
+        usage, e.g. adb commands over remote connection. Such usage is given as `activity`.
+        Without activity ownership is only verified and allocation expires after its timeout.
+        :param device: dictionary device object
+        :param activity: callable(device) which uses device, e.g. runs adb command
+        :return: True if device is still owned
+        """
+        NotConnectedError.invariant(self._client, 'Not connected')
+        serial = device.get('serial')
+        if activity:
             try:
-                if device.get('owner') == "me":
-                    self.logger.info(f"exit:Release device {device.get('serial')}")
-                    self.release(device)
-            except (AssertionError, ForbiddenException) as error:
-                self.logger.error(f'releasing fails: {error}')
+                activity(device)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.warning(f'{serial}: keep alive activity fails: {error}')
+        return self._owns(serial)
 
-        return device
+    def keep_alive(self, device: dict, activity=None) -> None:
+        """
+        Renew allocation periodically in background thread, see `heartbeat.interval` and renew.
+        Lost allocation is removed from leases.
+        :param device: dictionary device object
+        :param activity: callable(device) which uses device, without it allocation is only monitored
+        :return: None
+        """
+        self.heartbeat.add(device, renew=lambda item: self.renew(item, activity=activity))
+
+    @staticmethod
+    def _is_outage(error: BaseException) -> bool:
+        return isinstance(error, CircuitOpenError) or is_transient(error)
 
+    def _lease_lost(self, device: dict) -> None:
+        """ Allocation was lost, e.g. due to idle timeout """
+        device['owner'] = None
+        self.leases.remove(device)
+        self.invalidate_cache()
+
+    @timed('stf.remote_connect')
     def remote_connect(self, device: dict) -> str:
         """
         Create remote ADB connection to device
@@ -107,14 +316,26 @@ class StfClient(Logger):
         serial = device.get('serial')
         self.logger.debug(f"{serial}: remoteConnecting")
 
-        api_instance = UserApi(self._client)
-        # Remote Connect
-        api_response = api_instance.remote_connect_user_device_by_serial(serial)
-        remote_connect_url = api_response.remote_connect_url
-        assert isinstance(remote_connect_url, str), 'invalid remoteConnectUrl'
+        api_instance = self._user_api
+        success = False
+        started = time.monotonic()
+        try:
+            # Remote Connect
+            api_response = self._call('remote_connect', api_instance.remote_connect_user_device_by_serial, serial)
+            remote_connect_url = api_response.remote_connect_url
+            assert isinstance(remote_connect_url, str), 'invalid remoteConnectUrl'
+            success = True
+        except Exception as error:
+            if self._is_outage(error):
+                success = None
+            raise
+        finally:
+            if self.health and success is not None:
+                self.health.record(serial, 'remote_connect', success, time.monotonic() - started)
         self.logger.info(f"{serial}: remoteConnected ({remote_connect_url})")
         return remote_connect_url
 
+    @timed('stf.remote_disconnect')
     def remote_disconnect(self, device: dict):
         """
         Close remote ADB connection to device
@@ -125,12 +346,13 @@ class StfClient(Logger):
         serial = device.get('serial')
         self.logger.debug(f"{serial}; remote disconnecting..")
 
-        api_instance = UserApi(self._client)
+        api_instance = self._user_api
         # Remote Connect
-        api_response = api_instance.remote_disconnect_user_device_by_serial(serial)
+        api_response = self._call('remote_disconnect', api_instance.remote_disconnect_user_device_by_serial, serial)
         assert api_response.success, 'disconnection fails'
         self.logger.info(f"{serial}; remote disconnected")
 
+    @timed('stf.release')
     def release(self, device: dict) -> None:
         """
         Release device
@@ -141,72 +363,102 @@ class StfClient(Logger):
         serial = device.get('serial')
         self.logger.debug(f'{serial}: releasing..')
 
-        api_instance = UserApi(self._client)
-        api_response = api_instance.delete_user_device_by_serial(serial)
-        assert api_response.success, 'release fails'
+        api_instance = self._user_api
+        try:
+            try:
+                api_response = self._call_non_idempotent('release', api_instance.delete_user_device_by_serial, serial)
+                released = bool(api_response.success)
+            except Exception as error:  # pylint: disable=broad-except
+                self._settle(serial, error, owned=False)
+                released = True
+        finally:
+            self.invalidate_cache()
+        assert released, 'release fails'
         device['owner'] = None
+        self.leases.remove(device)
+        self.heartbeat.remove(device)
         self.logger.info(f'{serial}: released')
+        if self.notifier:
+            self.notifier.notify(device)
 
-    def list_devices(self, requirements: dict, fields: str = "", available_filter: bool = True) -> list:
+    @timed('stf.list_devices')
+    def list_devices(self, requirements: Union[dict, str, DeviceQuery],
+                     fields: str = "", available_filter: bool = True) -> list:
         """
         Get list of devices filtered by given requirements and optional extra fields
-        :param requirements: filter dictionary
-        :param fields: extra fields to include
+        :param requirements: filter dictionary, query expression string (e.g. `sdk>=29&model~=^Pixel`)
+                             or DeviceQuery
+        :param fields: extra fields to include, comma separated
         :param available_filter: filter only available devices
         :return: list of objects that represent devices
         """
-        req_keys = list(requirements.keys())
-        req_keys.extend(['present', 'ready', 'using', 'owner'])
-        req_keys.extend([
-            'serial', 'manufacturer', 'model',
-            'platform', 'sdk', 'version', 'note', 'group.name'
-        ])
-        req_keys.extend(fields.split(','))
+        query = DeviceQuery.create(requirements)
+        # request only fields that are evaluated or describe device
+        req_keys = query.fields + DEVICE_FIELDS
+        if available_filter:
+            req_keys.extend(AVAILABILITY_FIELDS)
+        req_keys.extend(filter(None, fields.split(',')))
         fields = uniq(req_keys)
 
-        predicate = requirements.copy()
         if available_filter:
-            predicate.update(
-                dict(
-                    present=True,
-                    ready=True,
-                    using=False,
-                    owner=None,
-                    status=STATUS_ONLINE)
-            )
+            query = query.merge(AVAILABLE)
 
         self.logger.debug(
-            f"Find devices with requirements: {json.dumps(requirements)}, using fields: {','.join(fields)}")
+            f"Find devices with requirements: {self.describe(requirements)}, using fields: {','.join(fields)}")
+
+        devices = self.get_devices(fields=fields, exact=True)
+
+        return query.filter(devices, index=self._get_index(devices))
 
-        devices = self.get_devices(fields=fields)
+    def _get_index(self, devices: list) -> DeviceIndex:
+        """ Get device index for inventory snapshot, index is reused as long as snapshot is the same """
+        index = self._index
+        if index is None or index.devices is not devices:
+            index = DeviceIndex(devices)
+            self._index = index
+        return index
 
-        return filter_(devices, predicate)
+    @staticmethod
+    def describe(requirements) -> str:
+        """ Requirements as text for log and error messages """
+        return json.dumps(requirements) if isinstance(requirements, dict) else str(requirements)
 
-    def list_online_devices(self, requirements: dict):
-        suitable_devices = self.list_devices(requirements=requirements)
+    def list_online_devices(self, requirements: dict, fields: str = ""):
+        suitable_devices = self.list_devices(requirements=requirements, fields=fields)
         online = filter(lambda device: device.get('status') == STATUS_ONLINE, suitable_devices)
         return list(online)
 
 
     def find_and_allocate(self, requirements: dict,
                           timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
-                          shuffle: bool = True) -> dict:
+                          shuffle: bool = True,
+                          concurrency: int = 1,
+                          affinity_key: str = None) -> dict:
         """
         Find device based on requirements and allocate first.
         Note that this method doesn't wait for device to be free.
 
         :param requirements: dictionary about requirements, e.g. `dict(platform='android')`
         :param timeout_seconds: allocation timeout when idle, see more from allocation api.
-        :param shuffle: randomize allocation
+        :param shuffle: randomize allocation, candidates are ranked by scorer afterwards if given
+        :param concurrency: how many allocation attempts are fired in parallel.
+                            First success is kept and extra allocations are released.
+        :param affinity_key: e.g. job or app name. Free devices recently allocated with same key
+                             are tried first, one by one, before normal selection.
         :return: device dictionary
 
         :raises DeviceNotFound: suitable device not found or all devices are allocated already
         """
         NotConnectedError.invariant(self._client, 'Not connected')
-        suitable_devices = self.list_online_devices(requirements=requirements)
+        suitable_devices = self.list_online_devices(requirements=requirements, fields=self._scoring_fields())
         DeviceNotFound.invariant(len(suitable_devices), 'no suitable devices found')
-        if shuffle:
-            random.shuffle(suitable_devices)
+        suitable_devices = self._order_candidates(suitable_devices, shuffle)
+        preferred = []
+        if affinity_key:
+            serials = self.affinity.preferred(affinity_key)
+            preferred = [device for device in self.affinity.order(affinity_key, suitable_devices)
+                         if device.get('serial') in serials]
+            suitable_devices = [device for device in suitable_devices if device.get('serial') not in serials]
 
         self.logger.debug(f'Found {len(suitable_devices)} suitable devices, try to allocate one')
 
@@ -217,71 +469,364 @@ class StfClient(Logger):
                 self.logger.warning(f"{device_candidate.get('serial')} allocation fails: {error}")
                 return None
 
+        for device_candidate in preferred:
+            if try_allocate(device_candidate):
+                self.logger.info(f"{device_candidate.get('serial')}: allocated by affinity '{affinity_key}'")
+                self.affinity.remember(affinity_key, device_candidate.get('serial'))
+                return device_candidate
+        DeviceNotFound.invariant(len(suitable_devices), 'no suitable devices found')
+
+        if concurrency > 1 and len(suitable_devices) > 1:
+            result = self._race_allocate(suitable_devices, try_allocate, concurrency)
+            DeviceNotFound.invariant(result, 'no suitable devices found')
+            if affinity_key:
+                self.affinity.remember(affinity_key, result.get('serial'))
+            return result
+
         # generate try_allocate tasks for suitable devices
         tasks = map_(suitable_devices, lambda item: wrap(item, try_allocate))
         # find first successful allocation
         result = find(tasks, lambda allocFunc: allocFunc())
 
         DeviceNotFound.invariant(result, 'no suitable devices found')
-        return result.args[0]
+        device = result.args[0]
+        if affinity_key:
+            self.affinity.remember(affinity_key, device.get('serial'))
+        return device
+
+    def _order_candidates(self, devices: list, shuffle: bool) -> list:
+        """
+        Order allocation candidates: shuffle, rank by scorer and move quarantined devices last
+        """
+        if shuffle:
+            random.shuffle(devices)
+        if self.scorer:
+            devices = self.scorer.rank(devices)
+        if self.health:
+            devices = self.health.deprioritize(devices)
+        return devices
 
+    def _scoring_fields(self) -> str:
+        return ','.join(self.scorer.fields) if self.scorer else ''
+
+    def _race_allocate(self, candidates: list, try_allocate, concurrency: int):
+        """
+        Try to allocate candidates in parallel, at most `concurrency` attempts at a time.
+        :return: first successfully allocated device or None
+        """
+        errors = []
+
+        def attempt(device_candidate):
+            try:
+                return device_candidate if try_allocate(device_candidate) else None
+            except Exception as error:  # pylint: disable=broad-except
+                # raising here would hide devices allocated by other attempts
+                self.logger.warning(f"{device_candidate.get('serial')} allocation fails: {error}")
+                errors.append(error)
+                return None
+
+        def release_extra(future):
+            device = future.result()
+            if not device:
+                return
+            self.logger.info(f"{device.get('serial')}: extra allocation, releasing")
+            try:
+                self.release(device)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.error(f'releasing fails: {error}')
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='stf-allocate')
+        try:
+            for start in range(0, len(candidates), concurrency):
+                pending = [executor.submit(attempt, device) for device in candidates[start:start + concurrency]]
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    wins = [future for future in done if future.result()]
+                    if wins:
+                        # keep first one, release all other wins once they are completed
+                        for future in wins[1:] + list(pending):
+                            future.add_done_callback(release_extra)
+                        return wins[0].result()
+            if errors:
+                # nothing allocated, report e.g. outage to caller
+                raise errors[0]
+            return None
+        finally:
+            executor.shutdown(wait=False)
+
+    @timed('stf.find_wait_and_allocate')
     def find_wait_and_allocate(self,
                                requirements: dict,
                                wait_timeout=60,
                                timeout_seconds=DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
-                               shuffle: bool = True):
+                               shuffle: bool = True,
+                               concurrency: int = 1,
+                               backoff: Backoff = None,
+                               affinity_key: str = None):
         """
         wait until suitable device is free and allocate it
         :param requirements: dict of requirements for DUT
         :param wait_timeout: wait timeout for suitable free device
         :param timeout_seconds: allocation timeout. See more from allocate -API.
         :param shuffle: allocate suitable device randomly.
+        :param concurrency: parallel allocation attempts, see find_and_allocate.
+        :param backoff: polling backoff strategy, default: Backoff()
+        :param affinity_key: prefer devices recently allocated with same key, see find_and_allocate.
         :return: device dictionary
         """
         wait_until = time.time() + wait_timeout
+        # compiled once, reused by every polling round
+        query = DeviceQuery.create(requirements)
 
         # Fail fast if no suitable devices
-        suitable_devices = self.list_devices(requirements=requirements, available_filter=False)
+        suitable_devices = self.list_devices(requirements=query, available_filter=False)
         if not suitable_devices:
-            raise DeviceNotFound(f'No suitable devices found ({json.dumps(requirements)})')
+            raise DeviceNotFound(f'No suitable devices found ({self.describe(requirements)})')
 
-        print(f'wait_until: {wait_until}')
+        delays = (backoff or Backoff()).delays()
         while True:
-            remaining_time = int(wait_until - time.time())
-            print(f'remaining_time: {remaining_time}')
-            try:
-                return self.find_and_allocate(requirements=requirements,
-                                              timeout_seconds=timeout_seconds,
-                                              shuffle=shuffle)
-            except DeviceNotFound:
-                # Wait a while
-                self.logger.debug(f'Suitable device not available, '
-                                  f'wait a while and try again. Timeout in {remaining_time} seconds')
-            if (wait_until - time.time()) <= 0:
+            device = self.allocation_round(query, timeout_seconds=timeout_seconds, shuffle=shuffle,
+                                            concurrency=concurrency, affinity_key=affinity_key)
+            if device:
+                return device
+            delay = self.next_delay(delays, wait_until)
+            if delay is None:
                 break
-            # Wait a while to avoid too frequent polling
-            time.sleep(1)
-        raise DeviceNotFound(f'Suitable device not found within {wait_timeout}s timeout ({json.dumps(requirements)})')
+            self.wait_for_change(delay, query)
+        raise DeviceNotFound(f'Suitable device not found within {wait_timeout}s timeout '
+                             f'({self.describe(requirements)})')
+
+    def allocation_round(self, query: DeviceQuery, **kwargs):
+        """
+        One polling round of find_wait_and_allocate, shared with AsyncStfClient
+        :param query: compiled requirements
+        :param kwargs: find_and_allocate arguments
+        :return: allocated device or None when suitable device is not available or STF is down
+        """
+        try:
+            return self.find_and_allocate(requirements=query, **kwargs)
+        except DeviceNotFound:
+            return None
+        except Exception as error:  # pylint: disable=broad-except
+            if not self._is_outage(error):
+                raise
+            self.logger.warning(f'STF not available: {error}')
+            return None
+
+    def next_delay(self, delays, wait_until: float):
+        """
+        Delay before next polling round of find_wait_and_allocate, shared with AsyncStfClient
+        :param delays: backoff delays generator
+        :param wait_until: wait deadline (time.time)
+        :return: delay in seconds or None when wait timeout is reached
+        """
+        # when STF is down don't poll before circuit lets calls through
+        retry_after = self.circuit.retry_after()
+        remaining_time = wait_until - time.time()
+        if remaining_time <= 0:
+            return None
+        # Wait a while to avoid too frequent polling
+        self.logger.debug(f'Suitable device not available, '
+                          f'wait a while and try again. Timeout in {int(remaining_time)} seconds')
+        return min(max(next(delays), retry_after), remaining_time)
+
+    def wait_for_change(self, delay: float, query: DeviceQuery) -> None:
+        """
+        Wait given delay or until notifier reports matching device to be free
+        """
+        if self.notifier:
+            if self.notifier.wait(delay, predicate=query.matches):
+                # device was freed elsewhere, cached snapshot is stale
+                self.invalidate_cache()
+        else:
+            time.sleep(delay)
+
+    @timed('stf.allocate_many')
+    def allocate_many(self, requirements: dict, count: int,
+                      wait_timeout=60,
+                      timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
+                      shuffle: bool = True,
+                      concurrency: int = 8,
+                      backoff: Backoff = None) -> list:
+        """
+        Allocate and remote connect `count` distinct devices.
+        Devices are picked from one inventory snapshot per round, allocated and
+        remote connected in parallel. If requested amount of devices is not
+        reached within wait_timeout all allocated devices are released.
+        :param requirements: dict of requirements for DUT
+        :param count: number of devices to allocate
+        :param wait_timeout: wait timeout for enough suitable free devices
+        :param timeout_seconds: allocation timeout. See more from allocate -API.
+        :param shuffle: allocate suitable devices randomly
+        :param concurrency: max parallel API calls
+        :param backoff: polling backoff strategy, default: Backoff()
+        :return: list of device dictionaries with `remote_adb_url`
+        :raises DeviceNotFound: not enough suitable devices
+        """
+        NotConnectedError.invariant(self._client, 'Not connected')
+        assert count > 0, 'count should be positive'
+        wait_until = time.time() + wait_timeout
+        query = DeviceQuery.create(requirements)
+
+        # Fail fast if not enough suitable devices
+        suitable_devices = self.list_devices(requirements=query, available_filter=False)
+        if len(suitable_devices) < count:
+            raise DeviceNotFound(f'Not enough suitable devices found: {len(suitable_devices)}/{count} '
+                                 f'({self.describe(requirements)})')
+
+        delays = (backoff or Backoff()).delays()
+        allocated = []
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='stf-allocate') as executor:
+                while True:
+                    serials = [device.get('serial') for device in allocated]
+                    try:
+                        candidates = [device for device in
+                                      self.list_online_devices(requirements=query, fields=self._scoring_fields())
+                                      if device.get('serial') not in serials]
+                        candidates = self._order_candidates(candidates, shuffle)
+                        wins, errors = self._allocate_batch(executor, candidates, count - len(allocated),
+                                                            timeout_seconds)
+                        allocated.extend(wins)
+                        if errors:
+                            # wins are tracked already, report unexpected errors before outages
+                            raise next((error for error in errors if not self._is_outage(error)), errors[0])
+                    except Exception as error:  # pylint: disable=broad-except
+                        if not self._is_outage(error):
+                            raise
+                        self.logger.warning(f'STF not available: {error}')
+                    # when STF is down keep allocated devices and wait until circuit lets calls through
+                    retry_after = self.circuit.retry_after()
+                    if len(allocated) >= count:
+                        break
+                    remaining_time = wait_until - time.time()
+                    if remaining_time <= 0:
+                        raise DeviceNotFound(f'{len(allocated)}/{count} suitable devices allocated within '
+                                             f'{wait_timeout}s timeout ({self.describe(requirements)})')
+                    self.logger.debug(f'{len(allocated)}/{count} devices allocated, wait a while and try again')
+                    self.wait_for_change(min(max(next(delays), retry_after), remaining_time), query)
+
+                urls = executor.map(self.remote_connect, allocated)
+                for device, url in zip(allocated, urls):
+                    device['remote_adb_url'] = url
+        except BaseException:
+            self.release_many(allocated, concurrency=concurrency)
+            raise
+        return allocated
+
+    def _allocate_batch(self, executor: ThreadPoolExecutor, candidates: list, needed: int,
+                        timeout_seconds: int) -> tuple:
+        """
+        Allocate up to `needed` devices from candidates using executor.
+        Attempts in flight never exceed amount of devices still needed.
+        :return: tuple of allocated devices list and list of errors other than allocation refusals
+        """
+        errors = []
+
+        def attempt(device_candidate):
+            try:
+                self.allocate(device_candidate, timeout_seconds=timeout_seconds)
+                return device_candidate
+            except (AssertionError, ForbiddenException) as error:
+                self.logger.warning(f"{device_candidate.get('serial')} allocation fails: {error}")
+            except Exception as error:  # pylint: disable=broad-except
+                # raising here would hide devices allocated by other attempts
+                self.logger.warning(f"{device_candidate.get('serial')} allocation fails: {error}")
+                errors.append(error)
+            return None
+
+        wins = []
+        candidates = iter(candidates)
+        pending = set()
+        while True:
+            while len(wins) + len(pending) < needed:
+                device = next(candidates, None)
+                if device is None:
+                    break
+                pending.add(executor.submit(attempt, device))
+            if not pending:
+                return wins, errors
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            wins.extend(future.result() for future in done if future.result())
+
+    def release_many(self, devices: list, concurrency: int = 8) -> None:
+        """
+        Release devices in parallel. Failures are logged.
+        :param devices: list of device dictionaries
+        :param concurrency: max parallel release calls
+        :return: None
+        """
+        def release(device):
+            try:
+                self.release(device)
+            except Exception as error:  # pylint: disable=broad-except
+                self.logger.error(f"{device.get('serial')}: releasing fails: {error}")
+
+        if not devices:
+            return
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='stf-release') as executor:
+            list(executor.map(release, devices))
+
+    @contextmanager
+    def allocation_many_context(self, requirements: dict, count: int,
+                                wait_timeout=60,
+                                timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
+                                shuffle: bool = True,
+                                concurrency: int = 8):
+        """
+        Allocate and remote connect `count` devices, release all of them on exit
+        :param requirements: dict of requirements for DUT
+        :param count: number of devices to allocate
+        :param wait_timeout: how long time we try to allocate suitable devices
+        :param timeout_seconds: allocation timeout
+        :param shuffle: allocate suitable devices randomly
+        :param concurrency: max parallel API calls
+        :return: list of device dictionaries
+        """
+        self.logger.info(f"Trying to allocate {count} devices using requirements: {requirements}")
+        devices = self.allocate_many(requirements=requirements, count=count,
+                                     wait_timeout=wait_timeout,
+                                     timeout_seconds=timeout_seconds,
+                                     shuffle=shuffle,
+                                     concurrency=concurrency)
+        self.logger.info(f'devices allocated: {[device.get("serial") for device in devices]}')
+        try:
+            yield devices
+        finally:
+            self.release_many(devices, concurrency=concurrency)
 
     @contextmanager
     def allocation_context(self, requirements: dict,
                            wait_timeout=60,
                            timeout_seconds: int = DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
-                           shuffle: bool = True):
+                           shuffle: bool = True,
+                           concurrency: int = 1,
+                           heartbeat: bool = False,
+                           affinity_key: str = None,
+                           activity=None):
         """
         :param requirements:
         :param wait_timeout: how long time we try to allocate suitable device
         :param timeout_seconds: allocation timeout
         :param shuffle: allocate suitable device randomly
+        :param concurrency: parallel allocation attempts, see find_and_allocate
+        :param heartbeat: monitor allocation periodically, see keep_alive
+        :param affinity_key: prefer devices recently allocated with same key, see find_and_allocate
+        :param activity: heartbeat callable(device) which uses device and so resets STF allocation timeout,
+                         allows to use short timeout_seconds for long runs
         :return:
         """
         self.logger.info(f"Trying to allocate device using requirements: {requirements}")
         device = self.find_wait_and_allocate(requirements=requirements,
                                              wait_timeout=wait_timeout,
                                              timeout_seconds=timeout_seconds,
-                                             shuffle=shuffle)
+                                             shuffle=shuffle,
+                                             concurrency=concurrency,
+                                             affinity_key=affinity_key)
 
         self.logger.info(f'device allocated: {device}')
+        if heartbeat:
+            self.keep_alive(device, activity=activity)
         adb_adr = self.remote_connect(device)
         device['remote_adb_url'] = adb_adr
         yield device
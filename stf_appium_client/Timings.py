@@ -0,0 +1,109 @@
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Timings:
+    """
+    Collects durations of named phases (spans), e.g. `stf.allocate` or `adb.connect`
+    """
+
+    def __init__(self, max_spans: int = 10000):
+        """
+        Timings constructor
+        :param max_spans: how many latest spans are kept, summary covers all spans
+        """
+        self._origin = time.perf_counter()
+        self._spans = deque(maxlen=max_spans)
+        self._summary = dict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Measure duration of with block
+        :param name: phase name
+        :param attributes: extra attributes stored with span, e.g. serial
+        :return: None
+        """
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as exc:
+            error = type(exc).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, start=start - self._origin, error=error, **attributes)
+
+    def record(self, name: str, duration: float, **attributes) -> None:
+        """
+        Record span
+        :param name: phase name
+        :param duration: duration in seconds
+        :param attributes: extra attributes
+        :return: None
+        """
+        span = dict(name=name, duration=duration)
+        span.update({key: value for key, value in attributes.items() if value is not None})
+        with self._lock:
+            self._spans.append(span)
+            item = self._summary.setdefault(name, dict(count=0, total=0.0, min=duration, max=duration))
+            item['count'] += 1
+            item['total'] += duration
+            item['min'] = min(item['min'], duration)
+            item['max'] = max(item['max'], duration)
+
+    @property
+    def spans(self) -> list:
+        """ Recorded spans in completion order """
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self) -> dict:
+        """
+        Aggregated durations by span name
+        :return: {name: dict(count, total, min, max)}
+        """
+        with self._lock:
+            return {name: dict(item) for name, item in self._summary.items()}
+
+    def to_dict(self) -> dict:
+        """ Spans and summary as dictionary """
+        return dict(spans=self.spans, summary=self.summary())
+
+    def dump(self, filename: str) -> None:
+        """
+        Write timings as json
+        :param filename: output file
+        :return: None
+        """
+        with open(filename, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def clear(self) -> None:
+        """ Drop recorded spans """
+        with self._lock:
+            self._spans.clear()
+            self._summary.clear()
+
+
+# process wide default collector
+TIMINGS = Timings()
+
+
+def timed(name: str):
+    """
+    Method decorator which records call duration to `self.timings`
+    :param name: phase name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self.timings.span(name):
+                return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,87 @@
+import random
+import threading
+import time
+from collections import deque
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter for polling loops
+    """
+
+    def __init__(self, initial: float = 1.0, maximum: float = 15.0, factor: float = 2.0, jitter: float = 0.25):
+        """
+        Backoff constructor
+        :param initial: first delay in seconds
+        :param maximum: maximum delay in seconds
+        :param factor: delay multiplier after each attempt
+        :param jitter: relative random spread of delay, 0..1
+        """
+        assert initial > 0 and maximum >= initial, 'invalid backoff delays'
+        assert factor >= 1, 'factor should be >= 1'
+        assert 0 <= jitter <= 1, 'jitter should be between 0 and 1'
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+
+    def delays(self):
+        """
+        Generate delays
+        :return: infinite generator of delays in seconds
+        """
+        delay = self.initial
+        while True:
+            spread = delay * self.jitter
+            yield min(self.maximum, delay + random.uniform(-spread, spread))
+            delay = min(self.maximum, delay * self.factor)
+
+
+class DeviceNotifier:
+    """
+    Process local device change notification source.
+    StfClient notifies it when device is released and waiting
+    allocations wake up only when freed device matches their requirements.
+    Notifier can be shared between StfClient instances and fed
+    from any external source, e.g. STF websocket events.
+    """
+
+    def __init__(self, history: int = 100):
+        """
+        DeviceNotifier constructor
+        :param history: how many recent events are kept for waiters
+        """
+        self._condition = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._sequence = 0
+
+    def notify(self, device: dict = None) -> None:
+        """
+        Notify that device became free
+        :param device: device dictionary, None wakes up all waiters
+        :return: None
+        """
+        with self._condition:
+            self._sequence += 1
+            self._events.append((self._sequence, device))
+            self._condition.notify_all()
+
+    def wait(self, timeout: float, predicate=None) -> bool:
+        """
+        Wait until matching device is notified
+        :param timeout: max wait time in seconds
+        :param predicate: callable(device) -> bool, None matches any device
+        :return: True if matching device was notified, False on timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            seen = self._sequence
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+                for sequence, device in self._events:
+                    if sequence > seen and (device is None or predicate is None or predicate(device)):
+                        return True
+                seen = self._sequence
@@ -1,6 +1,7 @@
 #! python3
 from subprocess import PIPE
 import argparse
+import atexit
 import json
 import os
 import sys
@@ -8,7 +9,10 @@ import subprocess
 from stf_appium_client.StfClient import StfClient
 from stf_appium_client.AdbServer import AdbServer
 from stf_appium_client.AppiumServer import AppiumServer
-from stf_appium_client.tools import parse_requirements
+from stf_appium_client.tools import compile_requirements
+from stf_appium_client.Timings import TIMINGS
+from stf_appium_client.AffinityStore import AffinityStore
+from stf_appium_client.HealthStore import HealthStore
 
 MIN_PYTHON = (3, 7)
 assert sys.version_info >= MIN_PYTHON, f"requires Python {'.'.join([str(n) for n in MIN_PYTHON])} or newer"
@@ -39,10 +43,11 @@ def main():
                         help='openstf host')
     parser.add_argument('--requirements', metavar='R', type=str,
                         default="{}",
-                        help='requirements as json string')
+                        help='requirements as json string or expression, e.g. "platform=Android&sdk>=29"')
     parser.add_argument('--list',
                         action='store_true',
-                        help='Only list devices as json')
+                        help='Only list devices as json. Only descriptive fields and fields '
+                             'used in requirements are shown, e.g. note and group.name are not')
     parser.add_argument('--timeout', metavar='t', type=int,
                         default=StfClient.DEFAULT_ALLOCATION_TIMEOUT_SECONDS,
                         help='allocation timeout')
@@ -53,12 +58,21 @@ def main():
                         help='appium logs to console. WARNING: this mix console prints')
     parser.add_argument('--appium-logs', metavar='file', type=str, default='',
                         help='appium logs to file')
+    parser.add_argument('--timings', metavar='file', type=str, default='',
+                        help='write phase durations as json to file')
+    parser.add_argument('--affinity', metavar='key', type=str, default='',
+                        help='prefer devices recently allocated with same key, e.g. job or app name')
+    parser.add_argument('--affinity-file', metavar='file', type=str,
+                        default=os.path.join(os.path.expanduser('~'), '.stf_appium_client', 'affinity.json'),
+                        help='file where recently allocated devices are stored')
+    parser.add_argument('--health', metavar='file', type=str, default='',
+                        help='device health history database, devices failing repeatedly are tried last')
     parser.add_argument('command', nargs='*',
                         help='Command to be execute during device allocation')
 
     args = parser.parse_args()
     try:
-        requirement = parse_requirements(args.requirements)
+        requirement = compile_requirements(args.requirements)
     except ValueError as error:
         print(f"Invalid requirements: {error}")
         exit(1)
@@ -68,18 +82,32 @@ def main():
 
     returncode = RETCODE_FAILURE
 
-    client = StfClient(host=args.host)
+    client = StfClient(host=args.host,
+                       affinity=AffinityStore(args.affinity_file) if args.affinity else None,
+                       health=HealthStore(args.health) if args.health else None)
+
+    if args.timings:
+        def dump_timings():
+            # lease registry exit hook is registered at import and runs after this one,
+            # release leftover devices first so that their releases are included
+            client.leases.release_all(timeout=client.leases.exit_timeout)
+            TIMINGS.dump(args.timings)
+        atexit.register(dump_timings)
     client.connect(token=args.token)
 
     if args.list:
         print(client.list_devices(requirements=requirement))
         exit(0)
 
+    # release allocated device also when CI job is terminated
+    client.leases.install_signal_handler()
+
     with client.allocation_context(requirements=requirement,
                                    wait_timeout=args.wait_timeout,
-                                   timeout_seconds=args.timeout) as device:
+                                   timeout_seconds=args.timeout,
+                                   affinity_key=args.affinity or None) as device:
         try:
-            with AdbServer(device['remote_adb_url']) as adb:
+            with AdbServer(device['remote_adb_url'], health=client.health, serial=device['serial']) as adb:
                 adb.logger.info(f'adb server listening localhost:{adb.port}')
                 try:
                     extra_args = dict(stdout=sys.stdout.fileno(), stderr=sys.stderr.fileno()) if args.verbose else {}
@@ -100,7 +128,7 @@ def main():
                         custom_env["DEV1_MODEL"] = device["model"]
                         custom_env["DEV1_MANUFACTURER"] = device["manufacturer"]
                         custom_env["DEV1_MARKET_NAME"] = device["marketName"]
-                        custom_env["DEV1_REQUIREMENTS"] = f"{requirement}"
+                        custom_env["DEV1_REQUIREMENTS"] = args.requirements
                         custom_env["DEV1_INFO"] = json.dumps(device)
                         appium.logger.info('Env variables:')
                         for key in custom_env.keys():
@@ -112,11 +140,12 @@ def main():
 
                         command = " ".join(args.command)
                         appium.logger.info(f"call: {command}")
-                        proc = subprocess.Popen(command,
-                                                shell=True,
-                                                stdout=sys.stdout, stderr=sys.stderr,
-                                                cwd=os.curdir, env=my_env)
-                        proc.communicate()
+                        with TIMINGS.span('cli.command'):
+                            proc = subprocess.Popen(command,
+                                                    shell=True,
+                                                    stdout=sys.stdout, stderr=sys.stderr,
+                                                    cwd=os.curdir, env=my_env)
+                            proc.communicate()
                         returncode = proc.returncode
                 except Exception as error:
                     client.logger.error(error)
@@ -11,3 +11,13 @@ class DeviceNotFound(StfAppiumClientError):
 
 class NotConnectedError(StfAppiumClientError):
     pass
+
+
+class CircuitOpenError(StfAppiumClientError):
+    def __init__(self, message: str = '', retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdbProtocolError(StfAppiumClientError):
+    pass
@@ -1,7 +1,13 @@
+import os
 import socket
 import json
 import shutil
+import hashlib
+import functools
 from contextlib import closing
+from typing import Union
+
+from stf_appium_client.DeviceQuery import DeviceQuery
 
 
 def find_free_port() -> int:
@@ -15,6 +21,18 @@ def find_free_port() -> int:
         return s.getsockname()[1]
 
 
+def is_port_open(port: int, host: str = '127.0.0.1') -> bool:
+    """
+    Check if something listens given local port
+    :param port: port number
+    :param host: host address
+    :return: bool
+    """
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.settimeout(1)
+        return s.connect_ex((host, port)) == 0
+
+
 def assert_tool_exists(tool):
     assert shutil.which(tool), f'Not found: {tool}'
 
@@ -47,9 +65,47 @@ def parse_requirements(requirements_str: str) -> dict:
                     keys = subkey.split('.')
                     key1 = keys[0]
                     rest = '.'.join(keys[1:])
-                    dest[key1] = {}
+                    # merge with sibling keys, e.g. a.b=1&a.c=2
+                    if not isinstance(dest.get(key1), dict):
+                        dest[key1] = {}
                     split(dest[key1], rest)
                 else:
                     dest[subkey] = value
             split(requirements, key)
         return requirements
+
+
+def compile_requirements(requirements: Union[str, dict, DeviceQuery]) -> DeviceQuery:
+    """
+    Compile requirements to reusable device predicate.
+    Strings can be json dictionary or expression with operators,
+    e.g. `platform=Android&sdk>=29&version in [10, 11]&model~=^Pixel`.
+    Compiled strings are cached.
+    :param requirements: string, dictionary or DeviceQuery
+    :return: DeviceQuery
+    :raises ValueError: invalid requirements
+    """
+    if isinstance(requirements, (dict, DeviceQuery)):
+        return DeviceQuery.create(requirements)
+    if not isinstance(requirements, str):
+        raise ValueError('Invalid requirements type')
+    return DeviceQuery.compile(requirements)
+
+
+def file_sha256(path: str) -> str:
+    """
+    Calculate sha256 of local file. Result is cached until file size or mtime changes.
+    :param path: file path
+    :return: hex digest
+    """
+    stat = os.stat(path)
+    return _file_sha256(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=64)
+def _file_sha256(path: str, size: int, mtime: int) -> str:  # pylint: disable=unused-argument
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,73 @@
+import logging
+from unittest.mock import MagicMock
+
+from stf_appium_client.AdbMonitor import AdbMonitor
+
+
+def adb_mock(states, reconnect=None):
+    adb = MagicMock()
+    adb.adb_server = 'host:7401'
+    adb.connected = True
+    adb.probe.side_effect = states
+    adb.reconnect.side_effect = reconnect
+    return adb
+
+
+class TestAdbMonitor:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_probe_collects_latency(self):
+        adb = adb_mock(['device', 'device'])
+        monitor = AdbMonitor(interval=60)
+        monitor.add(adb)
+        monitor.probe()
+        monitor.probe()
+        stats = monitor.stats()['host:7401']
+        assert stats['state'] == 'device'
+        assert (stats['probes'], stats['failures'], stats['reconnects']) == (2, 0, 0)
+        assert stats['latency_last'] is not None and stats['latency_max'] >= stats['latency_last']
+        adb.reconnect.assert_not_called()
+        monitor.stop()
+
+    def test_reconnect_after_drop(self):
+        adb = adb_mock([None, 'device'])
+        on_reconnect = MagicMock()
+        monitor = AdbMonitor(interval=60, ready_timeout=3, on_reconnect=on_reconnect)
+        monitor.add(adb)
+        monitor.probe()
+        adb.reconnect.assert_called_once_with(ready_timeout=3)
+        on_reconnect.assert_called_once_with(adb)
+        monitor.probe()
+        stats = monitor.stats()['host:7401']
+        assert (stats['state'], stats['failures'], stats['reconnects']) == ('device', 1, 1)
+        monitor.stop()
+
+    def test_lost_after_failed_reconnects(self):
+        adb = adb_mock(['offline', RuntimeError('adb'), 'offline'], reconnect=AssertionError('not ready'))
+        on_lost = MagicMock()
+        monitor = AdbMonitor(interval=60, max_reconnects=3, on_lost=on_lost)
+        monitor.add(adb)
+        for _ in range(3):
+            monitor.probe()
+        assert adb.reconnect.call_count == 3
+        on_lost.assert_called_once_with(adb)
+        assert len(monitor) == 0
+        monitor.stop()
+
+    def test_background_thread(self):
+        adb = adb_mock(lambda timeout: 'device')
+        monitor = AdbMonitor(interval=0.01)
+        monitor.add(adb)
+        for _ in range(500):
+            if adb.probe.call_count >= 2:
+                break
+            monitor._stop.wait(0.01)
+        monitor.stop()
+        assert adb.probe.call_count >= 2
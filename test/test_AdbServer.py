@@ -1,12 +1,16 @@
 import logging
+import os
+import shlex
 import sys
+import time
 from shutil import which
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock, ANY
 
 import pytest
 from easyprocess import EasyProcess
 
-from stf_appium_client.AdbServer import AdbServer
+from stf_appium_client.AdbServer import AdbServer, _iter_lines
+from stf_appium_client.tools import file_sha256
 
 
 class TestAdbServer:
@@ -81,3 +85,291 @@ class TestAdbServer:
         resp = adb_server.execute('hello', timeout=0.01, verify=False)
         assert resp.timeout_happened
         mock_easy_process.assert_called_once()
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_connect_records_health(self, mock_easy_process):
+        health = MagicMock()
+        mock_easy_process.return_value.call.return_value.return_code = 1
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        adb_server = AdbServer('localhost:7401', port=1000, health=health, serial='123')
+        with pytest.raises(AssertionError):
+            adb_server.connect()
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        adb_server.connect()
+        adb_server.connected = False
+        assert [call.args[:3] for call in health.record.call_args_list] == \
+               [('123', 'adb_connect', False), ('123', 'adb_connect', True)]
+
+    @patch('stf_appium_client.AdbServer.is_port_open', return_value=False)
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_shared_server(self, mock_easy_process, _mock_port_open):
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        adb1 = AdbServer('host1:7401', port=0, shared=True)
+        adb2 = AdbServer('host2:7401', port=0, shared=True)
+        assert adb1.port == adb2.port
+        adb1.connect()
+        adb2.connect()
+        assert AdbServer.shared_users(adb1.port) == 2
+        adb1.execute('shell ls')
+        adb1.kill()
+        assert AdbServer.shared_users(adb1.port) == 1
+        adb2.kill()
+        assert AdbServer.shared_users(adb1.port) == 0
+        commands = [call.args[0] for call in mock_easy_process.call_args_list]
+        port = adb1.port
+        assert commands == [f'adb -P {port} connect host1:7401',
+                            f'adb -P {port} connect host2:7401',
+                            f'adb -P {port} -s host1:7401 shell ls',
+                            f'adb -P {port} disconnect host1:7401',
+                            f'adb -P {port} disconnect host2:7401',
+                            f'adb -P {port} kill-server']
+
+    @patch('stf_appium_client.AdbServer.is_port_open', return_value=True)
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_shared_server_started_by_others_is_not_killed(self, mock_easy_process, _mock_port_open):
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        with AdbServer('host1:7401', port=5037, shared=True):
+            pass
+        commands = [call.args[0] for call in mock_easy_process.call_args_list]
+        assert commands == ['adb -P 5037 connect host1:7401', 'adb -P 5037 disconnect host1:7401']
+
+    @staticmethod
+    def _local_shell(cmd, env=None):
+        """ Run `adb shell` script in local sh instead of device """
+        args = shlex.split(cmd)
+        return EasyProcess(['sh', '-c', ' '.join(args[args.index('shell') + 1:])])
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_shell_batch(self, mock_easy_process):
+        mock_easy_process.side_effect = self._local_shell
+        adb_server = AdbServer('localhost', port=1000)
+        commands = ['echo a', 'printf b', 'echo err >&2; exit 3', 'true', 'echo "q\'x"']
+        results = adb_server.shell_batch(commands, verify=False)
+        mock_easy_process.assert_called_once()
+        assert [(r.cmd, r.stdout, r.stderr, r.return_code) for r in results] == [
+            ('echo a', 'a', '', 0),
+            ('printf b', 'b', '', 0),
+            ('echo err >&2; exit 3', '', 'err', 3),
+            ('true', '', '', 0),
+            ('echo "q\'x"', "q'x", '', 0)]
+        with pytest.raises(AssertionError, match='fails with code: 3'):
+            adb_server.shell_batch(commands)
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_shell_batch_stop_on_error(self, mock_easy_process):
+        mock_easy_process.side_effect = self._local_shell
+        adb_server = AdbServer('localhost', port=1000)
+        results = adb_server.shell_batch(['true', 'false', 'echo never'], verify=False, stop_on_error=True)
+        assert [r.return_code for r in results] == [0, 1]
+        assert adb_server.shell_batch([]) == []
+
+    def test_shell_batch_legacy_output(self):
+        # legacy shell mixes stderr to stdout and uses CRLF
+        marker = 'M'
+        stdout = 'a\r\n\r\nM 0 0\r\n\r\nM-ERR 0\r\nerr\r\n\r\nM 1 2\r\n\r\nM-ERR 1'
+        results = AdbServer._parse_batch(['echo a', 'fail'], marker, stdout, '')
+        assert [(r.stdout, r.return_code) for r in results] == [('a', 0), ('err', 2)]
+
+    @staticmethod
+    def _python(script):
+        return f'{shlex.quote(sys.executable)} -c {shlex.quote(script)}'
+
+    def test_stream_lines(self):
+        adb_server = AdbServer('localhost', port=1000)
+        script = 'import sys\nprint("a")\nprint("b", file=sys.stderr, flush=True)\nsys.stdout.write("c")'
+        with patch.object(AdbServer, '_adb_command', return_value=self._python(script)):
+            assert sorted(adb_server.stream('logcat')) == ['a', 'b', 'c']
+
+    def test_stream_timeout_and_close(self):
+        adb_server = AdbServer('localhost', port=1000)
+        script = 'import time\nwhile True:\n    print("line", flush=True)\n    time.sleep(0.01)'
+        with patch.object(AdbServer, '_adb_command', return_value=self._python(script)):
+            started = time.monotonic()
+            lines = list(adb_server.stream('logcat', timeout=0.5))
+            assert time.monotonic() - started < 5
+            assert lines and set(lines) == {'line'}
+            stream = adb_server.stream('logcat')
+            assert next(stream) == 'line'
+            stream.close()
+
+    def test_stream_to(self, tmp_path):
+        adb_server = AdbServer('localhost', port=1000)
+        script = 'print("a")\nprint("b")'
+        with patch.object(AdbServer, '_adb_command', return_value=self._python(script)):
+            assert adb_server.stream_to('logcat', str(tmp_path / 'log.txt')) == 4
+            assert (tmp_path / 'log.txt').read_bytes().splitlines() == [b'a', b'b']
+            lines = []
+            adb_server.stream_to('logcat', lines.append, lines=True)
+            assert lines == ['a', 'b']
+
+    def test_iter_lines_bounded(self):
+        chunks = iter([b'ab', b'cdef\r\ngh', b'ijklmn'])
+        lines = list(_iter_lines((chunk for chunk in chunks), max_line=4))
+        assert lines == ['abcd', 'ef', 'ghij', 'klmn']
+
+    @pytest.fixture
+    def fake_pm(self, tmp_path, monkeypatch):
+        """ Local `pm` which reports installed.apk as installed path of com.example """
+        installed = tmp_path / 'installed.apk'
+        pm = tmp_path / 'pm'
+        pm.write_text(f'#!/bin/sh\n[ "$2" = com.example ] && [ -f {installed} ] && echo package:{installed}\n')
+        pm.chmod(0o755)
+        monkeypatch.setenv('PATH', f'{tmp_path}:{os.environ["PATH"]}')
+        return installed
+
+    @pytest.mark.skipif(not which('sha256sum'), reason='sha256sum is missing')
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_installed_sha256(self, mock_easy_process, fake_pm, tmp_path):
+        mock_easy_process.side_effect = self._local_shell
+        adb_server = AdbServer('localhost', port=1000)
+        assert adb_server.installed_sha256('com.example') is None
+        fake_pm.write_bytes(b'apk')
+        assert adb_server.installed_sha256('com.example') == file_sha256(str(fake_pm))
+        assert adb_server.installed_sha256('com.other') is None
+
+    def test_install_skips_identical(self, tmp_path):
+        apk = tmp_path / 'app.apk'
+        apk.write_bytes(b'apk')
+        adb_server = AdbServer('localhost', port=1000)
+        with patch.object(adb_server, 'installed_sha256', return_value=file_sha256(str(apk))), \
+                patch.object(adb_server, 'execute') as execute:
+            assert adb_server.install(str(apk), package='com.example') is False
+            execute.assert_not_called()
+            execute.return_value.stdout = 'Success'
+            assert adb_server.install(str(apk), package='com.example', force=True) is True
+            execute.assert_called_once_with(f'install -r {apk}', timeout=600)
+        with patch.object(adb_server, 'installed_sha256', return_value='0' * 64), \
+                patch.object(adb_server, 'execute') as execute:
+            execute.return_value.stdout = 'Failure [INSTALL_FAILED_INSUFFICIENT_STORAGE]'
+            with pytest.raises(AssertionError, match='INSUFFICIENT_STORAGE'):
+                adb_server.install(str(apk), package='com.example', args=['-r', '-g'])
+            execute.assert_called_once_with(f'install -r -g {apk}', timeout=600)
+
+    def test_install_many(self, tmp_path):
+        apk = tmp_path / 'app.apk'
+        apk.write_bytes(b'apk')
+        servers = [AdbServer(f'host{index}:7401', port=1000) for index in range(3)]
+        outcomes = [True, False, AssertionError('fail')]
+        for server, outcome in zip(servers, outcomes):
+            server.install = MagicMock(side_effect=[outcome])
+        results = AdbServer.install_many(servers, str(apk), package='com.example', concurrency=2, timeout=60)
+        assert results['host0:7401'] is True
+        assert results['host1:7401'] is False
+        assert isinstance(results['host2:7401'], AssertionError)
+        servers[0].install.assert_called_once_with(str(apk), package='com.example', timeout=60)
+
+    @staticmethod
+    def _local_adb(cmd, env=None):
+        """ Run adb shell, push and pull against local filesystem """
+        args = shlex.split(cmd)
+        for index, arg in enumerate(args):
+            if arg == 'shell':
+                return EasyProcess(['sh', '-c', ' '.join(args[index + 1:])])
+            if arg in ('push', 'pull'):
+                return EasyProcess(['cp', '-p', args[-2], args[-1]])
+        raise AssertionError(f'unexpected command: {cmd}')
+
+    @pytest.mark.skipif(not which('sha256sum'), reason='sha256sum is missing')
+    @pytest.mark.parametrize('compare', ['size', 'mtime', 'hash'])
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_push_pull_skip_unchanged(self, mock_easy_process, compare, tmp_path):
+        mock_easy_process.side_effect = self._local_adb
+        local = tmp_path / 'local'
+        (local / 'sub').mkdir(parents=True)
+        (local / 'a.txt').write_bytes(b'a')
+        (local / 'sub' / 'b.txt').write_bytes(b'b')
+        remote = tmp_path / 'remote'
+        (remote / 'sub').mkdir(parents=True)
+        adb_server = AdbServer('localhost', port=1000)
+        assert adb_server.push(str(local), str(remote), compare=compare) == \
+               [f'{remote}/a.txt', f'{remote}/sub/b.txt']
+        assert (remote / 'sub' / 'b.txt').read_bytes() == b'b'
+        assert adb_server.push(str(local), str(remote), compare=compare) == []
+        (local / 'a.txt').write_bytes(b'aa')
+        assert adb_server.push(str(local), str(remote), compare=compare) == [f'{remote}/a.txt']
+
+        pulled = tmp_path / 'pulled'
+        assert adb_server.pull(str(remote), str(pulled), compare=compare) == \
+               [str(pulled / 'a.txt'), str(pulled / 'sub' / 'b.txt')]
+        assert (pulled / 'a.txt').read_bytes() == b'aa'
+        assert adb_server.pull(str(remote), str(pulled), compare=compare) == []
+        assert adb_server.pull(str(remote / 'a.txt'), str(pulled), compare=compare) == []
+
+    def test_push_native(self, tmp_path):
+        local = tmp_path / 'a.txt'
+        local.write_bytes(b'a')
+        adb_server = AdbServer('localhost', port=1000)
+        adb_server.transport = MagicMock()
+        adb_server.connected = True
+        with patch.object(adb_server, '_remote_stats', return_value={}) as remote_stats:
+            assert adb_server.push(str(local), '/sdcard/') == ['/sdcard/a.txt']
+        # destination directory is not scanned
+        remote_stats.assert_called_once_with(['/sdcard/a.txt'], 'mtime')
+        adb_server.transport.push.assert_called_once_with(str(local), '/sdcard/a.txt', mode=ANY)
+        adb_server.connected = False
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_remote_stats_batched(self, mock_easy_process):
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.stdout = '1 2 /sdcard/f0'
+        adb_server = AdbServer('localhost', port=1000)
+        paths = [f'/sdcard/{index:04d}' for index in range(500)]
+        assert adb_server._remote_stats(paths, 'size') == {'/sdcard/f0': (1, 2)}
+        commands = [call.args[0] for call in mock_easy_process.call_args_list]
+        assert len(commands) > 1
+        assert all('find' not in command for command in commands)
+
+    def test_wait_ready(self):
+        adb_server = AdbServer('localhost', port=1000)
+        with patch.object(adb_server, 'probe', side_effect=[None, 'offline', 'device']) as probe:
+            assert adb_server.wait_ready(timeout=5, interval=0.01) < 5
+            assert probe.call_count == 3
+        with patch.object(adb_server, 'probe', return_value='offline'):
+            with pytest.raises(AssertionError, match='not ready'):
+                adb_server.wait_ready(timeout=0.05, interval=0.01)
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_probe(self, mock_easy_process):
+        mock_easy_process.return_value.call.return_value.stdout = 'device'
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        adb_server = AdbServer('localhost', port=1000)
+        assert adb_server.probe() == 'device'
+        assert mock_easy_process.call_args.args[0] == 'adb -P 1000 get-state'
+        mock_easy_process.return_value.call.return_value.return_code = 1
+        assert adb_server.probe() is None
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_connect_not_ready_kills_server(self, mock_easy_process):
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        adb_server = AdbServer('localhost:7401', port=1000, ready_timeout=5)
+        with patch.object(adb_server, 'wait_ready', side_effect=AssertionError('not ready')):
+            with pytest.raises(AssertionError):
+                adb_server.connect()
+        assert not adb_server.connected
+        commands = [call.args[0] for call in mock_easy_process.call_args_list]
+        assert commands == ['adb -P 1000 connect localhost:7401', 'adb -P 1000 kill-server']
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_connect_waits_ready_and_reconnect(self, mock_easy_process):
+        mock_easy_process.return_value.call.return_value.stdout = 'connected to localhost:7401'
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        health = MagicMock()
+        adb_server = AdbServer('localhost:7401', port=1000, health=health, ready_timeout=5)
+        with patch.object(adb_server, 'wait_ready') as wait_ready:
+            adb_server.connect()
+            wait_ready.assert_called_once_with(5)
+            adb_server.reconnect(ready_timeout=3)
+            wait_ready.assert_called_with(3)
+            mock_easy_process.return_value.call.return_value.stdout = 'failed to connect to localhost:7401'
+            with pytest.raises(AssertionError):
+                adb_server.reconnect()
+        commands = [call.args[0] for call in mock_easy_process.call_args_list]
+        assert commands[1:3] == ['adb -P 1000 disconnect localhost:7401', 'adb -P 1000 connect localhost:7401']
+        assert [call.args[1:3] for call in health.record.call_args_list] == \
+               [('adb_connect', True), ('adb_reconnect', True), ('adb_reconnect', False)]
+        adb_server.connected = False
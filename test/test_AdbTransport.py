@@ -0,0 +1,255 @@
+import logging
+import socketserver
+import struct
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from stf_appium_client.AdbServer import AdbServer
+from stf_appium_client.AdbTransport import AdbTransport, AdbResult
+from stf_appium_client.exceptions import AdbProtocolError
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    """ Minimal adb server speaking host protocol """
+
+    def recv_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise EOFError()
+            data += chunk
+        return data
+
+    def read_service(self):
+        length = int(self.recv_exactly(4), 16)
+        return self.recv_exactly(length).decode()
+
+    def okay(self, payload: str = None):
+        self.request.sendall(b'OKAY')
+        if payload is not None:
+            self.request.sendall(b'%04x' % len(payload) + payload.encode())
+
+    def fail(self, message):
+        self.request.sendall(b'FAIL' + b'%04x' % len(message) + message.encode())
+
+    def handle(self):
+        adb = self.server.adb
+        try:
+            while True:
+                service = self.read_service()
+                adb.services.append(service)
+                if service == 'host:version':
+                    return self.okay('0029')
+                if service == 'host:devices':
+                    return self.okay('emulator-5554\tdevice\n')
+                if service.endswith(':features'):
+                    return self.okay('shell_v2,cmd' if adb.shell_v2 else 'cmd')
+                if service.endswith(':get-state'):
+                    return self.okay('device')
+                if service.startswith('host:transport'):
+                    if adb.offline:
+                        return self.fail('device offline')
+                    self.okay()
+                    continue
+                if service.startswith('shell,v2,raw:'):
+                    self.okay()
+                    return self.shell_v2(service.split(':', 1)[1])
+                if service.startswith('shell:'):
+                    self.okay()
+                    return self.request.sendall(b'out\n')
+                if service == 'sync:':
+                    adb.sync_sessions += 1
+                    self.okay()
+                    return self.sync()
+                return self.fail(f'unknown service {service}')
+        except EOFError:
+            pass
+
+    def shell_v2(self, command):
+        if command.startswith('exec logcat'):
+            for line in (b'line 1\n', b'line ', b'2\n'):
+                self.request.sendall(struct.pack('<BI', 1, len(line)) + line)
+            self.request.sendall(struct.pack('<BI', 3, 1) + b'\x00')
+        elif command == 'false':
+            self.request.sendall(struct.pack('<BI', 2, 4) + b'err\n' + struct.pack('<BI', 3, 1) + b'\x01')
+        else:
+            self.request.sendall(struct.pack('<BI', 1, 3) + b'out' + struct.pack('<BI', 1, 1) + b'\n'
+                                 + struct.pack('<BI', 3, 1) + b'\x00')
+
+    def sync(self):
+        files = self.server.adb.files
+        while True:
+            command, length = struct.unpack('<4sI', self.recv_exactly(8))
+            if command == b'QUIT':
+                return
+            path = self.recv_exactly(length).decode()
+            if command == b'STAT':
+                size = len(files[path]) if path in files else 0
+                mode = 0o100644 if path in files else 0
+                self.request.sendall(b'STAT' + struct.pack('<III', mode, size, 1000 if mode else 0))
+            elif command == b'RECV':
+                if path not in files:
+                    message = b'No such file or directory'
+                    self.request.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+                    continue
+                data = files[path]
+                for offset in range(0, len(data), 3):
+                    chunk = data[offset:offset + 3]
+                    self.request.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                self.request.sendall(b'DONE' + struct.pack('<I', 0))
+            elif command == b'SEND':
+                remote = path.rsplit(',', 1)[0]
+                data = b''
+                while True:
+                    command, length = struct.unpack('<4sI', self.recv_exactly(8))
+                    if command == b'DONE':
+                        break
+                    data += self.recv_exactly(length)
+                files[remote] = data
+                self.request.sendall(b'OKAY' + struct.pack('<I', 0))
+            elif command == b'LIST':
+                for name in ['.', '..'] + sorted(files):
+                    size = len(files.get(name, b''))
+                    self.request.sendall(b'DENT' + struct.pack('<IIII', 0o100644, size, 1000, len(name))
+                                         + name.encode())
+                self.request.sendall(b'DONE' + struct.pack('<IIII', 0, 0, 0, 0))
+
+
+class FakeAdb:
+
+    def __init__(self, shell_v2=True):
+        self.services = []
+        self.files = {}
+        self.sync_sessions = 0
+        self.shell_v2 = shell_v2
+        self.offline = False
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeAdbHandler)
+        self.server.daemon_threads = True
+        self.server.adb = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_adb():
+    adb = FakeAdb()
+    yield adb
+    adb.stop()
+
+
+class TestAdbTransport:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_host_services(self, fake_adb):
+        transport = AdbTransport(port=fake_adb.port, serial='emulator-5554')
+        assert transport.host('version') == '0029'
+        assert transport.execute('version').stdout == 'Android Debug Bridge version 1.0.41'
+        assert transport.execute('devices').stdout == 'emulator-5554\tdevice'
+        result = transport.execute('get-state')
+        assert (result.stdout, result.return_code) == ('device', 0)
+        assert 'host-serial:emulator-5554:get-state' in fake_adb.services
+
+    def test_shell_v2(self, fake_adb):
+        transport = AdbTransport(port=fake_adb.port, serial='emulator-5554')
+        result = transport.execute('shell echo out')
+        assert isinstance(result, AdbResult)
+        assert (result.stdout, result.stderr, result.return_code) == ('out', '', 0)
+        result = transport.shell('false')
+        assert (result.stdout, result.stderr, result.return_code) == ('', 'err', 1)
+        assert 'host:transport:emulator-5554' in fake_adb.services
+        assert 'shell,v2,raw:echo out' in fake_adb.services
+
+    def test_stream(self, fake_adb):
+        transport = AdbTransport(port=fake_adb.port, serial='emulator-5554')
+        assert list(transport.stream('exec logcat', chunk_size=4)) == [b'line', b' 1\n', b'line', b' ', b'2\n']
+
+    def test_shell_legacy(self):
+        adb = FakeAdb(shell_v2=False)
+        try:
+            result = AdbTransport(port=adb.port).shell('echo out')
+            assert (result.stdout, result.return_code) == ('out', 0)
+            assert 'host:transport-any' in adb.services
+            assert 'shell:echo out' in adb.services
+        finally:
+            adb.stop()
+
+    def test_failure(self, fake_adb):
+        fake_adb.offline = True
+        transport = AdbTransport(port=fake_adb.port, serial='emulator-5554')
+        with pytest.raises(AdbProtocolError, match='device offline'):
+            transport.shell('ls')
+        result = transport.execute('connect 10.0.0.1:5555')
+        assert result.return_code == 1
+        with pytest.raises(NotImplementedError):
+            transport.execute('install app.apk')
+
+    def test_sync_session_reused(self, fake_adb, tmp_path):
+        transport = AdbTransport(port=fake_adb.port, serial='emulator-5554')
+        local = tmp_path / 'local.txt'
+        local.write_bytes(b'hello world')
+        assert transport.push(str(local), '/sdcard/a.txt') == 11
+        assert fake_adb.files['/sdcard/a.txt'] == b'hello world'
+        assert transport.stat('/sdcard/a.txt') == (0o100644, 11, 1000)
+        assert transport.stat('/sdcard/missing') == (0, 0, 0)
+        chunks = []
+        assert transport.pull('/sdcard/a.txt', str(tmp_path / 'pulled.txt'), callback=chunks.append) == 11
+        assert (tmp_path / 'pulled.txt').read_bytes() == b'hello world'
+        assert len(chunks) == 4
+        assert transport.listdir('/sdcard') == [('/sdcard/a.txt', 0o100644, 11, 1000)]
+        assert fake_adb.sync_sessions == 1
+        with pytest.raises(AdbProtocolError, match='No such file'):
+            transport.pull('/sdcard/missing', str(tmp_path / 'missing.txt'))
+        transport.close()
+
+
+class TestAdbServerNative:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_native_execute(self, mock_easy_process, fake_adb):
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        adb = AdbServer('emulator-5554', port=fake_adb.port, native=True)
+        adb.connect()
+        assert mock_easy_process.call_count == 1
+        assert adb.execute('shell echo out').stdout == 'out'
+        assert mock_easy_process.call_count == 1
+        with pytest.raises(AssertionError):
+            adb.execute('shell false')
+        # not supported natively
+        adb.execute('install app.apk')
+        assert mock_easy_process.call_count == 2
+        assert list(adb.stream('logcat -v brief')) == ['line 1', 'line 2']
+        assert 'shell,v2,raw:exec logcat -v brief' in fake_adb.services
+        adb.connected = False
+
+    @patch('stf_appium_client.AdbServer.EasyProcess')
+    def test_native_fallback_when_unreachable(self, mock_easy_process):
+        mock_easy_process.return_value.call.return_value.return_code = 0
+        mock_easy_process.return_value.call.return_value.timeout_happened = False
+        adb = AdbServer('emulator-5554', port=1, native=True)
+        adb.connected = True
+        adb.execute('shell echo out')
+        assert mock_easy_process.call_count == 1
+        adb.connected = False
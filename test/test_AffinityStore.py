@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+
+from stf_appium_client.AffinityStore import AffinityStore
+
+
+class TestAffinityStore:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_remember_most_recent_first(self):
+        store = AffinityStore(max_serials=2)
+        store.remember('app', '1')
+        store.remember('app', '2')
+        store.remember('app', '1')
+        store.remember('other', '3')
+        assert store.preferred('app') == ['1', '2']
+        store.remember('app', '3')
+        assert store.preferred('app') == ['3', '1']
+        assert store.preferred('missing') == []
+
+    def test_order(self):
+        store = AffinityStore()
+        store.remember('app', '3')
+        store.remember('app', '1')
+        devices = [{'serial': str(i)} for i in range(5)]
+        assert [device['serial'] for device in store.order('app', devices)] == ['1', '3', '0', '2', '4']
+
+    def test_forget(self):
+        store = AffinityStore()
+        store.remember('app', '1')
+        store.remember('app', '2')
+        store.forget('app', '1')
+        assert store.preferred('app') == ['2']
+        store.forget('app')
+        assert store.preferred('app') == []
+
+    def test_persisted(self, tmp_path):
+        filename = str(tmp_path / 'affinity.json')
+        AffinityStore(filename).remember('app', '1')
+        AffinityStore(filename).remember('app', '2')
+        assert AffinityStore(filename).preferred('app') == ['2', '1']
+        with open(filename) as file:
+            assert json.load(file) == {'app': ['2', '1']}
+
+    def test_corrupted_file(self, tmp_path):
+        filename = str(tmp_path / 'affinity.json')
+        with open(filename, 'w') as file:
+            file.write('{not json')
+        store = AffinityStore(filename)
+        assert store.preferred('app') == []
+        store.remember('app', '1')
+        assert AffinityStore(filename).preferred('app') == ['1']
+        assert os.listdir(str(tmp_path)) == ['affinity.json']
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+from stf_appium_client.AsyncStfClient import AsyncStfClient
+from stf_appium_client.WaitStrategy import Backoff
+from stf_appium_client.exceptions import DeviceNotFound, CircuitOpenError
+
+
+class TestAsyncStfClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        for name in ['Configuration', 'ApiClient', 'UserApi', 'DevicesApi']:
+            patcher = patch(f'stf_appium_client.StfClient.{name}')
+            self.addCleanup(patcher.stop)
+            setattr(self, name, patcher.start())
+
+        class MockResp:
+            remote_connect_url = '123'
+        self.UserApi.return_value.remote_connect_user_device_by_serial = MagicMock(return_value=MockResp())
+
+        self.client = AsyncStfClient('localhost')
+        self.client.connect('token')
+        self.addCleanup(self.client.close)
+        self.addCleanup(self.client.client.leases.clear)
+
+    def test_allocate_release(self):
+        async def run():
+            device = await self.client.allocate({'serial': '123'})
+            url = await self.client.remote_connect(device)
+            await self.client.release(device)
+            return url
+        self.assertEqual(asyncio.run(run()), '123')
+        self.UserApi.return_value.add_user_device_v2.assert_called_once_with('123', timeout=900000)
+        self.UserApi.return_value.delete_user_device_by_serial.assert_called_once_with('123')
+
+    def test_allocation_context(self):
+        dev1 = {'serial': '123', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+        self.client.client.get_devices = MagicMock(return_value=[dev1])
+
+        async def run():
+            async with self.client.allocation_context({'serial': '123'}) as device:
+                self.assertEqual(device['remote_adb_url'], '123')
+                self.UserApi.return_value.delete_user_device_by_serial.assert_not_called()
+        asyncio.run(run())
+        self.UserApi.return_value.delete_user_device_by_serial.assert_called_once_with('123')
+
+    def test_concurrent_allocations(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(10)]
+        self.client.client.get_devices = MagicMock(return_value=devices)
+
+        async def run():
+            return await asyncio.gather(*[self.client.allocate(device) for device in devices])
+        allocated = asyncio.run(run())
+        self.assertEqual(len(allocated), 10)
+        self.assertEqual(self.UserApi.return_value.add_user_device_v2.call_count, 10)
+
+    def test_find_wait_and_allocate_timeout(self):
+        dev1 = {'serial': '123', 'present': True, 'ready': True, 'using': True, 'owner': None, 'status': 3}
+        self.client.client.get_devices = MagicMock(return_value=[dev1])
+
+        async def run():
+            await self.client.find_wait_and_allocate({}, wait_timeout=0.05,
+                                                     backoff=Backoff(initial=0.01, maximum=0.01))
+        with self.assertRaises(DeviceNotFound):
+            asyncio.run(run())
+
+    def test_find_wait_and_allocate_outage_backoff(self):
+        dev1 = {'serial': '123', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+        self.client.client.get_devices = MagicMock(return_value=[dev1])
+        self.client.client.find_and_allocate = MagicMock(side_effect=[CircuitOpenError('down'), dev1])
+
+        async def run():
+            return await self.client.find_wait_and_allocate({}, wait_timeout=1, affinity_key='suite',
+                                                            backoff=Backoff(initial=0.01, maximum=0.01))
+        self.assertEqual(asyncio.run(run()), dev1)
+        self.assertEqual(self.client.client.find_and_allocate.call_count, 2)
+        self.assertEqual(self.client.client.find_and_allocate.call_args.kwargs['affinity_key'], 'suite')
+
+    def test_find_wait_and_allocate_unexpected_error(self):
+        dev1 = {'serial': '123', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+        self.client.client.get_devices = MagicMock(return_value=[dev1])
+        self.client.client.find_and_allocate = MagicMock(side_effect=ValueError('bug'))
+
+        async def run():
+            await self.client.find_wait_and_allocate({}, wait_timeout=1)
+        with self.assertRaises(ValueError):
+            asyncio.run(run())
+
+    def test_aexit_does_not_block_event_loop(self):
+        event = threading.Event()
+        client = AsyncStfClient('localhost', max_workers=1)
+        client._executor.submit(event.wait, 5)
+
+        async def run():
+            async def ticker():
+                await asyncio.sleep(0.05)
+                event.set()
+            tick = asyncio.ensure_future(ticker())
+            async with client:
+                pass
+            await tick
+        asyncio.run(run())
+        self.assertTrue(event.is_set())
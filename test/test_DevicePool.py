@@ -0,0 +1,96 @@
+import logging
+import time
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from stf_appium_client.DevicePool import DevicePool
+from stf_appium_client.exceptions import DeviceNotFound
+
+
+def wait_until(condition, timeout=5):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, 'timeout'
+        time.sleep(0.01)
+
+
+class TestDevicePool:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    @pytest.fixture
+    def client(self):
+        client = MagicMock()
+        serials = iter(range(100))
+        client.find_wait_and_allocate.side_effect = lambda **kwargs: {'serial': str(next(serials))}
+        client.remote_connect.return_value = 'localhost:5555'
+        return client
+
+    @pytest.fixture(autouse=True)
+    def servers(self):
+        with patch('stf_appium_client.DevicePool.AdbServer') as adb, \
+                patch('stf_appium_client.DevicePool.AppiumServer') as appium:
+            appium.return_value.get_api_path.return_value = 'http://127.0.0.1:4723'
+            adb.return_value.probe.return_value = 'device'
+            yield adb, appium
+
+    def test_fill_and_lease(self, client, servers):
+        adb, appium = servers
+        with DevicePool(client, requirements={}, size=2) as pool:
+            wait_until(lambda: pool.available == 2)
+            with pool.lease(timeout=1) as member:
+                assert member.device['remote_adb_url'] == 'localhost:5555'
+                assert member.appium_uri == 'http://127.0.0.1:4723'
+                assert pool.available == 1
+            assert pool.available == 2
+            assert client.find_wait_and_allocate.call_count == 2
+            adb.return_value.connect.assert_called()
+            appium.return_value.start.assert_called()
+        assert client.release.call_count == 2
+
+    def test_retire_and_refill(self, client):
+        with DevicePool(client, requirements={}, size=1, max_uses=1, refill_interval=0.01) as pool:
+            member = pool.acquire(timeout=5)
+            pool.giveback(member)
+            client.release.assert_called_once_with(member.device)
+            wait_until(lambda: pool.available == 1)
+            assert pool.acquire(timeout=1).serial != member.serial
+
+    def test_unhealthy_device_is_retired(self, client):
+        with DevicePool(client, requirements={}, size=1, refill_interval=0.01) as pool:
+            with pytest.raises(RuntimeError):
+                with pool.lease(timeout=5):
+                    raise RuntimeError('test fails')
+            client.release.assert_called_once()
+
+    def test_acquire_timeout(self, client):
+        client.find_wait_and_allocate.side_effect = DeviceNotFound
+        with DevicePool(client, requirements={}, size=1) as pool:
+            with pytest.raises(DeviceNotFound):
+                pool.acquire(timeout=0.01)
+
+    def test_lost_allocation_is_retired(self, client):
+        client.renew.return_value = False
+        with DevicePool(client, requirements={}, size=1, refill_interval=0.01) as pool:
+            wait_until(lambda: pool.available == 1)
+            device, renew = client.heartbeat.add.call_args.args[0], client.heartbeat.add.call_args.kwargs['renew']
+            assert not renew(device)
+            member = pool.acquire(timeout=5)
+            assert member.device is not device
+            # lost device is not owned anymore, nothing to release
+            assert device not in [call.args[0] for call in client.release.call_args_list]
+
+    def test_unreachable_device_is_retired(self, client, servers):
+        adb, _ = servers
+        adb.return_value.probe.side_effect = ['offline', 'device']
+        with DevicePool(client, requirements={}, size=1, refill_interval=0.01) as pool:
+            member = pool.acquire(timeout=5)
+            assert member.serial == '1'
+            client.release.assert_called_once_with({'serial': '0', 'remote_adb_url': 'localhost:5555'})
@@ -0,0 +1,62 @@
+import pytest
+
+from stf_appium_client.DeviceQuery import DeviceQuery, DeviceIndex
+
+DEVICES = [
+    {'serial': '1', 'platform': 'Android', 'sdk': '28', 'version': '9', 'model': 'Pixel 3',
+     'owner': None, 'group': {'name': 'ci'}},
+    {'serial': '2', 'platform': 'Android', 'sdk': '30', 'version': '11', 'model': 'Pixel 5',
+     'owner': {'name': 'bob'}, 'group': {'name': 'ci'}},
+    {'serial': '3', 'platform': 'Android', 'sdk': '31', 'version': '12', 'model': 'SM-G991B',
+     'owner': None, 'group': {'name': 'lab'}},
+]
+
+
+def serials(devices):
+    return [device['serial'] for device in devices]
+
+
+class TestDeviceQuery:
+
+    def test_equality_from_dict(self):
+        query = DeviceQuery.create({'group': {'name': 'ci'}, 'owner': None})
+        assert serials(query.filter(DEVICES)) == ['1']
+        assert query.fields == ['group.name', 'owner']
+
+    def test_missing_key_does_not_match(self):
+        assert DeviceQuery.create({'note': None}).filter(DEVICES) == []
+
+    def test_range(self):
+        assert serials(DeviceQuery.parse('sdk>=30').filter(DEVICES)) == ['2', '3']
+        assert serials(DeviceQuery.parse('sdk<30').filter(DEVICES)) == ['1']
+        assert serials(DeviceQuery.parse('version>9').filter(DEVICES)) == ['2', '3']
+
+    def test_in(self):
+        assert serials(DeviceQuery.parse('version in [9, 12]').filter(DEVICES)) == ['1', '3']
+        assert serials(DeviceQuery.parse('version in ["11"]').filter(DEVICES)) == ['2']
+
+    def test_regex(self):
+        assert serials(DeviceQuery.parse('model~=^Pixel').filter(DEVICES)) == ['1', '2']
+
+    def test_combined(self):
+        query = DeviceQuery.parse('platform=Android & sdk>=29 & model~=^Pixel & group.name!=lab')
+        assert serials(query.filter(DEVICES)) == ['2']
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            DeviceQuery.parse('sdk')
+        with pytest.raises(ValueError):
+            DeviceQuery.parse('sdk>=')
+        with pytest.raises(ValueError):
+            DeviceQuery.parse('version in 9')
+        with pytest.raises(ValueError, match="invalid regex in 'model~=\\['"):
+            DeviceQuery.create('model~=[')
+
+    def test_index(self):
+        index = DeviceIndex(DEVICES)
+        query = DeviceQuery.create({'group': {'name': 'ci'}}).merge('sdk>=30')
+        assert serials(query.filter(DEVICES, index=index)) == ['2']
+        assert index.lookup(('group', 'name'), 'lab') == {2}
+        # unhashable attribute values are not indexed
+        assert index.lookup(('owner',), None) is None
+        assert serials(DeviceQuery.create({'owner': None}).filter(DEVICES, index=index)) == ['1', '3']
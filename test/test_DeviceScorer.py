@@ -0,0 +1,65 @@
+from unittest.mock import patch
+
+import pytest
+
+from stf_appium_client.DeviceScorer import DeviceScorer, AllocationFailures, ConnectLatency, \
+    ProviderLoad, BatteryHealth, ScoringFactor
+
+
+def serials(devices):
+    return [device['serial'] for device in devices]
+
+
+class TestDeviceScorer:
+
+    def test_incomplete_factor(self):
+        class Incomplete(ScoringFactor):
+            pass
+        with pytest.raises(TypeError):
+            Incomplete()
+
+    def test_allocation_failures_decay(self):
+        factor = AllocationFailures(half_life=10)
+        with patch('time.monotonic', return_value=100):
+            factor.record_allocation('1', False)
+            factor.record_allocation('1', False)
+            factor.record_allocation('2', False)
+            assert factor.scores([{'serial': '1'}, {'serial': '2'}, {'serial': '3'}]) == [1 / 3, 1 / 2, 1]
+        with patch('time.monotonic', return_value=110):
+            assert factor.scores([{'serial': '1'}]) == [1 / 2]
+        factor.record_allocation('1', True)
+        assert factor.scores([{'serial': '1'}]) == [1]
+
+    def test_connect_latency(self):
+        factor = ConnectLatency(reference=1, alpha=0.5)
+        factor.record_latency('1', 1)
+        factor.record_latency('1', 3)
+        assert factor.scores([{'serial': '1'}, {'serial': '2'}]) == [1 / 3, 1]
+
+    def test_provider_load(self):
+        devices = [{'serial': '1', 'provider': {'name': 'a'}},
+                   {'serial': '2', 'provider': {'name': 'b'}},
+                   {'serial': '3', 'provider': {'name': 'b'}}]
+        assert ProviderLoad().scores(devices) == [0.5, 1, 1]
+
+    def test_battery_health(self):
+        devices = [{'serial': '1', 'battery': {'level': 50, 'temp': 30}},
+                   {'serial': '2', 'battery': {'level': 100, 'temp': 45}},
+                   {'serial': '3'}]
+        assert BatteryHealth(max_temp=40).scores(devices) == [0.5, 0.5, 1]
+
+    def test_fields(self):
+        assert DeviceScorer().fields == ['battery.level', 'battery.temp', 'provider.name']
+
+    def test_rank(self):
+        scorer = DeviceScorer()
+        devices = [{'serial': str(i), 'battery': {'level': 100, 'temp': 30}} for i in range(4)]
+        devices[3]['battery']['level'] = 10
+        scorer.record_allocation('0', False)
+        scorer.record_latency('1', 2)
+        # 2: 3.0, 3: 2.55 (low battery), 0: 2.5 (failed), 1: 2.33 (slow)
+        assert serials(scorer.rank(devices)) == ['2', '3', '0', '1']
+
+    def test_rank_keeps_order_of_equals(self):
+        devices = [{'serial': str(i)} for i in range(5)]
+        assert serials(DeviceScorer().rank(devices)) == ['0', '1', '2', '3', '4']
@@ -0,0 +1,103 @@
+import logging
+import time
+
+import pytest
+from stf_client.exceptions import ForbiddenException
+
+from stf_appium_client.FakeStfServer import FakeStfServer, generate_devices, project
+from stf_appium_client.StfClient import StfClient
+from stf_appium_client.exceptions import DeviceNotFound
+
+
+class TestFakeStfServer:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    @pytest.fixture(autouse=True)
+    def track_clients(self):
+        self.clients = []
+        yield
+        for client in self.clients:
+            client.leases.clear()
+
+    @pytest.fixture
+    def server(self):
+        with FakeStfServer(devices=20) as server:
+            yield server
+
+    def client(self, server, token='token'):
+        client = StfClient(server.url)
+        client.connect(token=token)
+        self.clients.append(client)
+        return client
+
+    def test_generate_devices(self):
+        devices = generate_devices(5, seed=1)
+        assert [device['serial'] for device in devices] == [f'FAKE0000{i}' for i in range(5)]
+        assert devices == generate_devices(5, seed=1)
+
+    def test_project(self):
+        device = dict(serial='1', battery=dict(level=50, temp=30), model='x')
+        assert project(device, ['serial', 'battery.level', 'missing.key']) == \
+            dict(serial='1', battery=dict(level=50))
+        assert project(device, []) == device
+
+    def test_list_devices(self, server):
+        client = self.client(server)
+        devices = client.list_devices('sdk>=30')
+        assert devices
+        assert all(int(device['sdk']) >= 30 for device in devices)
+        assert len(client.list_devices({})) == 20
+
+    def test_allocate_remote_connect_release(self, server):
+        client = self.client(server)
+        device = client.find_and_allocate({})
+        assert server.devices[device['serial']]['owner']['name'] == 'token'
+        assert client.remote_connect(device).startswith('127.0.0.1:')
+        assert client.renew(device)
+        client.remote_disconnect(device)
+        client.release(device)
+        assert server.devices[device['serial']]['owner'] is None
+
+    def test_lease_kept_alive_by_activity(self, server):
+        client = self.client(server)
+        client.heartbeat.interval = 0.2
+        device = client.find_and_allocate({}, timeout_seconds=1)
+        client.keep_alive(device, activity=lambda item: server.touch(item['serial']))
+        time.sleep(1.6)
+        client.heartbeat.stop()
+        assert device in client.leases
+        assert server.devices[device['serial']]['owner']['name'] == 'token'
+        client.release(device)
+
+    def test_lease_expires_without_activity(self, server):
+        client = self.client(server)
+        client.heartbeat.interval = 0.2
+        device = client.find_and_allocate({}, timeout_seconds=1)
+        client.keep_alive(device)
+        time.sleep(1.6)
+        client.heartbeat.stop()
+        assert device not in client.leases
+        assert server.devices[device['serial']]['owner'] is None
+
+    def test_allocated_device_is_not_available_for_others(self, server):
+        first, second = self.client(server, 'first'), self.client(server, 'second')
+        device = first.find_and_allocate({})
+        with pytest.raises(ForbiddenException):
+            second.allocate(dict(serial=device['serial']))
+        assert len(second.list_devices({})) == 19
+        first.release(device)
+
+    def test_contention(self):
+        with FakeStfServer(devices=3, contention=1) as server:
+            with pytest.raises(DeviceNotFound):
+                self.client(server).find_and_allocate({})
+
+    def test_unauthorized(self, server):
+        assert server.handle('GET', '/api/v1/devices', {}, '')[0] == 401
@@ -0,0 +1,78 @@
+import logging
+import sqlite3
+from unittest.mock import patch
+
+from stf_appium_client.HealthStore import HealthStore
+
+
+class TestHealthStore:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_quarantine_after_consecutive_failures(self):
+        store = HealthStore(max_failures=2, quarantine_seconds=60)
+        store.record('1', 'allocate', False)
+        store.record('1', 'allocate', True)
+        store.record('1', 'remote_connect', False)
+        assert not store.is_quarantined('1')
+        store.record('1', 'adb_connect', False)
+        assert store.is_quarantined('1')
+        assert not store.is_quarantined('2')
+
+    def test_quarantine_expires(self):
+        store = HealthStore(max_failures=1, quarantine_seconds=60)
+        with patch('time.time', return_value=1000):
+            store.record('1', 'allocate', False)
+            assert store.quarantined() == {'1': 1060}
+        with patch('time.time', return_value=1061):
+            assert store.quarantined() == {}
+
+    def test_failures_outside_window_are_ignored(self):
+        store = HealthStore(max_failures=2, window=10, max_age=1e12)
+        with patch('time.time', return_value=1000):
+            store.record('1', 'allocate', False)
+        with patch('time.time', return_value=1020):
+            store.record('1', 'allocate', False)
+            assert not store.is_quarantined('1')
+
+    def test_release_quarantine(self):
+        store = HealthStore(max_failures=1)
+        store.record('1', 'allocate', False)
+        store.release_quarantine('1')
+        assert not store.is_quarantined('1')
+        assert store.stats('1') == {}
+
+    def test_stats(self):
+        store = HealthStore()
+        store.record('1', 'allocate', True, latency=1.0)
+        store.record('1', 'allocate', True, latency=3.0)
+        store.record('1', 'allocate', False, latency=10.0)
+        store.record('1', 'adb_connect', True, latency=0.5)
+        assert store.stats('1') == dict(allocate=dict(successes=2, failures=1, latency=2.0),
+                                        adb_connect=dict(successes=1, failures=0, latency=0.5))
+
+    def test_deprioritize_and_scores(self):
+        store = HealthStore(max_failures=2)
+        store.record('0', 'allocate', False)
+        store.record('0', 'allocate', False)
+        store.record('1', 'allocate', False)
+        devices = [{'serial': str(i)} for i in range(3)]
+        assert [device['serial'] for device in store.deprioritize(devices)] == ['1', '2', '0']
+        assert store.scores(devices) == [0.0, 0.5, 1.0]
+
+    def test_shared_between_instances(self, tmp_path):
+        filename = str(tmp_path / 'health' / 'devices.db')
+        HealthStore(filename, max_failures=1).record('1', 'allocate', False)
+        assert HealthStore(filename).is_quarantined('1')
+
+    def test_database_errors_are_not_raised(self, tmp_path):
+        store = HealthStore(str(tmp_path / 'devices.db'))
+        with patch('sqlite3.connect', side_effect=sqlite3.OperationalError('locked')):
+            store.record('1', 'allocate', False)
+            assert store.quarantined() == {}
@@ -0,0 +1,26 @@
+from unittest.mock import patch
+
+from stf_appium_client.InventoryCache import InventoryCache
+
+
+class TestInventoryCache:
+
+    def test_disabled(self):
+        cache = InventoryCache()
+        assert not cache.enabled
+
+    @patch('time.monotonic')
+    def test_expire(self, mock_time):
+        mock_time.return_value = 0
+        cache = InventoryCache(ttl=10)
+        cache.set('a', [1])
+        assert cache.get('a') == [1]
+        mock_time.return_value = 10
+        assert cache.get('a') is None
+        assert cache.stats() == dict(hits=1, misses=1, size=0)
+
+    def test_invalidate(self):
+        cache = InventoryCache(ttl=10)
+        cache.set('a', [1])
+        cache.invalidate()
+        assert cache.get('a') is None
@@ -0,0 +1,58 @@
+import logging
+import threading
+from unittest.mock import MagicMock
+
+from stf_appium_client.LeaseHeartbeat import LeaseHeartbeat
+
+
+class TestLeaseHeartbeat:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_beat_renews(self):
+        renew = MagicMock(return_value=True)
+        heartbeat = LeaseHeartbeat(renew=renew, interval=60)
+        heartbeat.add({'serial': '1'})
+        heartbeat.beat()
+        renew.assert_called_once_with({'serial': '1'})
+        heartbeat.remove({'serial': '1'})
+        heartbeat.beat()
+        renew.assert_called_once()
+        heartbeat.stop()
+
+    def test_lost(self):
+        on_lost = MagicMock()
+        heartbeat = LeaseHeartbeat(renew=MagicMock(return_value=False), interval=60, on_lost=on_lost)
+        heartbeat.add({'serial': '1'})
+        heartbeat.beat()
+        on_lost.assert_called_once_with({'serial': '1'})
+        assert len(heartbeat) == 0
+        heartbeat.stop()
+
+    def test_error_is_retried(self):
+        on_lost = MagicMock()
+        renew = MagicMock(side_effect=[IOError('timeout'), True])
+        heartbeat = LeaseHeartbeat(renew=renew, interval=60, on_lost=on_lost)
+        heartbeat.add({'serial': '1'})
+        heartbeat.beat()
+        heartbeat.beat()
+        assert renew.call_count == 2
+        on_lost.assert_not_called()
+        heartbeat.stop()
+
+    def test_background_thread(self):
+        event = threading.Event()
+
+        def renew(device):
+            event.set()
+            return True
+        heartbeat = LeaseHeartbeat(interval=0.01)
+        heartbeat.add({'serial': '1'}, renew=renew)
+        assert event.wait(5)
+        heartbeat.stop()
@@ -0,0 +1,105 @@
+import gc
+import logging
+import os
+import signal
+import threading
+import time
+import weakref
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from stf_appium_client.LeaseRegistry import LeaseRegistry, _HOLDING, _release_at_exit
+
+
+class TestLeaseRegistry:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    @pytest.fixture(autouse=True)
+    def forget_leases(self):
+        yield
+        for registry in list(_HOLDING):
+            registry.clear()
+
+    def test_add_remove(self):
+        registry = LeaseRegistry(release=MagicMock())
+        registry.add({'serial': '1'})
+        registry.add({'serial': '2'})
+        assert len(registry) == 2
+        assert {'serial': '1'} in registry
+        registry.remove({'serial': '1'})
+        assert registry.leases == [{'serial': '2'}]
+        registry.clear()
+
+    def test_release_all_concurrently(self):
+        registry = LeaseRegistry(release=None)
+        barrier = threading.Barrier(3, timeout=5)
+
+        def release(device):
+            # all releases need to be in flight at the same time
+            barrier.wait()
+            registry.remove(device)
+        registry._release = release
+        for serial in range(3):
+            registry.add({'serial': serial})
+        assert registry.release_all(timeout=10) == []
+        assert len(registry) == 0
+
+    def test_release_all_deadline(self):
+        event = threading.Event()
+        registry = LeaseRegistry(release=lambda device: event.wait(5))
+        registry.add({'serial': '1'})
+        start = time.monotonic()
+        assert registry.release_all(timeout=0.05) == [{'serial': '1'}]
+        assert time.monotonic() - start < 5
+        event.set()
+
+    def test_release_failure_is_logged(self):
+        release = MagicMock(side_effect=AssertionError('fail'))
+        registry = LeaseRegistry(release=release)
+        registry.add({'serial': '1'})
+        assert registry.release_all() == []
+        release.assert_called_once_with({'serial': '1'})
+
+    @pytest.mark.skipif(os.name == 'nt', reason='SIGTERM cannot be delivered to itself on windows')
+    def test_signal_handler(self):
+        previous = signal.getsignal(signal.SIGTERM)
+        release = MagicMock()
+        registry = LeaseRegistry(release=release)
+        registry.add({'serial': '1'})
+        try:
+            registry.install_signal_handler()
+            with pytest.raises(SystemExit):
+                os.kill(os.getpid(), signal.SIGTERM)
+                time.sleep(1)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        release.assert_called_once_with({'serial': '1'})
+
+    def test_registry_not_pinned(self):
+        registry = LeaseRegistry(release=MagicMock())
+        ref = weakref.ref(registry)
+        assert registry not in _HOLDING
+        del registry
+        gc.collect()
+        assert ref() is None
+
+    def test_exit_hook_releases_dropped_registry(self):
+        release = MagicMock()
+        with patch('stf_appium_client.LeaseRegistry._HOLDING', set()) as holding:
+            registry = LeaseRegistry(release=release)
+            registry.add({'serial': '1'})
+            assert registry in holding
+            del registry
+            gc.collect()
+            _release_at_exit()
+            release.assert_called_once_with({'serial': '1'})
+            holding.pop().clear()
+            assert not holding
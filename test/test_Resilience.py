@@ -0,0 +1,120 @@
+import logging
+from unittest.mock import MagicMock, patch
+
+import pytest
+import urllib3
+from stf_client.exceptions import ApiException, ServiceException, ForbiddenException, NotFoundException
+
+from stf_appium_client.Resilience import RetryPolicy, CircuitBreaker, is_transient, is_connect_error
+from stf_appium_client.WaitStrategy import Backoff
+from stf_appium_client.exceptions import CircuitOpenError
+
+
+class TestResilience:
+
+    @classmethod
+    def setup_class(cls):
+        logging.disable(logging.CRITICAL)
+
+    @classmethod
+    def teardown_class(cls):
+        logging.disable(logging.NOTSET)
+
+    def test_is_transient(self):
+        assert is_transient(ServiceException(status=500))
+        assert is_transient(ApiException(status=429))
+        assert is_transient(ApiException(status=0))
+        assert is_transient(urllib3.exceptions.MaxRetryError(None, '/'))
+        assert is_transient(ConnectionResetError())
+        assert not is_transient(ForbiddenException())
+        assert not is_transient(NotFoundException(status=404))
+        assert not is_transient(ApiException(status=400))
+        assert not is_transient(AssertionError())
+
+    @patch('time.sleep')
+    def test_retry_transient(self, mock_sleep):
+        policy = RetryPolicy(attempts=3, backoff=Backoff(initial=1, jitter=0))
+        func = MagicMock(side_effect=[ServiceException(status=503), ServiceException(status=503), 'ok'])
+        assert policy.call('test', func, 1, key=2) == 'ok'
+        func.assert_called_with(1, key=2)
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [1, 2]
+        assert policy.stats() == dict(retries=2, exhausted=0)
+
+    def test_is_connect_error(self):
+        refused = urllib3.exceptions.NewConnectionError(None, 'refused')
+        assert is_connect_error(refused)
+        assert is_connect_error(urllib3.exceptions.MaxRetryError(None, '/', reason=refused))
+        assert is_connect_error(ConnectionRefusedError())
+        assert not is_connect_error(urllib3.exceptions.ReadTimeoutError(None, '/', 'timed out'))
+        assert not is_connect_error(ServiceException(status=503))
+
+    @patch('time.sleep')
+    def test_retry_non_idempotent(self, mock_sleep):
+        policy = RetryPolicy(attempts=3)
+        func = MagicMock(side_effect=[ConnectionRefusedError(), 'ok'])
+        assert policy.call_non_idempotent('test', func) == 'ok'
+        func = MagicMock(side_effect=[ServiceException(status=503), 'ok'])
+        with pytest.raises(ServiceException):
+            policy.call_non_idempotent('test', func)
+        assert func.call_count == 1
+        assert policy.stats() == dict(retries=1, exhausted=0)
+
+    @patch('time.sleep')
+    def test_retry_exhausted(self, mock_sleep):
+        policy = RetryPolicy(attempts=2)
+        func = MagicMock(side_effect=ServiceException(status=503))
+        with pytest.raises(ServiceException):
+            policy.call('test', func)
+        assert func.call_count == 2
+        assert policy.stats() == dict(retries=1, exhausted=1)
+
+    @patch('time.sleep')
+    def test_no_retry(self, mock_sleep):
+        policy = RetryPolicy(attempts=3)
+        for error in [ForbiddenException(), CircuitOpenError('open', 1)]:
+            func = MagicMock(side_effect=error)
+            with pytest.raises(type(error)):
+                policy.call('test', func)
+            func.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    def test_circuit_opens_and_recovers(self):
+        circuit = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        failing = MagicMock(side_effect=ServiceException(status=503))
+        with patch('time.monotonic', return_value=100):
+            for _ in range(2):
+                with pytest.raises(ServiceException):
+                    circuit.call('test', failing)
+            assert circuit.state == CircuitBreaker.OPEN
+            with pytest.raises(CircuitOpenError) as error:
+                circuit.call('test', failing)
+            assert error.value.retry_after == 10
+            assert failing.call_count == 2
+        with patch('time.monotonic', return_value=111):
+            # trial call fails, circuit opens again
+            with pytest.raises(ServiceException):
+                circuit.call('test', failing)
+            assert circuit.state == CircuitBreaker.OPEN
+            assert circuit.retry_after() == 10
+        with patch('time.monotonic', return_value=122):
+            assert circuit.call('test', lambda: 'ok') == 'ok'
+        assert circuit.state == CircuitBreaker.CLOSED
+        assert circuit.stats() == dict(state='closed', calls=4, failures=3, rejected=1, opened=2)
+
+    def test_circuit_ignores_client_errors(self):
+        circuit = CircuitBreaker(failure_threshold=1)
+        with pytest.raises(ForbiddenException):
+            circuit.call('test', MagicMock(side_effect=ForbiddenException()))
+        assert circuit.state == CircuitBreaker.CLOSED
+
+    def test_half_open_allows_single_trial(self):
+        circuit = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        with pytest.raises(ServiceException):
+            circuit.call('test', MagicMock(side_effect=ServiceException(status=503)))
+
+        def trial():
+            with pytest.raises(CircuitOpenError):
+                circuit.call('test', lambda: 'concurrent')
+            return 'trial'
+        assert circuit.call('test', trial) == 'trial'
+        assert circuit.state == CircuitBreaker.CLOSED
@@ -1,12 +1,22 @@
 import unittest
 import logging
+import socket
+import threading
+import time
 import types
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, ANY
 
-from stf_client.exceptions import ForbiddenException
+from stf_client.exceptions import ForbiddenException, NotFoundException, ServiceException
+from urllib3.exceptions import NewConnectionError, ReadTimeoutError
 
 from stf_appium_client.StfClient import StfClient
 from stf_appium_client.exceptions import *
+from stf_appium_client.WaitStrategy import Backoff, DeviceNotifier
+from stf_appium_client.Timings import Timings
+from stf_appium_client.DeviceScorer import DeviceScorer
+from stf_appium_client.HealthStore import HealthStore
+from stf_appium_client.DeviceQuery import DeviceQuery
+from stf_appium_client.Resilience import RetryPolicy, CircuitBreaker
 
 
 class TestStfClientBasics(unittest.TestCase):
@@ -47,6 +57,20 @@ class TestStfClientBasics(unittest.TestCase):
         client.connect('mytoken')
         mock_client.assert_called_once()
 
+    @patch('stf_appium_client.StfClient.DevicesApi')
+    @patch('stf_appium_client.StfClient.UserApi')
+    def test_connect_pool_settings(self, mock_user_api, mock_devices_api):
+        client = StfClient('http://localhost')
+        client.connect('mytoken', pool_maxsize=32, retries=2)
+        configuration = client._configuration
+        self.assertEqual(configuration.connection_pool_maxsize, 32)
+        self.assertEqual(configuration.retries, 2)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), configuration.socket_options)
+        # API instances are created once
+        mock_user_api.assert_called_once()
+        mock_devices_api.assert_called_once()
+        self.assertEqual(client.connection_stats(), dict(pools=0, connections=0, requests=0, reused=0))
+
 
 class TestStfClient(unittest.TestCase):
 
@@ -79,6 +103,7 @@ class TestStfClient(unittest.TestCase):
 
         self.client = StfClient('localhost')
         self.client.connect('token')
+        self.addCleanup(self.client.leases.clear)
 
     def test_get_devices(self):
         class MockResp:
@@ -241,3 +266,448 @@ class TestStfClient(unittest.TestCase):
             with self.client.allocation_context({"serial": '123'}, wait_timeout=10):
                 pass
         self.assertEqual(str(error.exception), 'Suitable device not found within 10s timeout ({"serial": "123"})')
+
+    def test_get_devices_cached(self):
+        class MockResp:
+            devices = [{'serial': '123'}]
+        self.DevicesApi.return_value.get_devices = MagicMock(return_value=MockResp())
+        client = StfClient('localhost', cache_ttl=60)
+        client.connect('token')
+        self.assertEqual(client.get_devices(fields=[]), [{'serial': '123'}])
+        self.assertEqual(client.get_devices(fields=[]), [{'serial': '123'}])
+        self.DevicesApi.return_value.get_devices.assert_called_once()
+        self.assertEqual(client.cache.stats(), dict(hits=1, misses=1, size=1))
+
+    def test_cache_invalidated_on_allocate_and_release(self):
+        class MockResp:
+            devices = [{'serial': '123'}]
+        self.DevicesApi.return_value.get_devices = MagicMock(return_value=MockResp())
+        client = StfClient('localhost', cache_ttl=60)
+        client.connect('token')
+        self.addCleanup(client.leases.clear)
+        client.get_devices(fields=[])
+        device = client.allocate({'serial': '123'})
+        client.get_devices(fields=[])
+        client.release(device)
+        client.get_devices(fields=[])
+        self.assertEqual(self.DevicesApi.return_value.get_devices.call_count, 3)
+
+    def test_cache_disabled_by_default(self):
+        class MockResp:
+            devices = []
+        self.DevicesApi.return_value.get_devices = MagicMock(return_value=MockResp())
+        self.client.get_devices(fields=[])
+        self.client.get_devices(fields=[])
+        self.assertEqual(self.DevicesApi.return_value.get_devices.call_count, 2)
+        self.assertEqual(self.client.cache.stats(), dict(hits=0, misses=0, size=0))
+
+    def test_list_devices_expression(self):
+        dev1 = {'serial': '1', 'sdk': '28', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+        dev2 = {'serial': '2', 'sdk': '30', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+        self.client.get_devices = MagicMock(return_value=[dev1, dev2])
+        self.assertEqual(self.client.list_devices(requirements='sdk>=29'), [dev2])
+        fields = self.client.get_devices.call_args[1]['fields']
+        self.assertIn('sdk', fields)
+
+    def test_find_and_allocate_concurrent(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(5)]
+        self.client.get_devices = MagicMock(return_value=devices)
+        self.client.release = MagicMock()
+
+        def alloc(dev, timeout_seconds):
+            if dev['serial'] in ('0', '1'):
+                raise ForbiddenException
+            return dev
+        self.client.allocate = MagicMock(side_effect=alloc)
+
+        device = self.client.find_and_allocate({}, shuffle=False, concurrency=3)
+        self.assertEqual(device['serial'], '2')
+        # only first batch is tried
+        self.assertEqual(self.client.allocate.call_count, 3)
+
+    def test_find_and_allocate_concurrent_releases_extra(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(3)]
+        self.client.get_devices = MagicMock(return_value=devices)
+        self.client.allocate = MagicMock(side_effect=lambda dev, timeout_seconds: dev)
+        self.client.release = MagicMock()
+
+        device = self.client.find_and_allocate({}, concurrency=3)
+        self.assertIn(device, devices)
+        for _ in range(100):
+            if self.client.release.call_count == 2:
+                break
+            time.sleep(0.01)
+        released = [call.args[0] for call in self.client.release.call_args_list]
+        self.assertEqual(len(released), 2)
+        self.assertNotIn(device, released)
+
+    def test_find_and_allocate_concurrent_error_keeps_win(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(2)]
+        self.client.get_devices = MagicMock(return_value=devices)
+        self.client.retry = RetryPolicy(attempts=1)
+        self.client.release = MagicMock()
+        started = threading.Event()
+
+        def add_device(serial, timeout):
+            if serial == '0':
+                started.wait(1)
+                raise ServiceException(status=500)
+            started.set()
+            return MagicMock(success=True)
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(side_effect=add_device)
+        self.UserApi.return_value.get_user_device_by_serial = MagicMock(side_effect=NotFoundException)
+
+        device = self.client.find_and_allocate({}, shuffle=False, concurrency=2)
+        self.assertEqual(device['serial'], '1')
+        self.assertEqual([lease['serial'] for lease in self.client.leases.leases], ['1'])
+        self.client.release.assert_not_called()
+        self.client.leases.remove(device)
+
+        # nothing allocated, error is reported
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(side_effect=ServiceException(status=500))
+        with self.assertRaises(ServiceException):
+            self.client.find_and_allocate({}, shuffle=False, concurrency=2)
+
+    def test_find_and_allocate_affinity(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(5)]
+        self.client.get_devices = MagicMock(return_value=devices)
+        self.client.allocate = MagicMock(side_effect=lambda dev, timeout_seconds: dev)
+        self.client.affinity.remember('app', '3')
+
+        device = self.client.find_and_allocate({}, affinity_key='app')
+        self.assertEqual(device['serial'], '3')
+        self.client.allocate.assert_called_once()
+
+    def test_find_and_allocate_affinity_fallback(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(3)]
+        self.client.get_devices = MagicMock(return_value=devices)
+
+        def alloc(dev, timeout_seconds):
+            if dev['serial'] == '2':
+                raise ForbiddenException
+            return dev
+        self.client.allocate = MagicMock(side_effect=alloc)
+        self.client.affinity.remember('app', '2')
+        self.client.affinity.remember('app', 'gone')
+
+        device = self.client.find_and_allocate({}, shuffle=False, affinity_key='app')
+        self.assertEqual(device['serial'], '0')
+        self.assertEqual(self.client.affinity.preferred('app'), ['0', 'gone', '2'])
+
+    def test_find_and_allocate_scorer(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(3)]
+        self.client.scorer = DeviceScorer()
+        self.client.get_devices = MagicMock(return_value=devices)
+
+        def alloc(serial, timeout):
+            if serial == '0':
+                raise ForbiddenException
+            return MagicMock(success=True)
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(side_effect=alloc)
+
+        device = self.client.find_and_allocate({}, shuffle=False)
+        self.assertEqual(device['serial'], '1')
+        self.assertIn('provider.name', self.client.get_devices.call_args[1]['fields'])
+        self.client.release(device)
+        # device taken by someone else is not penalized
+        self.assertEqual(self.client.scorer.rank(devices), devices)
+        # device which failed is tried last on next round
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(side_effect=NotFoundException)
+        with self.assertRaises(NotFoundException):
+            self.client.allocate(devices[1])
+        self.assertEqual(self.client.scorer.rank(devices)[-1]['serial'], '1')
+
+    def test_find_and_allocate_skips_quarantined(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(2)]
+        self.client.health = HealthStore(max_failures=1)
+        self.client.get_devices = MagicMock(return_value=devices)
+        # contention does not quarantine devices
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(side_effect=ForbiddenException)
+        with self.assertRaises(DeviceNotFound):
+            self.client.find_and_allocate({}, shuffle=False)
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(return_value=MagicMock(success=False))
+        with self.assertRaises(DeviceNotFound):
+            self.client.find_and_allocate({}, shuffle=False)
+        self.assertEqual(self.client.health.quarantined(), {})
+
+        # failing remote connect does
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(return_value=MagicMock(success=True))
+        remote_connect = self.UserApi.return_value.remote_connect_user_device_by_serial
+        self.UserApi.return_value.remote_connect_user_device_by_serial = MagicMock(side_effect=NotFoundException)
+        device = self.client.find_and_allocate({}, shuffle=False)
+        self.assertEqual(device['serial'], '0')
+        with self.assertRaises(NotFoundException):
+            self.client.remote_connect(device)
+        self.client.release(device)
+        self.assertEqual(list(self.client.health.quarantined()), ['0'])
+
+        self.UserApi.return_value.remote_connect_user_device_by_serial = remote_connect
+        device = self.client.find_and_allocate({}, shuffle=False)
+        self.assertEqual(device['serial'], '1')
+        self.client.remote_connect(device)
+        self.assertEqual(self.client.health.stats('1')['remote_connect']['successes'], 1)
+        self.client.release(device)
+
+    @patch('time.sleep', side_effect=MagicMock())
+    def test_find_wait_and_allocate_compiles_requirements_once(self, mock_sleep):
+        devices = [{'serial': '1', 'sdk': '30', 'model': 'not-cached',
+                    'present': True, 'ready': True, 'using': True, 'owner': 'other', 'status': 3}]
+        self.client.get_devices = MagicMock(return_value=devices)
+        with patch('stf_appium_client.DeviceQuery.DeviceQuery.parse', wraps=DeviceQuery.parse) as mock_parse:
+            with self.assertRaises(DeviceNotFound):
+                self.client.find_wait_and_allocate('sdk>=29&model~=^not-cached', wait_timeout=0.01,
+                                                   backoff=Backoff(initial=0.001, jitter=0))
+        self.assertGreater(self.client.get_devices.call_count, 1)
+        mock_parse.assert_called_once()
+
+    @patch('time.sleep')
+    def test_allocate_retries_transient_failure(self, mock_sleep):
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(
+            side_effect=[NewConnectionError(None, 'refused'), MagicMock(success=True)])
+        self.client.health = HealthStore(max_failures=1)
+        device = self.client.allocate({'serial': '123'})
+        self.assertEqual(device['owner'], 'me')
+        self.assertEqual(self.client.api_stats()['retry'], dict(retries=1, exhausted=0))
+        # server failure is not device failure
+        self.assertEqual(self.client.health.stats('123')['allocate'], dict(successes=1, failures=0, latency=ANY))
+        self.client.release(device)
+
+    @patch('time.sleep')
+    def test_allocate_response_lost(self, mock_sleep):
+        # STF allocated device but response timed out, retry would get 403
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(
+            side_effect=[ReadTimeoutError(None, '/api/v1/user/devices', 'timed out'), ForbiddenException])
+        self.UserApi.return_value.get_user_device_by_serial.return_value.success = True
+        device = self.client.allocate({'serial': '123'})
+        self.assertIn(device, self.client.leases)
+        self.UserApi.return_value.add_user_device_v2.assert_called_once()
+        self.assertEqual(self.client.api_stats()['retry'], dict(retries=0, exhausted=0))
+
+        self.UserApi.return_value.delete_user_device_by_serial = MagicMock(side_effect=ServiceException(status=500))
+        self.UserApi.return_value.get_user_device_by_serial = MagicMock(side_effect=NotFoundException)
+        self.client.release(device)
+        self.assertEqual(len(self.client.leases), 0)
+        self.UserApi.return_value.delete_user_device_by_serial.assert_called_once()
+
+    @patch('time.sleep')
+    def test_allocate_failure_after_send_not_retried(self, mock_sleep):
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(side_effect=ServiceException(status=500))
+        self.UserApi.return_value.get_user_device_by_serial = MagicMock(side_effect=NotFoundException)
+        with self.assertRaises(ServiceException):
+            self.client.allocate({'serial': '123'})
+        self.UserApi.return_value.add_user_device_v2.assert_called_once()
+        self.assertEqual(len(self.client.leases), 0)
+
+    def test_find_wait_and_allocate_waits_circuit(self):
+        clock = [100.0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+        self.client.retry = RetryPolicy(attempts=1)
+        self.client.circuit = CircuitBreaker(failure_threshold=1, reset_timeout=5)
+        dev1 = {'serial': '1', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+        self.DevicesApi.return_value.get_devices = MagicMock(side_effect=[
+            MagicMock(devices=[dev1]), ServiceException(status=503), MagicMock(devices=[dev1])])
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(return_value=MagicMock(success=True))
+        with patch('time.monotonic', side_effect=lambda: clock[0]), \
+                patch('time.sleep', side_effect=sleep) as mock_sleep:
+            device = self.client.find_wait_and_allocate({}, wait_timeout=100,
+                                                        backoff=Backoff(initial=1, jitter=0))
+        self.assertEqual(device['serial'], '1')
+        # client waited for circuit reset timeout instead of normal backoff
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [5])
+        self.assertEqual(self.client.api_stats()['circuit']['opened'], 1)
+        self.client.release(device)
+
+    def test_find_and_allocate_concurrent_not_found(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(4)]
+        self.client.get_devices = MagicMock(return_value=devices)
+        self.client.allocate = MagicMock(side_effect=ForbiddenException)
+        with self.assertRaises(DeviceNotFound):
+            self.client.find_and_allocate({}, concurrency=3)
+        self.assertEqual(self.client.allocate.call_count, 4)
+
+    def test_allocate_many(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(5)]
+        self.client.get_devices = MagicMock(return_value=devices)
+
+        def alloc(dev, timeout_seconds):
+            if dev['serial'] == '0':
+                raise ForbiddenException
+            return dev
+        self.client.allocate = MagicMock(side_effect=alloc)
+
+        allocated = self.client.allocate_many({}, count=3, shuffle=False)
+        self.assertEqual(sorted(device['serial'] for device in allocated), ['1', '2', '3'])
+        self.assertEqual(self.client.allocate.call_count, 4)
+        self.assertEqual([device['remote_adb_url'] for device in allocated], ['123'] * 3)
+
+    @patch('time.sleep', side_effect=MagicMock())
+    def test_allocate_many_mixed_errors(self, mock_sleep):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(4)]
+        self.client.get_devices = MagicMock(return_value=devices)
+        self.client.retry = RetryPolicy(attempts=1)
+        failed = set()
+
+        def add_device(serial, timeout):
+            if serial == '0' and serial not in failed:
+                failed.add(serial)
+                raise ServiceException(status=500)
+            return MagicMock(success=True)
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(side_effect=add_device)
+        self.UserApi.return_value.delete_user_device_by_serial = MagicMock(return_value=MagicMock(success=True))
+
+        allocated = self.client.allocate_many({}, count=4, shuffle=False, concurrency=4)
+        self.assertEqual(sorted(device['serial'] for device in allocated), ['0', '1', '2', '3'])
+        self.client.release_many(allocated)
+        self.assertEqual(len(self.client.leases), 0)
+
+        # unexpected error: devices allocated by other attempts are released
+        self.UserApi.return_value.add_user_device_v2 = MagicMock(
+            side_effect=lambda serial, timeout: MagicMock(success=True) if serial != '0' else 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            self.client.allocate_many({}, count=4, shuffle=False, concurrency=4)
+        self.assertEqual(len(self.client.leases), 0)
+        self.assertEqual(self.UserApi.return_value.delete_user_device_by_serial.call_count, 7)
+
+        # failing rollback does not hide original error
+        self.UserApi.return_value.delete_user_device_by_serial = MagicMock(side_effect=ServiceException(status=500))
+        self.UserApi.return_value.get_user_device_by_serial = MagicMock(side_effect=ServiceException(status=500))
+        with self.assertRaises(ZeroDivisionError):
+            self.client.allocate_many({}, count=4, shuffle=False, concurrency=4)
+        self.client.leases.clear()
+
+    def test_allocate_many_not_enough_devices(self):
+        devices = [{'serial': '1', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}]
+        self.client.get_devices = MagicMock(return_value=devices)
+        with self.assertRaises(DeviceNotFound):
+            self.client.allocate_many({}, count=2)
+
+    @patch('time.sleep', side_effect=MagicMock())
+    def test_allocate_many_timeout_rollback(self, mock_sleep):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(3)]
+        self.client.get_devices = MagicMock(return_value=devices)
+
+        def alloc(dev, timeout_seconds):
+            if dev['serial'] != '0':
+                raise ForbiddenException
+            return dev
+        self.client.allocate = MagicMock(side_effect=alloc)
+        self.client.release = MagicMock()
+        with self.assertRaises(DeviceNotFound):
+            self.client.allocate_many({}, count=2, wait_timeout=0)
+        self.client.release.assert_called_once_with(devices[0])
+
+    def test_allocation_many_context(self):
+        devices = [{'serial': str(i), 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+                   for i in range(2)]
+        self.client.get_devices = MagicMock(return_value=devices)
+        self.client.allocate = MagicMock(side_effect=lambda dev, timeout_seconds: dev)
+        self.client.release = MagicMock()
+        with self.client.allocation_many_context({}, count=2) as allocated:
+            self.assertEqual(len(allocated), 2)
+            self.client.release.assert_not_called()
+        self.assertEqual(self.client.release.call_count, 2)
+
+    @patch('time.sleep', side_effect=MagicMock())
+    def test_find_wait_and_allocate_backoff(self, mock_sleep):
+        dev1 = {'serial': '123', 'present': True, 'ready': True, 'using': True, 'owner': None, 'status': 3}
+        dev2 = dict(dev1, using=False)
+        self.client.get_devices = MagicMock(side_effect=[[dev1], [dev1], [dev1], [dev1], [dev2]])
+        self.client.allocate = MagicMock()
+        backoff = Backoff(initial=1, maximum=3, jitter=0)
+        device = self.client.find_wait_and_allocate({}, wait_timeout=60, backoff=backoff)
+        self.assertEqual(device, dev2)
+        self.assertEqual([call.args[0] for call in mock_sleep.call_args_list], [1, 2, 3])
+
+    def test_find_wait_and_allocate_notifier(self):
+        dev1 = {'serial': '123', 'present': True, 'ready': True, 'using': True, 'owner': None, 'status': 3}
+        dev2 = dict(dev1, using=False)
+        self.client.notifier = DeviceNotifier()
+        self.client.get_devices = MagicMock(side_effect=[[dev1], [dev1], [dev2]])
+        self.client.allocate = MagicMock()
+        timer = threading.Timer(0.05, self.client.notifier.notify, args=[dev2])
+        timer.start()
+        start = time.monotonic()
+        device = self.client.find_wait_and_allocate({}, wait_timeout=60, backoff=Backoff(initial=30, maximum=30))
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(device, dev2)
+        timer.join()
+
+    def test_leases(self):
+        device = self.client.allocate({'serial': '123'})
+        self.assertIn(device, self.client.leases)
+        self.client.release(device)
+        self.assertEqual(len(self.client.leases), 0)
+
+    def test_renew(self):
+        activity = MagicMock()
+        self.UserApi.return_value.get_user_device_by_serial.return_value.success = True
+        self.assertTrue(self.client.renew({'serial': '123'}, activity=activity))
+        activity.assert_called_once_with({'serial': '123'})
+        # renewal must not try to allocate already owned device again
+        self.UserApi.return_value.add_user_device_v2.assert_not_called()
+
+    def test_renew_lost(self):
+        self.UserApi.return_value.get_user_device_by_serial.return_value.success = True
+        self.assertTrue(self.client.renew({'serial': '123'}, activity=MagicMock(side_effect=AssertionError)))
+        self.UserApi.return_value.get_user_device_by_serial = MagicMock(side_effect=NotFoundException)
+        self.assertFalse(self.client.renew({'serial': '123'}))
+
+    def test_allocation_context_heartbeat(self):
+        dev1 = {'serial': '123', 'present': True, 'ready': True, 'using': False, 'owner': None, 'status': 3}
+        self.client.get_devices = MagicMock(return_value=[dev1])
+        activity = MagicMock()
+        with self.client.allocation_context({"serial": '123'}, timeout_seconds=60, heartbeat=True,
+                                            activity=activity) as device:
+            self.assertEqual(len(self.client.heartbeat), 1)
+            self.client.heartbeat.beat()
+            activity.assert_called_once_with(device)
+            self.UserApi.return_value.get_user_device_by_serial.assert_called_with('123', fields='serial,owner')
+        self.assertEqual(len(self.client.heartbeat), 0)
+        self.client.heartbeat.stop()
+
+    def test_get_devices_fields_not_accumulated(self):
+        class MockResp:
+            devices = []
+        self.DevicesApi.return_value.get_devices = MagicMock(return_value=MockResp())
+        fields = ['battery']
+        self.client.get_devices(fields=fields)
+        self.client.get_devices(fields=fields)
+        self.assertEqual(fields, ['battery'])
+        calls = self.DevicesApi.return_value.get_devices.call_args_list
+        # explicit fields extend default fields
+        self.assertIn('battery', calls[0].kwargs['fields'].split(','))
+        self.assertIn('present', calls[0].kwargs['fields'].split(','))
+        self.assertEqual(calls[0].kwargs['fields'], calls[1].kwargs['fields'])
+        self.client.get_devices(fields=fields, exact=True)
+        self.assertEqual(calls[2].kwargs['fields'], 'battery,serial')
+        calls.clear()
+        self.client.get_devices()
+        self.client.get_devices()
+        self.assertEqual(calls[0].kwargs['fields'], calls[1].kwargs['fields'])
+
+    def test_list_devices_minimal_fields(self):
+        self.client.get_devices = MagicMock(return_value=[])
+        self.client.list_devices(requirements={'group': {'name': 'ci'}}, available_filter=False)
+        fields = self.client.get_devices.call_args.kwargs['fields']
+        self.assertIn('group.name', fields)
+        self.assertNotIn('note', fields)
+        self.assertNotIn('present', fields)
+
+    def test_timings(self):
+        self.client.timings = Timings()
+        device = self.client.allocate({'serial': '123'})
+        self.client.release(device)
+        self.assertEqual([span['name'] for span in self.client.timings.spans], ['stf.allocate', 'stf.release'])
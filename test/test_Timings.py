@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from stf_appium_client.Timings import Timings, timed
+
+
+class Timed:
+    def __init__(self, timings):
+        self.timings = timings
+
+    @timed('phase')
+    def run(self, fail=False):
+        if fail:
+            raise ValueError('fail')
+        return 1
+
+
+class TestTimings:
+
+    def test_span(self):
+        timings = Timings()
+        with timings.span('a', serial='123'):
+            pass
+        span = timings.spans[0]
+        assert span['name'] == 'a'
+        assert span['serial'] == '123'
+        assert span['duration'] >= 0
+        assert 'error' not in span
+
+    def test_timed(self):
+        timings = Timings()
+        obj = Timed(timings)
+        assert obj.run() == 1
+        with pytest.raises(ValueError):
+            obj.run(fail=True)
+        assert [span.get('error') for span in timings.spans] == [None, 'ValueError']
+        assert timings.summary()['phase']['count'] == 2
+
+    def test_summary_survives_span_limit(self):
+        timings = Timings(max_spans=2)
+        for duration in [1, 2, 3]:
+            timings.record('a', duration)
+        assert len(timings.spans) == 2
+        assert timings.summary() == dict(a=dict(count=3, total=6.0, min=1, max=3))
+
+    def test_dump(self, tmp_path):
+        timings = Timings()
+        timings.record('a', 1.0)
+        filename = tmp_path / 'timings.json'
+        timings.dump(str(filename))
+        data = json.loads(filename.read_text())
+        assert data['summary']['a']['count'] == 1
+        timings.clear()
+        assert timings.spans == []
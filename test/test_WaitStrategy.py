@@ -0,0 +1,45 @@
+import threading
+import time
+
+from stf_appium_client.WaitStrategy import Backoff, DeviceNotifier
+
+
+class TestBackoff:
+
+    def test_delays_without_jitter(self):
+        delays = Backoff(initial=1, maximum=5, factor=2, jitter=0).delays()
+        assert [next(delays) for _ in range(5)] == [1, 2, 4, 5, 5]
+
+    def test_delays_jitter_bounds(self):
+        delays = Backoff(initial=4, maximum=4, jitter=0.5).delays()
+        for _ in range(100):
+            assert 2 <= next(delays) <= 4
+
+
+class TestDeviceNotifier:
+
+    def test_timeout(self):
+        notifier = DeviceNotifier()
+        assert notifier.wait(0.01) is False
+
+    def test_wakeup_on_matching_device(self):
+        notifier = DeviceNotifier()
+
+        def notify():
+            time.sleep(0.05)
+            notifier.notify({'serial': 'other'})
+            time.sleep(0.05)
+            notifier.notify({'serial': 'mine'})
+        thread = threading.Thread(target=notify)
+        thread.start()
+        start = time.monotonic()
+        assert notifier.wait(5, predicate=lambda device: device['serial'] == 'mine')
+        assert time.monotonic() - start < 5
+        thread.join()
+
+    def test_non_matching_device_times_out(self):
+        notifier = DeviceNotifier()
+        timer = threading.Timer(0.01, notifier.notify, args=[{'serial': 'other'}])
+        timer.start()
+        assert notifier.wait(0.2, predicate=lambda device: device['serial'] == 'mine') is False
+        timer.join()
@@ -24,9 +24,34 @@ class TestAdbServer:
                 main()
         assert cm.value.code == 1
 
+    def test_host_invalid_requirements_regex(self, capsys):
+        testargs = ["prog", "--token", "123", "--host",
+                    "http://test", "--requirements", "model~=["]
+        with pytest.raises(SystemExit) as cm:
+            with patch.object(sys, 'argv', testargs):
+                main()
+        assert cm.value.code == 1
+        assert 'Invalid requirements: invalid regex' in capsys.readouterr().out
+
     @patch('shutil.which')
     def test_host_not_found(self, mock_which):
         testargs = ["prog", "--token", "123", "--host", "http://test"]
         with pytest.raises(urllib3.exceptions.MaxRetryError):
             with patch.object(sys, 'argv', testargs):
                 main()
+
+    @patch.dict('os.environ', {'CI': '1'})
+    @patch('stf_appium_client.cli.TIMINGS')
+    @patch('stf_appium_client.cli.StfClient')
+    @patch('atexit.register')
+    def test_timings_dumped_after_release(self, mock_register, mock_client, mock_timings):
+        order = []
+        mock_client.return_value.leases.release_all.side_effect = lambda **kwargs: order.append('release')
+        mock_timings.dump.side_effect = lambda filename: order.append(filename)
+        testargs = ["prog", "--token", "123", "--host", "http://test", "--list", "--timings", "timings.json"]
+        with pytest.raises(SystemExit):
+            with patch.object(sys, 'argv', testargs):
+                main()
+        dump_timings = mock_register.call_args.args[0]
+        dump_timings()
+        assert order == ['release', 'timings.json']
@@ -1,6 +1,10 @@
+import socket
+from contextlib import closing
 import json
 import pytest
-from stf_appium_client.tools import find_free_port, parse_requirements
+from stf_appium_client.tools import find_free_port, parse_requirements, compile_requirements, is_port_open, \
+    file_sha256
+from stf_appium_client.DeviceQuery import DeviceQuery
 
 
 class TestTools:
@@ -28,3 +32,42 @@ class TestTools:
             self.assertEqual(parse_requirements("key="), {})
         with pytest.raises(ValueError):
             self.assertEqual(parse_requirements("="), {})
+
+    def test_parse_requirements_nested_merge(self):
+        self.assertEqual(parse_requirements("a.b=1&a.c=2&d=3"), {"a": {"b": "1", "c": "2"}, "d": "3"})
+        self.assertEqual(parse_requirements("a.b.c=1&a.b.d=2"), {"a": {"b": {"c": "1", "d": "2"}}})
+
+    def test_compile_requirements(self):
+        device = {"sdk": 30, "group": {"name": "ci", "origin": "x"}, "model": "Pixel 5"}
+        query = compile_requirements("group.name=ci&group.origin=x&sdk>=29&model~=^Pixel")
+        assert query.matches(device)
+        assert not compile_requirements("sdk>30").matches(device)
+        assert compile_requirements('{"group": {"name": "ci"}}').matches(device)
+        assert compile_requirements({"sdk": 30}).matches(device)
+        assert compile_requirements(query) is query
+        assert compile_requirements("").clauses == []
+
+    def test_compile_requirements_cached(self):
+        assert compile_requirements("sdk>=29&model~=^Pixel") is compile_requirements("sdk>=29&model~=^Pixel")
+        assert DeviceQuery.create("sdk>=29&model~=^Pixel") is compile_requirements("sdk>=29&model~=^Pixel")
+
+    def test_compile_requirements_invalid(self):
+        for invalid in ["asdf", "key=", "=", "{bad json", "&", "version in 10"]:
+            with pytest.raises(ValueError):
+                compile_requirements(invalid)
+        with pytest.raises(ValueError):
+            compile_requirements(10)
+
+    def test_is_port_open(self):
+        with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen(1)
+            assert is_port_open(server.getsockname()[1])
+        assert not is_port_open(find_free_port())
+
+    def test_file_sha256(self, tmp_path):
+        path = tmp_path / 'file.bin'
+        path.write_bytes(b'abc')
+        assert file_sha256(str(path)) == 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'
+        path.write_bytes(b'abcd')
+        assert file_sha256(str(path)) == '88d4266fd4e6338d13b845fcf289579d209c897823b9217da3e161936f031589'